@@ -1,7 +1,15 @@
 import os
+import json
+import asyncio
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from openpyxl.utils.exceptions import InvalidFileException
-from excel_fucntion import *
+from file_locks import lock_table
+from analytics_ops import AGGREGATES, FILTER_OPS
+from directory_index import get_directory_index
+from op_journal import pending_journals
+from lazy_import import LazyModule
+from metrics import metrics
 from contextlib import asynccontextmanager
 from collections.abc import AsyncGenerator
 from mcp.server import Server
@@ -10,34 +18,77 @@ import mcp.types as types
 from mcp.server.lowlevel import NotificationOptions
 from mcp.server.models import InitializationOptions
 
+# openpyxl, NumPy and the Excel layer load after the handshake (see handle_list_tools).
+xl = LazyModule("excel_fucntion")
+pager = LazyModule("range_pager")
+analytics = LazyModule("range_analytics")
+diff = LazyModule("workbook_diff")
+search = LazyModule("cell_index")
+fanout = LazyModule("multi_file")
+export = LazyModule("sheet_export")
+cache = LazyModule("workbook_cache")
+
 load_dotenv()
 EXCEL_FILES_DIR = os.getenv("EXCEL_FILES_DIR", "./excel_files")
+# Worker threads running tool calls, and how many calls may be queued or running at once.
+EXCEL_WORKERS = int(os.getenv("EXCEL_WORKERS", "4"))
+EXCEL_MAX_PENDING = int(os.getenv("EXCEL_MAX_PENDING", "64"))
+# Seconds a client waits for a tool call before getting a timeout error (0 waits forever).
+EXCEL_REQUEST_TIMEOUT = float(os.getenv("EXCEL_REQUEST_TIMEOUT", "0"))
+# stdio (one client per process), or streamable-http / sse (many clients sharing this process).
+EXCEL_TRANSPORT = os.getenv("EXCEL_TRANSPORT", "stdio")
+EXCEL_HTTP_HOST = os.getenv("EXCEL_HTTP_HOST", "127.0.0.1")
+EXCEL_HTTP_PORT = int(os.getenv("EXCEL_HTTP_PORT", "8000"))
+
+_executor = ThreadPoolExecutor(max_workers=EXCEL_WORKERS, thread_name_prefix="excel-tool")
+_pending = 0
 
 @asynccontextmanager
 async def server_lifespan(server: Server) -> AsyncGenerator[dict, None]:
+    # Runs once per client session; process-wide state is torn down in _shutdown().
     os.makedirs(EXCEL_FILES_DIR, exist_ok=True)
     yield {"excel_dir": EXCEL_FILES_DIR}
 
+def _recover_journals():
+    """Replay operations logged before a crash; the Excel layer is only loaded if there are any."""
+    if pending_journals(EXCEL_FILES_DIR):
+        xl.recover_journals(EXCEL_FILES_DIR)
+
+def _shutdown():
+    """Finish running tool calls and write back cached workbooks."""
+    _executor.shutdown(wait=True)
+    if fanout.loaded:
+        fanout.close()
+    if cache.loaded:
+        cache.workbook_cache.close()
+
 server = Server("excel-advanced-server", lifespan=server_lifespan)
 
 @server.list_resources()
 async def handle_list_resources(name: str, arguments: dict | None) -> list[types.Resource]:
-    files = [f for f in os.listdir(EXCEL_FILES_DIR) if f.endswith(".xlsx") or f.endswith(".xlsm")]
+    files = get_directory_index(EXCEL_FILES_DIR).names()
     return [
         types.Resource(
             name=f"excel-file://{file}",
             description=f"Excel file: {file}",
             arguments=[]
         ) for file in files
+    ] + [
+        types.Resource(
+            name="excel-metrics://summary",
+            description="Per-tool latency histograms (load/op/save) and per-file I/O totals",
+            arguments=[]
+        )
     ]
 
 @server.read_resource()
 async def handle_get_resource(name: str, arguments: dict | None) -> types.ReadResourceResult:
     if name.startswith("excel-file://"):
+        from openpyxl.utils.exceptions import InvalidFileException
         filename = name.replace("excel-file://", "")
         path = os.path.join(EXCEL_FILES_DIR, filename)
         try:
-            sheets = list_sheets(path)
+            sheets = xl.list_sheets(path)
             return types.ReadResourceResult(
                 description=f"Sheets in {filename}",
                 content=types.TextContent(type="text", text="\n".join(sheets)),
@@ -49,31 +100,123 @@ async def handle_get_resource(name: str, arguments: dict | None) -> types.ReadRe
                 content=types.TextContent(type="text", text=str(e)),
                 mime_type="text/plain"
             )
+    if name in ("excel-metrics://summary", "excel-metrics://prometheus"):
+        if name.endswith("prometheus"):
+            text, mime_type = metrics.prometheus(), "text/plain"
+        else:
+            text, mime_type = json.dumps(metrics.snapshot()), "application/json"
+        return types.ReadResourceResult(
+            description="Tool call metrics",
+            content=types.TextContent(type="text", text=text),
+            mime_type=mime_type
+        )
     raise ValueError(f"Unknown resource: {name}")
 
+_FILTERS_SCHEMA = {
+    "type": "array",
+    "description": "Row conditions combined with AND",
+    "items": {
+        "type": "object",
+        "properties": {
+            "column": {"type": "string", "description": "Header name or column letter"},
+            "op": {"type": "string", "enum": list(FILTER_OPS)},
+            "value": {"description": "Value to compare with (a list for in/not_in)"}
+        },
+        "required": ["column", "op"]
+    }
+}
+
+_STYLES_SCHEMA = {
+    "type": "array",
+    "description": "Style map; later entries override earlier ones per attribute, attributes no entry sets are left as they are",
+    "items": {
+        "type": "object",
+        "properties": {
+            "range": {"type": "string", "description": "Target range (e.g. A1:D1)"},
+            "columns": {"type": "array", "items": {"type": "string"}, "description": "Target column letters"},
+            "rows": {"type": "array", "items": {"type": "integer"}, "description": "Target row numbers"},
+            "bold": {"type": "boolean"},
+            "italic": {"type": "boolean"},
+            "font_color": {"type": "string", "description": "Hex color (e.g. FF0000)"},
+            "bg_color": {"type": "string", "description": "Hex color (e.g. FFFF00)"},
+            "align": {"type": "string", "description": "Horizontal alignment"},
+            "border": {"type": "boolean", "description": "Thin border around each cell"},
+            "number_format": {"type": "string", "description": "Number format (e.g. 0.00%)"}
+        }
+    }
+}
+
+_warmed_up = False
+
+def _load_excel_layer():
+    xl.OPERATIONS, pager.read_range_page, analytics.aggregate_range
+
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
+    global _warmed_up
+    if not _warmed_up:
+        # The handshake is done: import the Excel layer while the client picks its first tool.
+        _warmed_up = True
+        asyncio.get_running_loop().run_in_executor(_executor, _load_excel_layer)
+    return _tool_definitions()
+
+@lru_cache(maxsize=1)
+def _tool_definitions() -> list[types.Tool]:
+    """The static tool list, built once."""
     return [
+        types.Tool(
+            name="list_excel_files",
+            description="List Excel files with size and modification time, page by page.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "prefix": {"type": "string", "description": "File name prefix filter"},
+                    "cursor": {"type": "string", "description": "next_cursor of the previous page"},
+                    "limit": {"type": "integer", "description": "Maximum number of files"},
+                    "include_sheets": {"type": "boolean", "description": "Include sheet names"}
+                },
+                "required": []
+            }
+        ),
         types.Tool(
             name="create_excel_file",
-            description="Create a new Excel file.",
+            description="Create a new Excel file, optionally bulk-loading rows in streaming mode.",
             inputSchema={
                 "type": "object",
                 "properties": {
                     "filename": {"type": "string", "description": "File name"},
-                    "sheet_name": {"type": "string", "description": "Sheet name"}
+                    "sheet_name": {"type": "string", "description": "Sheet name"},
+                    "data": {"type": "array", "description": "Optional rows (2D array) to fill the sheet with", "items": {"type": "array"}},
+                    "csv_path": {"type": "string", "description": "Optional CSV file (relative to the Excel directory)"},
+                    "ndjson_path": {"type": "string", "description": "Optional NDJSON file (relative to the Excel directory)"},
+                    "header": {"type": "array", "description": "Optional header row", "items": {"type": "string"}},
+                    "column_types": {
+                        "type": "array",
+                        "description": "Optional per-column types: str, int, float, bool, date, datetime, auto",
+                        "items": {"type": "string"}
+                    }
                 },
                 "required": ["filename"]
             }
         ),
         types.Tool(
             name="add_sheet",
-            description="Add a new sheet to an Excel file.",
+            description=("Add a new sheet to an Excel file, optionally filled with rows (at most EXCEL_APPEND_MAX_CELLS "
+                         "cells; use create_excel_file, which streams, for larger imports)."),
             inputSchema={
                 "type": "object",
                 "properties": {
                     "filename": {"type": "string", "description": "File name"},
-                    "sheet_name": {"type": "string", "description": "Sheet name"}
+                    "sheet_name": {"type": "string", "description": "Sheet name"},
+                    "data": {"type": "array", "description": "Optional rows (2D array) to fill the sheet with", "items": {"type": "array"}},
+                    "csv_path": {"type": "string", "description": "Optional CSV file (relative to the Excel directory)"},
+                    "ndjson_path": {"type": "string", "description": "Optional NDJSON file (relative to the Excel directory)"},
+                    "header": {"type": "array", "description": "Optional header row", "items": {"type": "string"}},
+                    "column_types": {
+                        "type": "array",
+                        "description": "Optional per-column types: str, int, float, bool, date, datetime, auto",
+                        "items": {"type": "string"}
+                    }
                 },
                 "required": ["filename", "sheet_name"]
             }
@@ -112,11 +255,31 @@ async def handle_list_tools() -> list[types.Tool]:
                     "filename": {"type": "string", "description": "File name"},
                     "sheet": {"type": "string", "description": "Sheet name"},
                     "cell": {"type": "string", "description": "Cell address"},
-                    "value": {"type": "string", "description": "Value to write"}
+                    "value": {"type": "string", "description": "Value to write"},
+                    "bold": {"type": "boolean"},
+                    "italic": {"type": "boolean"},
+                    "font_color": {"type": "string", "description": "Hex color (e.g. FF0000)"},
+                    "bg_color": {"type": "string", "description": "Hex color (e.g. FFFF00)"},
+                    "align": {"type": "string", "description": "Horizontal alignment"}
                 },
                 "required": ["filename", "sheet", "cell", "value"]
             }
         ),
+        types.Tool(
+            name="write_range",
+            description="Write a block of values and its formatting in one call; each distinct style is created once.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string", "description": "File name"},
+                    "sheet": {"type": "string", "description": "Sheet name"},
+                    "start_cell": {"type": "string", "description": "Top-left cell of the block"},
+                    "values": {"type": "array", "items": {"type": "array"}, "description": "Rows of values"},
+                    "styles": _STYLES_SCHEMA
+                },
+                "required": ["filename", "sheet", "start_cell", "values"]
+            }
+        ),
         types.Tool(
             name="read_cell",
             description="Read a value from a cell.",
@@ -125,7 +288,8 @@ async def handle_list_tools() -> list[types.Tool]:
                 "properties": {
                     "filename": {"type": "string", "description": "File name"},
                     "sheet": {"type": "string", "description": "Sheet name"},
-                    "cell": {"type": "string", "description": "Cell address"}
+                    "cell": {"type": "string", "description": "Cell address"},
+                    "computed": {"type": "boolean", "description": "Return formula results instead of formula text"}
                 },
                 "required": ["filename", "sheet", "cell"]
             }
@@ -204,7 +368,9 @@ async def handle_list_tools() -> list[types.Tool]:
                 "type": "object",
                 "properties": {
                     "filename": {"type": "string", "description": "File name"},
-                    "sheet": {"type": "string", "description": "Sheet name"}
+                    "sheet": {"type": "string", "description": "Sheet name"},
+                    "sample_rows": {"type": "integer", "description": "Measure only about this many evenly spaced rows"},
+                    "max_width": {"type": "number", "description": "Upper limit for a column width in characters"}
                 },
                 "required": ["filename", "sheet"]
             }
@@ -229,7 +395,23 @@ async def handle_list_tools() -> list[types.Tool]:
                 "properties": {
                     "filename": {"type": "string", "description": "File name"},
                     "sheet": {"type": "string", "description": "Sheet name"},
-                    "cell_range": {"type": "string", "description": "Cell range (e.g. A1:B2)"}
+                    "cell_range": {"type": "string", "description": "Cell range (e.g. A1:B2)"},
+                    "computed": {"type": "boolean", "description": "Return formula results instead of formula text"}
+                },
+                "required": ["filename", "sheet", "cell_range"]
+            }
+        ),
+        types.Tool(
+            name="read_range_page",
+            description="Read a large range page by page. Returns rows plus a next_cursor (null on the last page).",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string", "description": "File name"},
+                    "sheet": {"type": "string", "description": "Sheet name"},
+                    "cell_range": {"type": "string", "description": "Cell range (e.g. A1:Z200000 or A:Z)"},
+                    "page_size": {"type": "integer", "description": "Maximum rows per page (default 1000)"},
+                    "cursor": {"type": "string", "description": "next_cursor of the previous page"}
                 },
                 "required": ["filename", "sheet", "cell_range"]
             }
@@ -248,9 +430,60 @@ async def handle_list_tools() -> list[types.Tool]:
                 "required": ["filename", "sheet", "cell", "formula"]
             }
         ),
+        types.Tool(
+            name="aggregate_range",
+            description="Compute sum/mean/min/max/count over a range on the server, optionally filtered and grouped.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string", "description": "File name"},
+                    "sheet": {"type": "string", "description": "Sheet name"},
+                    "cell_range": {"type": "string", "description": "Table range, header row first (e.g. A1:F100000 or A:F)"},
+                    "aggregates": {
+                        "type": "array",
+                        "description": "Aggregates to compute (default: row count)",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "func": {"type": "string", "enum": list(AGGREGATES)},
+                                "column": {"type": "string", "description": "Header name or column letter"},
+                                "name": {"type": "string", "description": "Output name (default func_column)"}
+                            },
+                            "required": ["func"]
+                        }
+                    },
+                    "group_by": {"type": "array", "items": {"type": "string"}, "description": "Columns to group by"},
+                    "filters": _FILTERS_SCHEMA,
+                    "header": {"type": "boolean", "description": "First row holds column names (default true)"},
+                    "order_by": {"type": "string", "description": "Aggregate name to order groups by"},
+                    "descending": {"type": "boolean", "description": "Largest first (default true)"},
+                    "limit": {"type": "integer", "description": "Maximum number of groups"}
+                },
+                "required": ["filename", "sheet", "cell_range"]
+            }
+        ),
+        types.Tool(
+            name="query_range",
+            description="Return only the rows of a range matching the filters, optionally the top-k by a column.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string", "description": "File name"},
+                    "sheet": {"type": "string", "description": "Sheet name"},
+                    "cell_range": {"type": "string", "description": "Table range, header row first (e.g. A1:F100000 or A:F)"},
+                    "columns": {"type": "array", "items": {"type": "string"}, "description": "Columns to return"},
+                    "filters": _FILTERS_SCHEMA,
+                    "header": {"type": "boolean", "description": "First row holds column names (default true)"},
+                    "order_by": {"type": "string", "description": "Numeric column to pick the top rows by"},
+                    "descending": {"type": "boolean", "description": "Largest first (default false)"},
+                    "limit": {"type": "integer", "description": "Maximum number of rows"}
+                },
+                "required": ["filename", "sheet", "cell_range", "columns"]
+            }
+        ),
         types.Tool(
             name="save_as_new_file",
-            description="Save the Excel file as a new file.",
+            description="Save the Excel file as a new file (a byte-level copy).",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -259,65 +492,430 @@ async def handle_list_tools() -> list[types.Tool]:
                 },
                 "required": ["old_filename", "new_filename"]
             }
+        ),
+        types.Tool(
+            name="clone_from_template",
+            description=("Create a new Excel file from a template, applying cell edits by rewriting only the "
+                         "edited sheets; styles and all other parts of the template are kept."),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "template": {"type": "string", "description": "Template file name"},
+                    "new_filename": {"type": "string", "description": "File to create"},
+                    "edits": {
+                        "type": "array",
+                        "description": "Cell edits; a value starting with '=' is a formula",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "sheet": {"type": "string"},
+                                "cell": {"type": "string"},
+                                "value": {"type": ["string", "number", "boolean", "null"]}
+                            },
+                            "required": ["sheet", "cell"]
+                        }
+                    }
+                },
+                "required": ["template", "new_filename"]
+            }
+        ),
+        types.Tool(
+            name="multi_file_read",
+            description=("Read one range, or aggregate it, in every file matching a glob, parsing files in "
+                         "parallel worker processes. With a progress token, each file's result is also sent "
+                         "as a progress notification as soon as it is ready."),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "pattern": {"type": "string", "description": "Glob over the Excel directory, e.g. monthly_*.xlsx"},
+                    "sheet": {"type": "string", "description": "Sheet to read in every file"},
+                    "cell_range": {"type": "string", "description": "Range to read, or table to aggregate (header first)"},
+                    "aggregate": {
+                        "type": "object",
+                        "description": ("Run aggregate_range per file instead of returning values: aggregates, "
+                                        "group_by, filters, header, order_by, descending, limit")
+                    },
+                    "workers": {"type": "integer", "description": "Files parsed in parallel (default EXCEL_FANOUT_WORKERS)"},
+                    "timeout": {"type": "number", "description": "Seconds allowed per file (default EXCEL_FANOUT_FILE_TIMEOUT)"}
+                },
+                "required": ["pattern", "sheet", "cell_range"]
+            }
+        ),
+        types.Tool(
+            name="find_cells",
+            description=("Find the cells holding a value across all Excel files (or one file), using a "
+                         "persistent index kept in step with the files. Returns file, sheet, cell and value."),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Value, word or prefix (ignored for range)"},
+                    "mode": {"type": "string", "enum": ["exact", "token", "prefix", "range"],
+                             "description": "exact (whole value; numbers numerically), token (word in a text), "
+                                            "prefix, or range (numbers between min_value and max_value)"},
+                    "min_value": {"type": "number"},
+                    "max_value": {"type": "number"},
+                    "filename": {"type": "string", "description": "Only search this file"},
+                    "sheet": {"type": "string", "description": "Only search sheets with this name"},
+                    "limit": {"type": "integer", "description": "Maximum matches to return (default 100)"}
+                }
+            }
+        ),
+        types.Tool(
+            name="export_sheet",
+            description=("Stream a sheet (or range) into a CSV, NDJSON or Parquet file in fixed-size batches, "
+                         "keeping number, boolean and date types. Returns rows written and throughput."),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string"},
+                    "sheet": {"type": "string"},
+                    "output": {"type": "string", "description": "File to write, relative to the Excel files directory"},
+                    "format": {"type": "string", "enum": ["csv", "ndjson", "parquet"],
+                               "description": "Default: from the output extension (Parquet needs pyarrow)"},
+                    "cell_range": {"type": "string", "description": "Only export this range (default: the used range)"},
+                    "header": {"type": "boolean", "description": "Use the first row as column names (default true)"}
+                },
+                "required": ["filename", "sheet", "output"]
+            }
+        ),
+        types.Tool(
+            name="diff_workbooks",
+            description=("Compare two workbooks cell by cell (streamed): changed values and formulas, "
+                         "plus added/removed sheets."),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "old_filename": {"type": "string", "description": "Earlier version"},
+                    "new_filename": {"type": "string", "description": "Later version"},
+                    "sheets": {"type": "array", "items": {"type": "string"},
+                               "description": "Only compare these sheets (default: all sheets in both files)"},
+                    "max_changes": {"type": "integer", "description": "Maximum changed cells to list (default 1000)"}
+                },
+                "required": ["old_filename", "new_filename"]
+            }
+        ),
+        types.Tool(
+            name="batch_apply",
+            description=(
+                "Apply many operations to one Excel file with a single load and save. "
+                "All-or-nothing: if one operation fails nothing is saved."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string", "description": "File name"},
+                    "operations": {
+                        "type": "array",
+                        "description": "Ordered list of operations",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "op": {
+                                    "type": "string",
+                                    "enum": [
+                                        "write_cell", "write_formula", "write_row", "write_column", "write_range",
+                                        "merge_cells", "unmerge_cells", "set_border", "set_style",
+                                        "add_sheet", "rename_sheet", "delete_sheet"
+                                    ],
+                                    "description": "Operation name; remaining keys are its arguments"
+                                },
+                                "sheet": {"type": "string", "description": "Sheet name"},
+                                "cell": {"type": "string", "description": "Cell address"},
+                                "cell_range": {"type": "string", "description": "Cell range (e.g. A1:B2)"},
+                                "start_cell": {"type": "string", "description": "Start cell address"},
+                                "value": {"description": "Value to write"},
+                                "formula": {"type": "string", "description": "Formula string (without =)"},
+                                "data": {"type": "array", "description": "List of values"},
+                                "values": {"type": "array", "description": "Rows of values (write_range)"},
+                                "styles": _STYLES_SCHEMA,
+                                "bold": {"type": "boolean"},
+                                "italic": {"type": "boolean"},
+                                "font_color": {"type": "string", "description": "Hex color (e.g. FF0000)"},
+                                "bg_color": {"type": "string", "description": "Hex color (e.g. FFFF00)"},
+                                "align": {"type": "string", "description": "Horizontal alignment"},
+                                "sheet_name": {"type": "string", "description": "Sheet name"},
+                                "old_name": {"type": "string", "description": "Old sheet name"},
+                                "new_name": {"type": "string", "description": "New sheet name"}
+                            },
+                            "required": ["op"]
+                        }
+                    }
+                },
+                "required": ["filename", "operations"]
+            }
+        ),
+        types.Tool(
+            name="flush_workbooks",
+            description="Write pending in-memory changes of cached workbooks to disk.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string", "description": "File name (omit to flush all)"}
+                },
+                "required": []
+            }
+        ),
+        types.Tool(
+            name="undo_operations",
+            description=("Undo the last operations on a file that are still in its journal "
+                         "(EXCEL_JOURNAL mode; operations already folded into the file cannot be undone)."),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "filename": {"type": "string"},
+                    "count": {"type": "integer", "description": "Most recent operations to undo (default 1)"}
+                },
+                "required": ["filename"]
+            }
         )
     ]
 
+def _import_args(arguments: dict) -> tuple:
+    """Bulk-import arguments of create_excel_file/add_sheet, with source files resolved in EXCEL_FILES_DIR."""
+    def source(key):
+        return os.path.join(EXCEL_FILES_DIR, arguments[key]) if arguments.get(key) else None
+    return (arguments.get("data"), source("csv_path"), source("ndjson_path"),
+            arguments.get("header"), arguments.get("column_types"))
+
+# Tools that never modify their file; everything else takes the file's write lock.
+READ_TOOLS = {"read_cell", "read_range", "read_range_page", "get_used_range", "aggregate_range", "query_range",
+              "diff_workbooks", "find_cells", "multi_file_read", "export_sheet"}
+
+def _tool_locks(name: str, arguments: dict) -> list[tuple[str, str]]:
+    """The (path, mode) locks a tool call needs."""
+    if name == "clone_from_template":
+        return [(os.path.join(EXCEL_FILES_DIR, arguments["template"]), "read"),
+                (os.path.join(EXCEL_FILES_DIR, arguments["new_filename"]), "write")]
+    if name in ("save_as_new_file", "diff_workbooks"):
+        return [(os.path.join(EXCEL_FILES_DIR, arguments["old_filename"]), "read"),
+                (os.path.join(EXCEL_FILES_DIR, arguments["new_filename"]), "read" if name in READ_TOOLS else "write")]
+    if not arguments.get("filename"):
+        return []
+    return [(os.path.join(EXCEL_FILES_DIR, arguments["filename"]), "read" if name in READ_TOOLS else "write")]
+
+def _run_tool(name: str, arguments: dict, progress=None) -> str:
+    with metrics.tool_call(name, arguments.get("filename") or arguments.get("old_filename")):
+        with lock_table.locked(_tool_locks(name, arguments)):
+            return _dispatch_tool(name, arguments, progress)
+
+def _progress_reporter():
+    """Callback sending partial results as progress notifications, or None if the client sent no progress token."""
+    ctx = server.request_context
+    token = ctx.meta.progressToken if ctx.meta else None
+    if token is None:
+        return None
+    loop = asyncio.get_running_loop()
+    count = 0
+
+    def report(item: dict):
+        # called on a worker thread; the notification is sent from the event loop
+        nonlocal count
+        count += 1
+        asyncio.run_coroutine_threadsafe(ctx.session.send_progress_notification(
+            token, count, message=json.dumps(item, default=str), related_request_id=ctx.request_id), loop)
+    return report
+
+def _call_finished(future):
+    global _pending
+    _pending -= 1
+
 @server.call_tool()
 async def handle_call_tool(name: str, arguments: dict) -> list[types.TextContent]:
+    """Run the blocking tool on the worker pool so the event loop keeps serving other requests."""
+    global _pending
+    if _pending >= EXCEL_MAX_PENDING:
+        return [types.TextContent(type="text", text=f"Server busy: {_pending} requests pending, try again later")]
+    _pending += 1
+    progress = _progress_reporter() if name == "multi_file_read" else None
+    future = asyncio.get_running_loop().run_in_executor(_executor, _run_tool, name, arguments, progress)
+    # The slot is released when the worker finishes, even if the client stopped waiting.
+    future.add_done_callback(_call_finished)
+    try:
+        result = await asyncio.wait_for(asyncio.shield(future), EXCEL_REQUEST_TIMEOUT or None)
+    except asyncio.TimeoutError:
+        return [types.TextContent(type="text", text=f"Timed out after {EXCEL_REQUEST_TIMEOUT:g}s: {name} is still "
+                                                    "running and its changes may still be applied")]
+    return [types.TextContent(type="text", text=str(result))]
+
+def _dispatch_tool(name: str, arguments: dict, progress=None) -> str:
     path = os.path.join(EXCEL_FILES_DIR, arguments.get("filename", ""))
-    if name == "create_excel_file":
-        result = create_excel_file(path, arguments.get("sheet_name", "Sheet1"))
+    if name == "list_excel_files":
+        listing = get_directory_index(EXCEL_FILES_DIR).list(arguments.get("prefix", ""), arguments.get("cursor"),
+                                                             arguments.get("limit"), arguments.get("include_sheets", False))
+        result = json.dumps(listing)
+    elif name == "create_excel_file":
+        result = xl.create_excel_file(path, arguments.get("sheet_name", "Sheet1"), *_import_args(arguments))
     elif name == "add_sheet":
-        result = add_sheet(path, arguments["sheet_name"])
+        result = xl.add_sheet(path, arguments["sheet_name"], *_import_args(arguments))
     elif name == "rename_sheet":
-        result = rename_sheet(path, arguments["old_name"], arguments["new_name"])
+        result = xl.rename_sheet(path, arguments["old_name"], arguments["new_name"])
     elif name == "delete_sheet":
-        result = delete_sheet(path, arguments["sheet_name"])
+        result = xl.delete_sheet(path, arguments["sheet_name"])
     elif name == "write_cell":
-        result = write_cell(path, arguments["sheet"], arguments["cell"], arguments["value"])
+        result = xl.write_cell(path, arguments["sheet"], arguments["cell"], arguments["value"],
+                               arguments.get("bold", False), arguments.get("italic", False),
+                               arguments.get("font_color", "000000"), arguments.get("bg_color"),
+                               arguments.get("align", "left"))
+    elif name == "write_range":
+        result = xl.write_range(path, arguments["sheet"], arguments["start_cell"], arguments["values"],
+                                arguments.get("styles"))
     elif name == "read_cell":
-        result = str(read_cell(path, arguments["sheet"], arguments["cell"]))
+        result = str(xl.read_cell(path, arguments["sheet"], arguments["cell"], arguments.get("computed", False)))
     elif name == "merge_cells":
-        result = merge_cells(path, arguments["sheet"], arguments["cell_range"])
+        result = xl.merge_cells(path, arguments["sheet"], arguments["cell_range"])
     elif name == "unmerge_cells":
-        result = unmerge_cells(path, arguments["sheet"], arguments["cell_range"])
+        result = xl.unmerge_cells(path, arguments["sheet"], arguments["cell_range"])
     elif name == "write_row":
-        result = write_row(path, arguments["sheet"], arguments["start_cell"], arguments["data"])
+        result = xl.write_row(path, arguments["sheet"], arguments["start_cell"], arguments["data"])
     elif name == "write_column":
-        result = write_column(path, arguments["sheet"], arguments["start_cell"], arguments["data"])
+        result = xl.write_column(path, arguments["sheet"], arguments["start_cell"], arguments["data"])
     elif name == "set_border":
-        result = set_border(path, arguments["sheet"], arguments["cell_range"])
+        result = xl.set_border(path, arguments["sheet"], arguments["cell_range"])
     elif name == "auto_fit_columns":
-        result = auto_fit_columns(path, arguments["sheet"])
+        result = xl.auto_fit_columns(path, arguments["sheet"], arguments.get("sample_rows"), arguments.get("max_width"))
     elif name == "get_used_range":
-        result = str(get_used_range(path, arguments["sheet"]))
+        result = str(xl.get_used_range(path, arguments["sheet"]))
     elif name == "read_range":
-        result = str(read_range(path, arguments["sheet"], arguments["cell_range"]))
+        result = str(xl.read_range(path, arguments["sheet"], arguments["cell_range"], arguments.get("computed", False)))
+    elif name == "read_range_page":
+        page = pager.read_range_page(path, arguments["sheet"], arguments["cell_range"],
+                                     arguments.get("page_size", 1000), arguments.get("cursor"))
+        result = json.dumps(page, default=str)
+    elif name == "aggregate_range":
+        summary = analytics.aggregate_range(path, arguments["sheet"], arguments["cell_range"], arguments.get("aggregates"),
+                                            arguments.get("group_by"), arguments.get("filters"), arguments.get("header", True),
+                                            arguments.get("order_by"), arguments.get("descending", True), arguments.get("limit"))
+        result = json.dumps(summary, default=str)
+    elif name == "query_range":
+        rows = analytics.query_range(path, arguments["sheet"], arguments["cell_range"], arguments["columns"],
+                                     arguments.get("filters"), arguments.get("header", True), arguments.get("order_by"),
+                                     arguments.get("descending", False), arguments.get("limit"))
+        result = json.dumps(rows, default=str)
     elif name == "write_formula":
-        result = write_formula(path, arguments["sheet"], arguments["cell"], arguments["formula"])
+        result = xl.write_formula(path, arguments["sheet"], arguments["cell"], arguments["formula"])
     elif name == "save_as_new_file":
         old_path = os.path.join(EXCEL_FILES_DIR, arguments["old_filename"])
         new_path = os.path.join(EXCEL_FILES_DIR, arguments["new_filename"])
-        result = save_as_new_file(old_path, new_path)
+        result = xl.save_as_new_file(old_path, new_path)
+    elif name == "clone_from_template":
+        result = xl.clone_from_template(os.path.join(EXCEL_FILES_DIR, arguments["template"]),
+                                        os.path.join(EXCEL_FILES_DIR, arguments["new_filename"]),
+                                        arguments.get("edits"))
+    elif name == "multi_file_read":
+        results = fanout.multi_file_read(EXCEL_FILES_DIR, arguments["pattern"], arguments["sheet"],
+                                         arguments["cell_range"], arguments.get("aggregate"),
+                                         arguments.get("workers"), arguments.get("timeout"), progress)
+        result = json.dumps(results, default=str)
+    elif name == "find_cells":
+        found = search.get_cell_index(EXCEL_FILES_DIR).find(
+            arguments.get("query", ""), arguments.get("mode", "exact"), arguments.get("min_value"),
+            arguments.get("max_value"), arguments.get("filename"), arguments.get("sheet"), arguments.get("limit"))
+        result = json.dumps(found, default=str)
+    elif name == "export_sheet":
+        exported = export.export_sheet(path, arguments["sheet"], os.path.join(EXCEL_FILES_DIR, arguments["output"]),
+                                       arguments.get("format"), arguments.get("cell_range"),
+                                       arguments.get("header", True))
+        result = json.dumps(exported, default=str)
+    elif name == "diff_workbooks":
+        changes = diff.diff_workbooks(os.path.join(EXCEL_FILES_DIR, arguments["old_filename"]),
+                                      os.path.join(EXCEL_FILES_DIR, arguments["new_filename"]),
+                                      arguments.get("sheets"), arguments.get("max_changes"))
+        result = json.dumps(changes, default=str)
+    elif name == "batch_apply":
+        result = json.dumps(xl.batch_apply(path, arguments["operations"]), default=str)
+    elif name == "flush_workbooks":
+        result = xl.flush_excel_file(path if arguments.get("filename") else None)
+    elif name == "undo_operations":
+        result = xl.undo_operations(path, arguments.get("count", 1))
     else:
         result = f"Unknown tool: {name}"
-    return [types.TextContent(type="text", text=str(result))]
+    return result
+
+def _initialization_options() -> InitializationOptions:
+    return InitializationOptions(
+        server_name="excel-advanced-server",
+        server_version="0.1.0",
+        capabilities=server.get_capabilities(
+            notification_options=NotificationOptions(),
+            experimental_capabilities={},
+        ),
+    )
 
 async def run():
-    async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="excel-advanced-server",
-                server_version="0.1.0",
-                capabilities=server.get_capabilities(
-                    notification_options=NotificationOptions(),
-                    experimental_capabilities={},
-                ),
-            ),
+    _recover_journals()
+    try:
+        async with mcp.server.stdio.stdio_server() as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, _initialization_options())
+    finally:
+        _shutdown()
+
+# ---------- HTTP TRANSPORTS ----------
+
+class _StreamableHTTPApp:
+    def __init__(self, manager):
+        self.manager = manager
+
+    async def __call__(self, scope, receive, send):
+        await self.manager.handle_request(scope, receive, send)
+
+def create_http_app(transport: str = "streamable-http", host: str = EXCEL_HTTP_HOST):
+    """Starlette app serving every client from this process: streamable HTTP on /mcp, or SSE on /sse.
+
+    All sessions share the workbook cache, lock table, directory index and
+    worker pool; these are torn down when the app shuts down.
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.routing import Mount, Route
+    from mcp.server.transport_security import TransportSecuritySettings
+
+    security = None
+    if host in ("127.0.0.1", "localhost", "::1"):
+        # Bound to loopback: reject other Host/Origin headers (DNS rebinding protection).
+        security = TransportSecuritySettings(
+            enable_dns_rebinding_protection=True,
+            allowed_hosts=["127.0.0.1:*", "localhost:*", "[::1]:*"],
+            allowed_origins=["http://127.0.0.1:*", "http://localhost:*", "http://[::1]:*"],
         )
+    if transport == "sse":
+        from mcp.server.sse import SseServerTransport
+        sse = SseServerTransport("/messages/", security_settings=security)
+
+        async def handle_sse(request):
+            async with sse.connect_sse(request.scope, request.receive, request._send) as (read_stream, write_stream):
+                await server.run(read_stream, write_stream, _initialization_options())
+            return Response()
+
+        routes = [Route("/sse", endpoint=handle_sse, methods=["GET"]),
+                  Mount("/messages/", app=sse.handle_post_message)]
+        manager = None
+    elif transport == "streamable-http":
+        from mcp.server.streamable_http_manager import StreamableHTTPSessionManager
+        manager = StreamableHTTPSessionManager(app=server, security_settings=security)
+        routes = [Route("/mcp", endpoint=_StreamableHTTPApp(manager))]
+    else:
+        raise ValueError(f"Unknown HTTP transport: {transport}")
+
+    @asynccontextmanager
+    async def lifespan(app):
+        _recover_journals()
+        try:
+            if manager is None:
+                yield
+            else:
+                async with manager.run():
+                    yield
+        finally:
+            _shutdown()
+
+    return Starlette(routes=routes, lifespan=lifespan)
+
+def run_http(transport: str = EXCEL_TRANSPORT, host: str = EXCEL_HTTP_HOST, port: int = EXCEL_HTTP_PORT):
+    import uvicorn
+    uvicorn.run(create_http_app(transport, host), host=host, port=port)
 
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(run())
+    if EXCEL_TRANSPORT == "stdio":
+        asyncio.run(run())
+    else:
+        run_http()
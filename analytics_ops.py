@@ -0,0 +1,6 @@
+# Aggregates and filter operators understood by range_analytics. Kept apart
+# from it (and free of NumPy/openpyxl imports) so tool schemas can list them
+# without loading the analytics stack.
+
+AGGREGATES = ("sum", "mean", "min", "max", "count")
+FILTER_OPS = ("==", "!=", ">", ">=", "<", "<=", "in", "not_in", "contains", "empty", "not_empty")
@@ -0,0 +1,109 @@
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Callable
+from metrics import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Keep the previous version of every saved workbook as "<file>.bak".
+KEEP_BACKUP = os.getenv("EXCEL_KEEP_BACKUP", "false").lower() in ("1", "true", "yes")
+
+# mkstemp creates files as 0600; new workbooks get the usual umask-based mode instead.
+# Read once at import time because os.umask() is process-wide and not thread-safe.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _fsync_directory(directory: str):
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def _keep_backup(filename: str):
+    """Preserve the current file as ``<file>.bak``, preferably as a hard link (no data copied)."""
+    backup = filename + ".bak"
+    staging = backup + ".tmp"
+    if os.path.lexists(staging):
+        os.remove(staging)
+    try:
+        os.link(filename, staging)
+    except OSError:
+        shutil.copy2(filename, staging)
+    os.replace(staging, backup)
+
+def save_workbook_atomic(wb, filename: str, backup: bool = KEEP_BACKUP):
+    """Save ``wb`` to ``filename`` without ever exposing a partially written file.
+
+    The workbook is serialized once into a temporary file in the same
+    directory, fsynced and renamed over the target. Readers see either the
+    old or the new file, and a crash mid-save leaves the old file intact.
+    """
+    write_file_atomic(filename, wb.save, backup)
+
+def write_file_atomic(filename: str, write: Callable[[BinaryIO], None], backup: bool = KEEP_BACKUP):
+    """Create or replace ``filename`` with the bytes ``write`` puts into a temporary file (see above)."""
+    filename = os.path.abspath(filename)
+    with metrics.phase("save", filename):
+        directory = os.path.dirname(filename)
+        fd, tmp = tempfile.mkstemp(prefix=f".{os.path.basename(filename)}.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w+b") as f:
+                write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            if os.path.exists(filename):
+                os.chmod(tmp, os.stat(filename).st_mode & 0o7777)
+                if backup:
+                    _keep_backup(filename)
+            else:
+                os.chmod(tmp, 0o666 & ~_UMASK)
+            os.replace(tmp, filename)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        _fsync_directory(directory)
+
+# ---------- BYTE COPIES ----------
+
+# ioctl that makes a file share another file's extents (btrfs, XFS, bcachefs; Linux only).
+_FICLONE = 0x40049409
+
+def _copy_contents(src: str, dst: BinaryIO):
+    """Copy ``src`` into the empty file ``dst``: reflink, else in-kernel copy, else plain read/write."""
+    with open(src, "rb") as source:
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(dst.fileno(), _FICLONE, source.fileno())
+                return
+            except OSError:
+                pass  # filesystem without reflinks, or across filesystems
+        if hasattr(os, "copy_file_range"):
+            try:
+                remaining = os.fstat(source.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(source.fileno(), dst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+                if remaining == 0:
+                    dst.seek(0, os.SEEK_END)
+                    return
+            except OSError:
+                pass
+            source.seek(0)
+            dst.seek(0)
+            dst.truncate()
+        shutil.copyfileobj(source, dst, 1024 * 1024)
+
+def copy_file_atomic(src: str, dst: str, backup: bool = KEEP_BACKUP):
+    """Atomically replace ``dst`` with a byte-for-byte copy of ``src``, sharing extents where supported."""
+    write_file_atomic(dst, lambda f: _copy_contents(src, f), backup)
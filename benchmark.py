@@ -0,0 +1,325 @@
+"""Benchmark harness for the Excel functions and the MCP tools of both servers.
+
+Generates synthetic workbooks of several sizes and variants, times every
+operation a few times and reports latency percentiles, allocation peaks and
+the process peak RSS. Results are written as JSON and can be compared with a
+stored baseline:
+
+    python benchmark.py --sizes 1000 10000 --output results.json
+    python benchmark.py --baseline results.json       # exits 1 on regressions
+
+Server startup (import time, and spawn-to-``list_tools`` over stdio) is
+measured first so startup regressions show up next to the operation timings.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import logging
+import argparse
+import platform
+import resource
+import tempfile
+import tracemalloc
+from statistics import quantiles
+from typing import Any, Callable, Dict, List
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.worksheet.cell_range import CellRange
+
+COLUMNS = 10
+VARIANTS = ("plain", "styled", "merged", "formulas")
+DEFAULT_SIZES = (1_000, 10_000, 100_000)
+
+
+# ---------- SYNTHETIC WORKBOOKS ----------
+
+def generate_workbook(path: str, cells: int, variant: str = "plain"):
+    """Write a one-sheet workbook ("Data") of about ``cells`` cells in ``COLUMNS`` columns.
+
+    ``styled`` bolds the first column and fills every other row, ``merged``
+    merges A:C of every 50th row and ``formulas`` turns the last column into
+    a row SUM.
+    """
+    rows = max(1, cells // COLUMNS)
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Data")
+    bold = Font(bold=True)
+    fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
+    ws.append([f"col{c}" for c in range(1, COLUMNS + 1)])
+    for r in range(2, rows + 1):
+        values: List[Any] = [f"key{r % 997}"] + [r * c + 0.5 for c in range(1, COLUMNS - 1)] + [r]
+        if variant == "formulas":
+            values[-1] = f"=SUM(B{r}:I{r})"
+        if variant == "styled":
+            cells_out = []
+            for c, value in enumerate(values):
+                cell = WriteOnlyCell(ws, value=value)
+                if c == 0:
+                    cell.font = bold
+                if r % 2:
+                    cell.fill = fill
+                cells_out.append(cell)
+            values = cells_out
+        ws.append(values)
+        if variant == "merged" and r % 50 == 0:
+            ws.merged_cells.add(CellRange(f"A{r}:C{r}"))
+    wb.save(path)
+
+
+# ---------- MEASUREMENT ----------
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    if len(ordered) > 1:
+        cuts = quantiles(ordered, n=100, method="inclusive")
+        p50, p90, p99 = cuts[49], cuts[89], cuts[98]
+    else:
+        p50 = p90 = p99 = ordered[0]
+    return {"p50_ms": p50 * 1000, "p90_ms": p90 * 1000, "p99_ms": p99 * 1000,
+            "max_ms": ordered[-1] * 1000, "runs": len(ordered)}
+
+def measure(fn: Callable[[], Any], repeat: int, trace_memory: bool) -> Dict[str, float]:
+    samples = []
+    peak = 0
+    for _ in range(repeat):
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+        if trace_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    result = _percentiles(samples)
+    if trace_memory:
+        result["peak_alloc_mb"] = peak / 2 ** 20
+    return result
+
+def peak_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 1024
+
+
+# ---------- CASES ----------
+
+def function_cases(xl, path: str, workdir: str) -> Dict[str, Callable[[], Any]]:
+    """The excel_fucntion operations, bound to ``path``."""
+    copy_target = os.path.join(workdir, "copy.xlsx")
+    counter = iter(range(10 ** 9))
+    return {
+        "list_sheets": lambda: xl.list_sheets(path),
+        "get_used_range": lambda: xl.get_used_range(path, "Data"),
+        "read_cell": lambda: xl.read_cell(path, "Data", "B2"),
+        "read_range_100": lambda: xl.read_range(path, "Data", "A1:J10"),
+        "read_range_full": lambda: xl.read_range(path, "Data", "A:J"),
+        "read_range_computed": lambda: xl.read_range(path, "Data", "A1:J10", computed=True),
+        "write_cell": lambda: xl.write_cell(path, "Data", "L1", next(counter)),
+        "write_row": lambda: xl.write_row(path, "Data", "L2", list(range(20))),
+        "write_column": lambda: xl.write_column(path, "Data", "M1", list(range(20))),
+        "write_formula": lambda: xl.write_formula(path, "Data", "N1", "SUM(B2:B10)"),
+        "write_range": lambda: xl.write_range(path, "Data", "P1", [[1, 2, 3]] * 20,
+                                              [{"rows": [1], "bold": True}]),
+        "merge_unmerge": lambda: (xl.merge_cells(path, "Data", "R1:S2"), xl.unmerge_cells(path, "Data", "R1:S2")),
+        "set_border": lambda: xl.set_border(path, "Data", "A1:J10"),
+        "auto_fit_columns": lambda: xl.auto_fit_columns(path, "Data"),
+        "batch_apply": lambda: xl.batch_apply(path, [{"op": "write_cell", "sheet": "Data", "cell": f"T{i}", "value": i}
+                                                     for i in range(1, 21)]),
+        "flush": lambda: xl.flush_excel_file(path),
+        "save_as_new_file": lambda: xl.save_as_new_file(path, copy_target),
+    }
+
+def tool_calls(filename: str) -> Dict[str, Dict[str, tuple]]:
+    """Tool name and arguments per case, for each server."""
+    return {
+        "main": {
+            "read_cell": ("tool_read_cell", {"filename": filename, "sheet": "Data", "cell": "B2"}),
+            "read_range_100": ("tool_read_range", {"filename": filename, "sheet": "Data", "cell_range": "A1:J10"}),
+            "get_used_range": ("tool_get_used_range", {"filename": filename, "sheet": "Data"}),
+            "write_cell": ("tool_write_cell", {"filename": filename, "sheet": "Data", "cell": "L1", "value": "x"}),
+        },
+        "advanced": {
+            "read_cell": ("read_cell", {"filename": filename, "sheet": "Data", "cell": "B2"}),
+            "read_range_100": ("read_range", {"filename": filename, "sheet": "Data", "cell_range": "A1:J10"}),
+            "get_used_range": ("get_used_range", {"filename": filename, "sheet": "Data"}),
+            "write_cell": ("write_cell", {"filename": filename, "sheet": "Data", "cell": "L1", "value": "x"}),
+        },
+    }
+
+async def _time_tools(server, files: List[tuple], server_name: str, only: List[str]) -> Dict[str, Dict[str, float]]:
+    """Time every tool case for each ``(filename, variant, size, runs)`` over one client session."""
+    from mcp.shared.memory import create_connected_server_and_client_session
+    results = {}
+    async with create_connected_server_and_client_session(server) as session:
+        for filename, variant, size, runs in files:
+            for case, (tool, arguments) in tool_calls(filename)[server_name].items():
+                if only and case not in only:
+                    continue
+                samples = []
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    reply = await session.call_tool(tool, arguments)
+                    samples.append(time.perf_counter() - started)
+                    if reply.isError:
+                        raise RuntimeError(f"{tool} failed: {reply.content}")
+                key = f"{server_name}/{case}/{variant}/{size}"
+                results[key] = _percentiles(samples)
+                print(f"{key}: p50 {results[key]['p50_ms']:.1f} ms", file=sys.stderr)
+    return results
+
+
+# ---------- STARTUP ----------
+
+SERVER_SCRIPTS = {"main": "main.py", "advanced": "advanced_server.py"}
+
+def time_imports(repeat: int) -> Dict[str, Dict[str, float]]:
+    """Time ``import <server>`` in fresh interpreters, i.e. the work done before the handshake."""
+    import subprocess
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for server_name, script in SERVER_SCRIPTS.items():
+        module = script[:-3]
+        code = (f"import sys, time; sys.path.insert(0, {here!r}); t = time.perf_counter(); import {module}; "
+                "print(time.perf_counter() - t)")
+        samples = [float(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                        check=True).stdout.split()[-1]) for _ in range(repeat)]
+        key = f"startup/import/{server_name}/0"
+        results[key] = _percentiles(samples)
+        print(f"{key}: p50 {results[key]['p50_ms']:.1f} ms", file=sys.stderr)
+    return results
+
+async def _time_first_list_tools(script: str, workdir: str) -> float:
+    from mcp import ClientSession, StdioServerParameters
+    from mcp.client.stdio import stdio_client
+    here = os.path.dirname(os.path.abspath(__file__))
+    params = StdioServerParameters(command=sys.executable, args=[os.path.join(here, script)], cwd=here,
+                                   env={**os.environ, "EXCEL_FILES_DIR": workdir})
+    started = time.perf_counter()
+    async with stdio_client(params) as (read_stream, write_stream):
+        async with ClientSession(read_stream, write_stream) as session:
+            await session.initialize()
+            await session.list_tools()
+            return time.perf_counter() - started
+
+def time_startup(repeat: int, workdir: str) -> Dict[str, Dict[str, float]]:
+    """Time from spawning each stdio server to its ``list_tools`` reply."""
+    results = {}
+    for server_name, script in SERVER_SCRIPTS.items():
+        samples = [asyncio.run(_time_first_list_tools(script, workdir)) for _ in range(repeat)]
+        key = f"startup/list_tools/{server_name}/0"
+        results[key] = _percentiles(samples)
+        print(f"{key}: p50 {results[key]['p50_ms']:.1f} ms", file=sys.stderr)
+    return results
+
+
+# ---------- RUNNER ----------
+
+def run(sizes: List[int], variants: List[str], repeat: int, workdir: str, trace_memory: bool,
+        include_tools: bool, only: List[str]) -> Dict[str, Any]:
+    # The servers read EXCEL_FILES_DIR at import time.
+    os.environ["EXCEL_FILES_DIR"] = workdir
+    import excel_fucntion as xl
+    results: Dict[str, Any] = {}
+    files = []
+    for size in sizes:
+        for variant in variants:
+            filename = f"bench_{variant}_{size}.xlsx"
+            path = os.path.join(workdir, filename)
+            started = time.perf_counter()
+            generate_workbook(path, size, variant)
+            print(f"generated {filename} in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+            # Large workbooks get fewer repetitions so one run stays in minutes.
+            runs = max(1, repeat if size <= 100_000 else repeat // 3)
+            files.append((filename, variant, size, runs))
+            for case, fn in function_cases(xl, path, workdir).items():
+                if only and case not in only:
+                    continue
+                key = f"function/{case}/{variant}/{size}"
+                results[key] = measure(fn, runs, trace_memory)
+                print(f"{key}: p50 {results[key]['p50_ms']:.1f} ms", file=sys.stderr)
+            xl.flush_excel_file()
+            xl.workbook_cache.invalidate(path)
+    if include_tools:
+        import main
+        import advanced_server
+        logging.disable(logging.INFO)  # per-request server logs would swamp the report
+        servers = {"main": main.mcp._mcp_server, "advanced": advanced_server.server}
+        for server_name, server in servers.items():
+            results.update(asyncio.run(_time_tools(server, files, server_name, only)))
+        xl.flush_excel_file()
+    return results
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float,
+            min_ms: float) -> List[str]:
+    """Cases whose p50 grew by more than ``threshold`` (and by at least ``min_ms``) over the baseline."""
+    regressions = []
+    for key, stats in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        old, new = before["p50_ms"], stats["p50_ms"]
+        if new > old * (1 + threshold) and new - old >= min_ms:
+            regressions.append(f"{key}: p50 {old:.1f} ms -> {new:.1f} ms ({new / old - 1:+.0%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="workbook sizes in cells (e.g. 1000 1000000)")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case")
+    parser.add_argument("--only", nargs="+", default=[], help="run only these cases")
+    parser.add_argument("--no-tools", action="store_true", help="skip the MCP tool round trips")
+    parser.add_argument("--no-startup", action="store_true",
+                        help="skip the server import and stdio startup timings")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record peak Python allocations per case (tracemalloc; slows every case)")
+    parser.add_argument("--no-cache", action="store_true", help="disable the workbook cache")
+    parser.add_argument("--workdir", help="directory for generated workbooks (default: a temporary one)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="results JSON to compare with")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed p50 growth before flagging")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="ignore regressions smaller than this")
+    args = parser.parse_args()
+
+    if args.no_cache:
+        os.environ["EXCEL_CACHE_MAX_ENTRIES"] = "0"
+    workdir = args.workdir or tempfile.mkdtemp(prefix="excel-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = {}
+        if not args.no_startup:
+            results.update(time_imports(args.repeat))
+            results.update(time_startup(args.repeat, workdir))
+        results.update(run(args.sizes, args.variants, args.repeat, workdir, args.trace_memory,
+                           not args.no_tools, args.only))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                 "cache": not args.no_cache, "peak_rss_mb": peak_rss_mb(),
+                 "created": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {len(results)} results to {args.output} (peak RSS {report['meta']['peak_rss_mb']:.0f} MB)")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_ms)
+        for line in regressions:
+            print("REGRESSION", line)
+        if regressions:
+            sys.exit(1)
+        print("no regressions against", args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import csv
+import json
+import time
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator, List, Optional
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from atomic_save import save_workbook_atomic
+
+# ---------- CONFIGURATION ----------
+
+# Most cells add_sheet may append to an existing workbook, which is held in memory
+# while rows are added (0: no limit). create_excel_file streams any size to disk.
+APPEND_MAX_CELLS = int(os.getenv("EXCEL_APPEND_MAX_CELLS", "500000"))
+
+# ---------- VALUE COERCION ----------
+
+def _to_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in ("true", "yes", "1", "y"):
+        return True
+    if lowered in ("false", "no", "0", "n"):
+        return False
+    raise ValueError(f"Not a boolean: {value!r}")
+
+def _to_auto(value: str) -> Any:
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+_CONVERTERS = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": _to_bool,
+    "date": lambda v: date.fromisoformat(v.strip()),
+    "datetime": lambda v: datetime.fromisoformat(v.strip()),
+    "auto": _to_auto,
+}
+
+def _coerce(value: Any, type_name: Optional[str]) -> Any:
+    """Convert ``value`` to ``type_name``; only text (e.g. from CSV) is converted."""
+    if value is None or type_name is None or not isinstance(value, str):
+        return value
+    if value == "":
+        return None
+    return _CONVERTERS[type_name](value)
+
+# ---------- SOURCES ----------
+
+def iter_source_rows(data: Optional[List[List[Any]]] = None, csv_path: Optional[str] = None,
+                     ndjson_path: Optional[str] = None, header: Optional[List[str]] = None) -> Iterator[List[Any]]:
+    """Yield rows from exactly one source: an in-memory 2D array, a CSV file or an NDJSON file.
+
+    NDJSON lines may be arrays (used as rows) or objects (values taken in
+    ``header`` order, or in the key order of the first object).
+    """
+    sources = [s for s in (data, csv_path, ndjson_path) if s is not None]
+    if len(sources) != 1:
+        raise ValueError("Provide exactly one of data, csv_path or ndjson_path")
+    if data is not None:
+        yield from data
+    elif csv_path is not None:
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            yield from csv.reader(f)
+    else:
+        keys = list(header) if header else None
+        with open(ndjson_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if isinstance(record, dict):
+                    if keys is None:
+                        keys = list(record)
+                    yield [record.get(key) for key in keys]
+                else:
+                    yield record
+
+def _typed_rows(rows: Iterable[List[Any]], column_types: Optional[List[str]]) -> Iterator[List[Any]]:
+    if not column_types:
+        yield from rows
+        return
+    unknown = set(column_types) - set(_CONVERTERS)
+    if unknown:
+        raise ValueError(f"Unknown column types {sorted(unknown)}; use one of {sorted(_CONVERTERS)}")
+    for row in rows:
+        yield [_coerce(value, column_types[i] if i < len(column_types) else None)
+               for i, value in enumerate(row)]
+
+# ---------- WRITERS ----------
+
+def write_rows_streaming(filename: str, sheet_name: str, rows: Iterable[List[Any]],
+                         header: Optional[List[str]] = None, column_types: Optional[List[str]] = None) -> str:
+    """Create ``filename`` holding one sheet filled from ``rows`` in openpyxl write-only mode.
+
+    Rows are serialized as they are produced, so memory does not grow with the
+    number of rows.
+    """
+    started = time.perf_counter()
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    if header:
+        ws.append(_header_cells(ws, header))
+    count = 0
+    for row in _typed_rows(rows, column_types):
+        ws.append(row)
+        count += 1
+    save_workbook_atomic(wb, filename)
+    return _summary(count, started, sheet_name)
+
+def check_append_size(data: Optional[List[List[Any]]] = None, csv_path: Optional[str] = None,
+                      ndjson_path: Optional[str] = None, header: Optional[List[str]] = None):
+    """Refuse an import into an existing workbook beyond APPEND_MAX_CELLS, before anything is changed.
+
+    File sources are counted in one streaming pass that stops at the limit.
+    """
+    if APPEND_MAX_CELLS <= 0:
+        return
+    cells = len(header or [])
+    for row in iter_source_rows(data, csv_path, ndjson_path, header):
+        cells += len(row)
+        if cells > APPEND_MAX_CELLS:
+            raise ValueError(
+                f"More than {APPEND_MAX_CELLS} cells: adding them to an existing workbook holds it all in memory. "
+                "Import them into a new workbook with create_excel_file, which streams rows to disk "
+                "(or raise EXCEL_APPEND_MAX_CELLS)")
+
+def append_rows(ws, rows: Iterable[List[Any]], header: Optional[List[str]] = None,
+                column_types: Optional[List[str]] = None) -> str:
+    """Append ``rows`` to a regular (in-memory) worksheet; see ``check_append_size``."""
+    started = time.perf_counter()
+    if header:
+        ws.append(header)
+        for cell in ws[ws.max_row]:
+            cell.font = Font(bold=True)
+    count = 0
+    for row in _typed_rows(rows, column_types):
+        ws.append(row)
+        count += 1
+    return _summary(count, started, ws.title)
+
+def _header_cells(ws, header: List[str]) -> List[WriteOnlyCell]:
+    cells = []
+    for name in header:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = Font(bold=True)
+        cells.append(cell)
+    return cells
+
+def _summary(count: int, started: float, sheet_name: str) -> str:
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else float(count)
+    return f"Imported {count} rows into '{sheet_name}' in {elapsed:.2f}s ({rate:,.0f} rows/s)"
@@ -0,0 +1,351 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from openpyxl.utils import get_column_letter
+from directory_index import get_directory_index
+from excel_reader import read_sheet_names, scan_rows
+
+# ---------- CONFIGURATION ----------
+
+# SQLite file holding the index; defaults to ".cell_index.sqlite" inside the indexed directory.
+CELL_INDEX_PATH = os.getenv("EXCEL_CELL_INDEX_PATH", "")
+# Most matches returned by one find_cells call.
+FIND_MAX_RESULTS = int(os.getenv("EXCEL_FIND_MAX_RESULTS", "1000"))
+
+FIND_MODES = ("exact", "token", "prefix", "range")
+
+SCHEMA_VERSION = 1
+
+# Text longer than this is only findable by its tokens.
+_MAX_WHOLE = 256
+_MAX_TOKEN = 64
+_TOKEN = re.compile(r"\w+")
+# Sorts after every character, closing the range of a prefix scan.
+_PREFIX_END = "\U0010ffff"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, name TEXT UNIQUE, mtime_ns INTEGER, size INTEGER);
+CREATE TABLE IF NOT EXISTS cells (
+    id INTEGER PRIMARY KEY, file INTEGER, sheet TEXT, row INTEGER, col INTEGER, value, num REAL,
+    UNIQUE (file, sheet, row, col));
+CREATE INDEX IF NOT EXISTS cells_num ON cells (num) WHERE num IS NOT NULL;
+CREATE TABLE IF NOT EXISTS postings (term TEXT, cell INTEGER, whole INTEGER, PRIMARY KEY (term, cell)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_cell ON postings (cell);
+"""
+
+
+def normalize(text: str) -> str:
+    """Case-folded text with runs of whitespace collapsed, as values and queries are compared."""
+    return " ".join(text.casefold().split())
+
+def _entry(value: Any) -> Optional[Tuple[Any, Optional[float], Dict[str, int]]]:
+    """``(stored value, number, {term: whole})`` for one cell, or None for an empty one."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        text = "TRUE" if value else "FALSE"
+        return text, None, {text.casefold(): 1}
+    if isinstance(value, (int, float)):
+        return value, float(value), {}
+    if isinstance(value, (datetime, date, dt_time)):
+        text = value.isoformat()
+        return text, None, {text: 1}
+    if isinstance(value, timedelta):
+        value = str(value)
+    text = str(value)
+    norm = normalize(text)
+    terms = {token: 0 for token in _TOKEN.findall(norm) if len(token) <= _MAX_TOKEN}
+    if norm and len(norm) <= _MAX_WHOLE:
+        terms[norm] = 1
+    return text, None, terms
+
+def _entries(rows: Iterable[Tuple[int, Dict[int, Any]]]) -> List[Tuple[int, int, Any, Optional[float], Dict[str, int]]]:
+    """``(row, col, stored value, number, terms)`` for each non-empty cell of ``rows``."""
+    entries = []
+    for row, values in rows:
+        for col, value in values.items():
+            entry = _entry(value)
+            if entry is not None:
+                entries.append((row, col, *entry))
+    return entries
+
+def _number(query: str) -> Optional[float]:
+    try:
+        number = float(query)
+    except ValueError:
+        return None
+    return number if number == number else None
+
+
+# ---------- INDEX ----------
+
+class CellIndex:
+    """Persistent inverted index of the cell values of every workbook in a directory.
+
+    Each non-empty cell is stored once with its value; text is posted under
+    its whole normalized value and under each word, numbers go to an indexed
+    numeric column. The index lives in SQLite beside the workbooks and
+    survives restarts: before each lookup, files whose mtime or size changed
+    (as tracked by the directory index) are re-read in one streaming pass
+    and swapped in by one short transaction, and removed files are dropped. Writes made through this server update
+    the affected cells directly via ``cells_written``.
+    """
+
+    def __init__(self, directory: str, path: str = ""):
+        self.directory = directory
+        self.path = path or os.path.join(directory, ".cell_index.sqlite")
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._open()
+
+    # ---------- PUBLIC API ----------
+
+    def find(self, query: str = "", mode: str = "exact", min_value: Optional[float] = None,
+             max_value: Optional[float] = None, filename: Optional[str] = None, sheet: Optional[str] = None,
+             limit: Optional[int] = None) -> Dict[str, Any]:
+        """Cells matching ``query`` as ``{"matches": [{file, sheet, cell, value}], "truncated", ...}``.
+
+        ``exact`` matches whole values (numbers numerically), ``token`` cells
+        containing the word, ``prefix`` values or words starting with the
+        query, and ``range`` numbers between ``min_value`` and ``max_value``.
+        """
+        if mode not in FIND_MODES:
+            raise ValueError(f"Unknown mode {mode}; use one of {list(FIND_MODES)}")
+        if mode == "range" and min_value is None and max_value is None:
+            raise ValueError("range lookups need min_value and/or max_value")
+        if mode != "range" and not normalize(query or ""):
+            raise ValueError(f"{mode} lookups need a query")
+        limit = max(1, min(int(limit or 100), FIND_MAX_RESULTS))
+        refreshed = self.refresh()
+        started = time.perf_counter()
+        filters, params = "", []
+        if filename:
+            filters += " AND c.file = ?"
+            params.append(self._ids.get(filename, -1))
+        if sheet:
+            filters += " AND c.sheet = ?"
+            params.append(sheet)
+        by_number = "SELECT c.file, c.sheet, c.row, c.col, c.value FROM cells c WHERE "
+        # DISTINCT: one cell can hold several words starting with a prefix
+        by_term = "SELECT DISTINCT c.file, c.sheet, c.row, c.col, c.value FROM postings p JOIN cells c ON c.id = p.cell WHERE "
+        queries = []
+        if mode == "range":
+            bounds = [("c.num >= ?", min_value), ("c.num <= ?", max_value)]
+            queries.append((by_number + " AND ".join(clause for clause, bound in bounds if bound is not None),
+                            [float(bound) for _, bound in bounds if bound is not None]))
+        else:
+            norm = normalize(query)
+            if mode == "exact":
+                queries.append((by_term + "p.term = ? AND p.whole = 1", [norm]))
+                number = _number(norm)
+                if number is not None:
+                    queries.append((by_number + "c.num = ?", [number]))
+            elif mode == "token":
+                queries.append((by_term + "p.term = ?", [norm]))
+            else:
+                queries.append((by_term + "p.term >= ? AND p.term < ?", [norm, norm + _PREFIX_END]))
+        rows = []
+        with self._lock:
+            for sql, args in queries:
+                rows += self._db.execute(f"{sql}{filters} LIMIT ?", args + params + [limit + 1 - len(rows)]).fetchall()
+                if len(rows) > limit:
+                    break
+            names = [self._names.get(row[0]) for row in rows[:limit]]
+        matches = [{"file": name, "sheet": sheet_name, "cell": f"{get_column_letter(col)}{row}",
+                    "value": value} for name, (_, sheet_name, row, col, value) in zip(names, rows)]
+        return {"matches": matches, "truncated": len(rows) > limit, "reindexed_files": refreshed,
+                "lookup_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+    def refresh(self) -> int:
+        """Bring the index in line with the directory; returns the number of files re-read."""
+        stamps = get_directory_index(self.directory).stamps()
+        with self._refresh_lock:
+            with self._lock:
+                known = dict(self._stamps)
+                for name in known.keys() - stamps.keys():
+                    self._forget_file(name)
+            reindexed = 0
+            for name, stamp in stamps.items():
+                if known.get(name) == stamp:
+                    continue
+                try:
+                    # the listing trails inotify events; the file itself is authoritative
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                stamp = (st.st_mtime_ns, st.st_size)
+                if known.get(name) != stamp and self._index_file(name, stamp):
+                    reindexed += 1
+        return reindexed
+
+    def cells_written(self, filename: str, sheet: str, cells: Iterable[Tuple[int, int, Any]], on_disk: bool,
+                      before: Optional[Tuple[int, int]] = None):
+        """Apply a write made through this server: ``(row, col, value)`` for each cell.
+
+        With ``on_disk`` the file already holds the write. If ``before``, the
+        file's (mtime_ns, size) just before the write, matches the index, the
+        index takes the new mtime/size so the file is not re-read; otherwise
+        (the file changed since it was indexed, or the edit is still in the
+        workbook cache) the file is re-read on the next refresh.
+        """
+        name = os.path.basename(filename)
+        with self._lock:
+            if name not in self._stamps:
+                return  # not indexed yet: the next refresh reads the whole file
+            file_id = self._ids[name]
+            with self._db:
+                self._db.execute("BEGIN")
+                for row, col, value in cells:
+                    old = self._db.execute("SELECT id FROM cells WHERE file = ? AND sheet = ? AND row = ? AND col = ?",
+                                           (file_id, sheet, row, col)).fetchone()
+                    if old is not None:
+                        self._db.execute("DELETE FROM postings WHERE cell = ?", old)
+                        self._db.execute("DELETE FROM cells WHERE id = ?", old)
+                    self._insert(file_id, sheet, _entries([(row, {col: value})]))
+                if on_disk and before is not None and before == self._stamps[name]:
+                    try:
+                        st = os.stat(filename)
+                    except OSError:
+                        return
+                    stamp = (st.st_mtime_ns, st.st_size)
+                    self._db.execute("UPDATE files SET mtime_ns = ?, size = ? WHERE id = ?", (*stamp, file_id))
+                    self._stamps[name] = stamp
+
+    def file_changed(self, filename: str):
+        """Re-read ``filename`` on the next refresh: writes given to ``cells_written`` were discarded."""
+        name = os.path.basename(filename)
+        with self._lock:
+            if name not in self._stamps:
+                return
+            with self._db:
+                self._db.execute("UPDATE files SET mtime_ns = 0, size = 0 WHERE id = ?", (self._ids[name],))
+            self._stamps[name] = (0, 0)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    # ---------- INTERNALS ----------
+
+    def _open(self):
+        db = self._db
+        version = None
+        try:
+            version = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        except sqlite3.OperationalError:
+            pass
+        if version is not None and version[0] != str(SCHEMA_VERSION):
+            for table in ("meta", "files", "cells", "postings"):
+                db.execute(f"DROP TABLE IF EXISTS {table}")
+        db.executescript(_SCHEMA)
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(SCHEMA_VERSION),))
+        self._stamps: Dict[str, Tuple[int, int]] = {}
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        for file_id, name, mtime_ns, size in db.execute("SELECT id, name, mtime_ns, size FROM files"):
+            self._ids[name] = file_id
+            self._names[file_id] = name
+            self._stamps[name] = (mtime_ns, size)
+        self._next_cell = (db.execute("SELECT max(id) FROM cells").fetchone()[0] or 0) + 1
+
+    def _forget_file(self, name: str):
+        file_id = self._ids.pop(name, None)
+        self._stamps.pop(name, None)
+        if file_id is None:
+            return
+        del self._names[file_id]
+        with self._db:
+            self._db.execute("BEGIN")
+            self._delete_file(file_id)
+
+    def _delete_file(self, file_id: int):
+        self._db.execute("DELETE FROM postings WHERE cell IN (SELECT id FROM cells WHERE file = ?)", (file_id,))
+        self._db.execute("DELETE FROM cells WHERE file = ?", (file_id,))
+        self._db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def _index_file(self, name: str, stamp: Tuple[int, int]) -> bool:
+        """Re-read one workbook and replace its rows; False if it changed while being read.
+
+        The sheets are scanned without holding the lock, so lookups and
+        writes go on meanwhile; the lock only covers the transaction swapping
+        the file's rows, taken after checking the file still has ``stamp``.
+        """
+        path = os.path.join(self.directory, name)
+        sheets = []
+        try:
+            for sheet in read_sheet_names(path):
+                sheets.append((sheet, _entries(scan_rows(path, sheet))))
+        except MemoryError:
+            raise
+        except Exception:
+            sheets = []  # unreadable or half-written: indexed as empty until it changes again
+        with self._lock:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            if (st.st_mtime_ns, st.st_size) != stamp:
+                return False  # rewritten during the scan: the next refresh reads it again
+            old_id = self._ids.pop(name, None)
+            if old_id is not None:
+                del self._names[old_id]
+            self._stamps.pop(name, None)
+            with self._db:
+                self._db.execute("BEGIN")
+                if old_id is not None:
+                    self._delete_file(old_id)
+                file_id = self._add_file(name, stamp)
+                for sheet, entries in sheets:
+                    self._insert(file_id, sheet, entries)
+            self._ids[name] = file_id
+            self._names[file_id] = name
+            self._stamps[name] = stamp
+        return True
+
+    def _add_file(self, name: str, stamp: Tuple[int, int]) -> int:
+        return self._db.execute("INSERT INTO files (name, mtime_ns, size) VALUES (?, ?, ?)", (name, *stamp)).lastrowid
+
+    def _insert(self, file_id: int, sheet: str, entries: List[Tuple[int, int, Any, Optional[float], Dict[str, int]]]):
+        cells, postings = [], []
+        cell_id = self._next_cell
+        for row, col, stored, number, terms in entries:
+            cells.append((cell_id, file_id, sheet, row, col, stored, number))
+            postings += [(term, cell_id, whole) for term, whole in terms.items()]
+            cell_id += 1
+        self._db.executemany("INSERT INTO cells VALUES (?, ?, ?, ?, ?, ?, ?)", cells)
+        self._db.executemany("INSERT INTO postings VALUES (?, ?, ?)", postings)
+        self._next_cell = cell_id
+
+
+_indexes: Dict[str, CellIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_cell_index(directory: str) -> CellIndex:
+    """The process-wide cell index of ``directory``, opened on first use."""
+    key = os.path.realpath(directory)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = CellIndex(key, CELL_INDEX_PATH)
+        return index
+
+def cells_written(filename: str, sheet: str, cells: Iterable[Tuple[int, int, Any]], on_disk: bool,
+                  before: Optional[Tuple[int, int]] = None):
+    """Forward a write to the index of the file's directory, if that directory is indexed."""
+    index = _indexes.get(os.path.dirname(os.path.realpath(filename)))
+    if index is not None:
+        index.cells_written(filename, sheet, cells, on_disk, before)
+
+def file_changed(filename: str):
+    """Forward a discarded write to the index of the file's directory, if that directory is indexed."""
+    index = _indexes.get(os.path.dirname(os.path.realpath(filename)))
+    if index is not None:
+        index.file_changed(filename)
@@ -0,0 +1,365 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from atomic_save import write_file_atomic
+from excel_reader import read_sheet_names, read_sheet_dimension, scan_sheet_dimension, scan_columns, range_bounds
+
+# ---------- CONFIGURATION ----------
+
+# Keep a memory-mapped columnar copy of every workbook that is read, next to it in .columnar/.
+COLUMNAR_ENABLED = os.getenv("EXCEL_COLUMNAR_CACHE", "false").lower() in ("1", "true", "yes")
+# Directory for the sidecar files; defaults to a ".columnar" folder beside each workbook.
+COLUMNAR_DIR = os.getenv("EXCEL_COLUMNAR_DIR", "")
+# Workbooks smaller than this are cheap to parse and are not worth a sidecar.
+COLUMNAR_MIN_KB = int(os.getenv("EXCEL_COLUMNAR_MIN_KB", "512"))
+# Sheets whose used range has more cells than this are not cached (9 bytes per cell on disk).
+COLUMNAR_MAX_CELLS = int(os.getenv("EXCEL_COLUMNAR_MAX_CELLS", "50000000"))
+# Sheets whose sidecar stays memory-mapped (each holds a few open files), least recently read dropped first.
+COLUMNAR_OPEN_SHEETS = int(os.getenv("EXCEL_COLUMNAR_OPEN_SHEETS", "64"))
+
+FORMAT_VERSION = 1
+
+# Cell kinds stored in kinds.npy; values.npy holds the payload as float64.
+EMPTY, FLOAT, INT, STRING, BOOL, DATETIME, TIME, TIMEDELTA = range(8)
+
+_EPOCH = datetime(1970, 1, 1)
+_BUILD_CHUNK_ROWS = 4096
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _microseconds(delta: timedelta) -> int:
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+# ---------- ENCODING ----------
+
+class _StringTable:
+    """Interned strings written as one UTF-8 blob plus an offsets array."""
+
+    def __init__(self, blob_path: str):
+        self._index: Dict[str, int] = {}
+        self._offsets = [0]
+        self._blob = open(blob_path, "wb")
+
+    def add(self, text: str) -> int:
+        index = self._index.get(text)
+        if index is None:
+            data = text.encode("utf-8")
+            self._blob.write(data)
+            self._offsets.append(self._offsets[-1] + len(data))
+            index = self._index[text] = len(self._index)
+        return index
+
+    def close(self, offsets_path: str):
+        self._blob.close()
+        np.save(offsets_path, np.array(self._offsets, dtype=np.int64))
+
+
+def _encode(value: Any, strings: _StringTable) -> Tuple[int, float]:
+    if value is None:
+        return EMPTY, 0.0
+    if isinstance(value, bool):
+        return BOOL, float(value)
+    if isinstance(value, int):
+        if abs(value) < 2 ** 53:
+            return INT, float(value)
+        return STRING, float(strings.add(str(value)))
+    if isinstance(value, float):
+        return FLOAT, value
+    if isinstance(value, datetime):
+        return DATETIME, float(_microseconds(value - _EPOCH))
+    if isinstance(value, time):
+        return TIME, float(((value.hour * 60 + value.minute) * 60 + value.second) * 1_000_000 + value.microsecond)
+    if isinstance(value, timedelta):
+        return TIMEDELTA, float(_microseconds(value))
+    return STRING, float(strings.add(str(value)))
+
+
+# ---------- SHEET VIEW ----------
+
+class _SheetView:
+    """Memory-mapped arrays of one cached sheet. Slicing them copies nothing."""
+
+    def __init__(self, folder: str, meta: Dict[str, Any]):
+        self.bounds = tuple(meta["bounds"])  # min_col, min_row, max_col, max_row of the grid
+        self.dimension = tuple(meta["dimension"]) if meta["dimension"] else None
+        self.kinds = np.load(os.path.join(folder, "kinds.npy"), mmap_mode="r")
+        self.values = np.load(os.path.join(folder, "values.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(folder, "offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(folder, "strings.bin")
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else b""
+
+    def contains(self, min_col: int, min_row: int, max_col: int, max_row: int) -> bool:
+        g_min_col, g_min_row, g_max_col, g_max_row = self.bounds
+        return g_min_col <= min_col and g_min_row <= min_row and max_col <= g_max_col and max_row <= g_max_row
+
+    def _string(self, index: int) -> str:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def _decode(self, kind: int, value: float) -> Any:
+        if kind == EMPTY:
+            return None
+        if kind == FLOAT:
+            return value
+        if kind == INT:
+            return int(value)
+        if kind == STRING:
+            return self._string(int(value))
+        if kind == BOOL:
+            return bool(value)
+        if kind == DATETIME:
+            return _EPOCH + timedelta(microseconds=int(value))
+        if kind == TIME:
+            return (datetime.min + timedelta(microseconds=int(value))).time()
+        return timedelta(microseconds=int(value))
+
+    def rows(self, min_col: int, min_row: int, max_col: int, max_row: int) -> List[List[Any]]:
+        g_min_col, g_min_row = self.bounds[0], self.bounds[1]
+        rows = slice(min_row - g_min_row, max_row - g_min_row + 1)
+        cols = slice(min_col - g_min_col, max_col - g_min_col + 1)
+        kinds = self.kinds[rows, cols].tolist()
+        values = self.values[rows, cols].tolist()
+        decode = self._decode
+        return [[None if k == EMPTY else decode(k, v) for k, v in zip(krow, vrow)]
+                for krow, vrow in zip(kinds, values)]
+
+
+# ---------- CACHE ----------
+
+class ColumnarCache:
+    """On-disk columnar copies of workbooks for repeated reads without openpyxl.
+
+    Each sheet is stored as two Fortran-ordered (column-major) arrays over its
+    used range, ``kinds`` (uint8 cell type) and ``values`` (float64 payload:
+    numbers, string table index, date as microseconds), plus a shared string
+    table. Sidecars are built in the background the first time a workbook is
+    read, and are valid while the workbook's mtime and size match; a file that
+    only had its mtime touched is recognised by content hash. Until a valid
+    sidecar exists every lookup returns None and the caller reads the xlsx.
+    """
+
+    def __init__(self, enabled: bool = COLUMNAR_ENABLED, directory: str = COLUMNAR_DIR,
+                 min_bytes: int = COLUMNAR_MIN_KB * 1024, max_cells: int = COLUMNAR_MAX_CELLS,
+                 max_open: int = COLUMNAR_OPEN_SHEETS):
+        self.enabled = enabled
+        self.directory = directory
+        self.min_bytes = min_bytes
+        self.max_cells = max_cells
+        self.max_open = max_open
+        self._lock = threading.Lock()
+        self._views: "OrderedDict[Tuple[str, str], Tuple[Tuple[int, int], _SheetView]]" = OrderedDict()
+        self._metas: "OrderedDict[str, Tuple[Tuple[int, int], Dict[str, Any]]]" = OrderedDict()
+        self._building = set()
+
+    # ---------- PUBLIC API ----------
+
+    def read_range(self, filename: str, sheet: str, cell_range: str) -> Optional[List[List[Any]]]:
+        view = self._view(filename, sheet)
+        if view is None:
+            return None
+        min_col, min_row, max_col, max_row = range_bounds(cell_range, view.dimension or view.bounds)
+        if max_row is None or not view.contains(min_col, min_row, max_col, max_row):
+            return None
+        return view.rows(min_col, min_row, max_col, max_row)
+
+    def read_cell(self, filename: str, sheet: str, cell: str) -> Tuple[bool, Any]:
+        """Return ``(found, value)``; ``found`` is False when the caller has to read the file."""
+        rows = self.read_range(filename, sheet, cell)
+        if rows is None:
+            return False, None
+        return True, rows[0][0]
+
+    def used_range(self, filename: str, sheet: str) -> Optional[Tuple[int, int, int, int]]:
+        view = self._view(filename, sheet)
+        if view is None:
+            return None
+        return view.dimension or view.bounds
+
+    def build(self, filename: str) -> bool:
+        """Build (or rebuild) the sidecar of ``filename`` now. Returns False if the workbook is not cached."""
+        path = os.path.realpath(filename)
+        st = os.stat(path)
+        content_hash = _file_hash(path)
+        folder = self._folder(path)
+        parent = os.path.dirname(folder)
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f".{os.path.basename(folder)}.", dir=parent)
+        try:
+            sheets = {}
+            for index, name in enumerate(read_sheet_names(path)):
+                meta = self._build_sheet(path, name, os.path.join(staging, str(index)))
+                if meta is not None:
+                    sheets[name] = meta
+            after = os.stat(path)
+            if (after.st_mtime_ns, after.st_size) != (st.st_mtime_ns, st.st_size):
+                # the workbook was saved while we read it; the next read schedules a new build
+                shutil.rmtree(staging)
+                return False
+            meta = {"version": FORMAT_VERSION, "path": path, "mtime": st.st_mtime_ns, "size": st.st_size,
+                    "hash": content_hash, "sheets": sheets}
+            with open(os.path.join(staging, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            with self._lock:
+                self._forget(path)
+                if os.path.isdir(folder):
+                    shutil.rmtree(folder)
+                os.replace(staging, folder)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return bool(sheets)
+
+    def invalidate(self, filename: str):
+        """Delete the sidecar of ``filename``."""
+        path = os.path.realpath(filename)
+        with self._lock:
+            self._forget(path)
+            shutil.rmtree(self._folder(path), ignore_errors=True)
+
+    # ---------- INTERNALS ----------
+
+    def _folder(self, path: str) -> str:
+        key = hashlib.sha1(path.encode("utf-8")).hexdigest()[:12]
+        root = self.directory or os.path.join(os.path.dirname(path), ".columnar")
+        return os.path.join(root, f"{os.path.basename(path)}-{key}")
+
+    def _forget(self, path: str):
+        self._metas.pop(path, None)
+        for key in [key for key in self._views if key[0] == path]:
+            del self._views[key]
+
+    def _view(self, filename: str, sheet: str) -> Optional[_SheetView]:
+        if not self.enabled:
+            return None
+        path = os.path.realpath(filename)
+        st = os.stat(path)
+        if st.st_size < self.min_bytes:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._views.get((path, sheet))
+            if cached is not None:
+                if cached[0] == stamp:
+                    self._views.move_to_end((path, sheet))
+                    return cached[1]
+                del self._views[(path, sheet)]  # unmap the outdated sidecar
+        meta = self._load_meta(path, stamp)
+        if meta is None:
+            self._schedule_build(path)
+            return None
+        if sheet not in meta["sheets"]:
+            return None
+        folder = os.path.join(self._folder(path), meta["sheets"][sheet]["folder"])
+        view = _SheetView(folder, meta["sheets"][sheet])
+        with self._lock:
+            self._views[(path, sheet)] = (stamp, view)
+            self._views.move_to_end((path, sheet))
+            while len(self._views) > self.max_open:
+                self._views.popitem(last=False)
+        return view
+
+    def _load_meta(self, path: str, stamp: Tuple[int, int]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cached = self._metas.get(path)
+            if cached is not None and cached[0] == stamp:
+                self._metas.move_to_end(path)
+                return cached[1]
+        meta_path = os.path.join(self._folder(path), "meta.json")
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != FORMAT_VERSION or meta.get("size") != stamp[1]:
+            return None
+        if meta["mtime"] != stamp[0]:
+            # Same size, new mtime: still valid if the content is unchanged (e.g. a copy or touch).
+            if _file_hash(path) != meta["hash"]:
+                return None
+            meta["mtime"] = stamp[0]
+            data = json.dumps(meta).encode("utf-8")
+            write_file_atomic(meta_path, lambda f: f.write(data), backup=False)
+        with self._lock:
+            self._metas[path] = (stamp, meta)
+            self._metas.move_to_end(path)
+            while len(self._metas) > self.max_open:
+                self._metas.popitem(last=False)
+        return meta
+
+    def _schedule_build(self, path: str):
+        with self._lock:
+            if path in self._building:
+                return
+            self._building.add(path)
+
+        def run():
+            try:
+                self.build(path)
+            except Exception:
+                pass  # the workbook keeps being read from the xlsx
+            finally:
+                with self._lock:
+                    self._building.discard(path)
+
+        threading.Thread(target=run, name="excel-columnar-build", daemon=True).start()
+
+    def _build_sheet(self, path: str, sheet: str, folder: str) -> Optional[Dict[str, Any]]:
+        dimension = read_sheet_dimension(path, sheet)
+        bounds = dimension or scan_sheet_dimension(path, sheet)
+        if bounds is None:
+            return None
+        min_col, min_row, max_col, max_row = bounds
+        height, width = max_row - min_row + 1, max_col - min_col + 1
+        if height * width > self.max_cells:
+            return None
+        os.makedirs(folder)
+        kinds = np.lib.format.open_memmap(os.path.join(folder, "kinds.npy"), mode="w+", dtype=np.uint8,
+                                          shape=(height, width), fortran_order=True)
+        values = np.lib.format.open_memmap(os.path.join(folder, "values.npy"), mode="w+", dtype=np.float64,
+                                           shape=(height, width), fortran_order=True)
+        strings = _StringTable(os.path.join(folder, "strings.bin"))
+        chunk_kinds = np.zeros((_BUILD_CHUNK_ROWS, width), dtype=np.uint8)
+        chunk_values = np.zeros((_BUILD_CHUNK_ROWS, width), dtype=np.float64)
+        chunk_start = 0
+
+        def flush_chunk():
+            # Rows are accumulated row-major and written to the column-major files in blocks.
+            upto = min(chunk_start + _BUILD_CHUNK_ROWS, height)
+            kinds[chunk_start:upto] = chunk_kinds[:upto - chunk_start]
+            values[chunk_start:upto] = chunk_values[:upto - chunk_start]
+            chunk_kinds[:] = EMPTY
+            chunk_values[:] = 0.0
+
+        for row_number, row in scan_columns(path, sheet, min_row, max_row, list(range(min_col, max_col + 1))):
+            offset = row_number - min_row
+            if offset >= chunk_start + _BUILD_CHUNK_ROWS:
+                flush_chunk()
+                chunk_start = offset - offset % _BUILD_CHUNK_ROWS
+            line = offset - chunk_start
+            for i, value in enumerate(row):
+                if value is not None:
+                    chunk_kinds[line, i], chunk_values[line, i] = _encode(value, strings)
+        flush_chunk()
+        kinds.flush()
+        values.flush()
+        del kinds, values
+        strings.close(os.path.join(folder, "offsets.npy"))
+        return {"folder": os.path.basename(folder), "bounds": list(bounds),
+                "dimension": list(dimension) if dimension else None}
+
+
+columnar_cache = ColumnarCache()
@@ -0,0 +1,252 @@
+import os
+import time
+import errno
+import struct
+import bisect
+import ctypes
+import ctypes.util
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+# ---------- CONFIGURATION ----------
+
+# Seconds between rescans when inotify is unavailable (not Linux, or watch limit reached).
+INDEX_POLL_INTERVAL = float(os.getenv("EXCEL_INDEX_POLL_INTERVAL", "2.0"))
+# Largest page returned by one listing.
+INDEX_PAGE_MAX = int(os.getenv("EXCEL_INDEX_PAGE_MAX", "1000"))
+
+EXCEL_SUFFIXES = (".xlsx", ".xlsm")
+
+
+def is_excel_file(name: str) -> bool:
+    return name.endswith(EXCEL_SUFFIXES)
+
+
+# ---------- INOTIFY ----------
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = (_IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO
+               | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF)
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal ctypes binding: a watch on one directory and a blocking event reader."""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(_IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, os.strerror(error))
+
+    def read(self):
+        """Block for the next batch of events; yields ``(mask, name)``."""
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", "surrogateescape")
+            offset += length
+            yield mask, name
+
+    def close(self):
+        os.close(self.fd)
+
+
+# ---------- INDEX ----------
+
+class _FileInfo:
+    __slots__ = ("name", "size", "mtime_ns", "sheets")
+
+    def __init__(self, name: str, size: int, mtime_ns: int):
+        self.name = name
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.sheets = None
+
+
+class DirectoryIndex:
+    """Sorted, incrementally maintained listing of the Excel files in one directory.
+
+    The directory is scanned once with ``os.scandir``; afterwards an inotify
+    watch (Linux) applies creates, deletes, renames and writes as they happen.
+    Where inotify is unavailable the directory is rescanned at most every
+    ``poll_interval`` seconds, on demand. Listings are keyset-paginated by
+    file name, so a page costs O(log n + page size). Sheet names are read
+    lazily for the files of a requested page and kept until the file changes.
+    """
+
+    def __init__(self, directory: str, poll_interval: float = INDEX_POLL_INTERVAL):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._names: List[str] = []
+        self._files: Dict[str, _FileInfo] = {}
+        self._scanned_at = 0.0
+        self._inotify = None
+        self._watcher = None
+        self._start()
+
+    # ---------- PUBLIC API ----------
+
+    def list(self, prefix: str = "", cursor: Optional[str] = None, limit: Optional[int] = None,
+             include_sheets: bool = False) -> Dict[str, Any]:
+        """Return one page of ``{"files": [...], "next_cursor": name | None}``.
+
+        ``cursor`` is the ``next_cursor`` of the previous page.
+        """
+        self._refresh_if_polling()
+        limit = max(1, min(int(limit or INDEX_PAGE_MAX), INDEX_PAGE_MAX))
+        with self._lock:
+            start = bisect.bisect_left(self._names, prefix)
+            if cursor:
+                start = max(start, bisect.bisect_right(self._names, cursor))
+            page = []
+            for name in self._names[start:start + limit + 1]:
+                if not name.startswith(prefix):
+                    break
+                page.append(self._files[name])
+        more = len(page) > limit
+        page = page[:limit]
+        files = []
+        for info in page:
+            item = {"name": info.name, "size": info.size, "mtime": info.mtime_ns / 1e9}
+            if include_sheets:
+                item["sheets"] = self._sheets(info)
+            files.append(item)
+        return {"files": files, "next_cursor": page[-1].name if more else None}
+
+    def names(self) -> List[str]:
+        self._refresh_if_polling()
+        with self._lock:
+            return list(self._names)
+
+    def stamps(self) -> Dict[str, Tuple[int, int]]:
+        """``{name: (mtime_ns, size)}`` of every file, for keeping derived per-file data current."""
+        self._refresh_if_polling()
+        with self._lock:
+            return {name: (info.mtime_ns, info.size) for name, info in self._files.items()}
+
+    def close(self):
+        self._stop_watching(self._inotify)
+
+    # ---------- INTERNALS ----------
+
+    def _start(self):
+        try:
+            self._inotify = _Inotify(self.directory)
+        except (OSError, AttributeError):
+            self._inotify = None  # no inotify (or directory missing yet): poll instead
+        self._rescan()
+        if self._inotify is not None:
+            self._watcher = threading.Thread(target=self._watch, name="excel-dir-index", daemon=True)
+            self._watcher.start()
+
+    def _rescan(self):
+        files = {}
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if is_excel_file(entry.name) and entry.is_file():
+                        st = entry.stat()
+                        files[entry.name] = _FileInfo(entry.name, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            for name, info in files.items():
+                old = self._files.get(name)
+                if old is not None and (old.size, old.mtime_ns) == (info.size, info.mtime_ns):
+                    info.sheets = old.sheets
+            self._files = files
+            self._names = sorted(files)
+            self._scanned_at = time.monotonic()
+
+    def _refresh_if_polling(self):
+        if self._inotify is None and time.monotonic() - self._scanned_at >= self.poll_interval:
+            self._rescan()
+
+    def _update(self, name: str):
+        """Re-stat one file after an event and insert, update or remove its entry."""
+        try:
+            st = os.stat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            st = None
+        with self._lock:
+            known = name in self._files
+            if st is None:
+                if known:
+                    del self._files[name]
+                    del self._names[bisect.bisect_left(self._names, name)]
+                return
+            info = self._files.get(name)
+            if info is None:
+                self._files[name] = _FileInfo(name, st.st_size, st.st_mtime_ns)
+                bisect.insort(self._names, name)
+            elif (info.size, info.mtime_ns) != (st.st_size, st.st_mtime_ns):
+                info.size, info.mtime_ns, info.sheets = st.st_size, st.st_mtime_ns, None
+
+    def _watch(self):
+        inotify = self._inotify
+        try:
+            while self._inotify is inotify:
+                try:
+                    events = list(inotify.read())
+                except OSError as e:
+                    if e.errno == errno.EINTR:
+                        continue
+                    break
+                for mask, name in events:
+                    if mask & _IN_Q_OVERFLOW:
+                        self._rescan()
+                    elif mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                        return  # the directory itself went away: fall back to polling
+                    elif is_excel_file(name):
+                        self._update(name)
+        finally:
+            self._stop_watching(inotify)
+
+    def _stop_watching(self, inotify: Optional[_Inotify]):
+        """Switch to polling and close ``inotify`` if it is still the active watch (exactly once)."""
+        with self._lock:
+            if inotify is None or self._inotify is not inotify:
+                return
+            self._inotify = None
+        inotify.close()
+
+    def _sheets(self, info: _FileInfo) -> Optional[List[str]]:
+        if info.sheets is None:
+            from excel_reader import read_sheet_names  # keeps openpyxl out of plain listings
+            try:
+                info.sheets = read_sheet_names(os.path.join(self.directory, info.name))
+            except Exception:
+                return None  # unreadable or half-written file
+        return info.sheets
+
+
+_indexes: Dict[str, DirectoryIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_directory_index(directory: str) -> DirectoryIndex:
+    """The process-wide index of ``directory``, created on first use."""
+    key = os.path.realpath(directory)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = DirectoryIndex(key)
+        return index
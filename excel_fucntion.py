@@ -1,138 +1,348 @@
 import os
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from contextlib import contextmanager
+from openpyxl import Workbook
+from openpyxl.utils.cell import coordinate_to_tuple, get_column_letter, range_boundaries
 from typing import List, Dict, Any, Optional
+from workbook_cache import workbook_cache
+from columnar_cache import columnar_cache
+from atomic_save import save_workbook_atomic, copy_file_atomic
+from formula_engine import get_engine, notify_cells_changed, discard_engine, rename_sheet_references
+from formatting import apply_border, apply_style, fit_column_widths, font_id, set_style_ids, style_ids, style_key
+from bulk_import import iter_source_rows, write_rows_streaming, append_rows, check_append_size
+from xlsx_patch import patch_cells, PatchUnsupported, PATCH_MAX_CELLS
+from cell_index import cells_written, file_changed
+import op_journal
+from excel_reader import (
+    read_sheet_names, read_sheet_dimension, scan_sheet_dimension, range_bounds, stream_range, stream_cell
+)
 
 # ---------- BASIC UTILITIES ----------
 
-def create_excel_file(filename: str, sheet_name: str = "Sheet1"):
+def create_excel_file(filename: str, sheet_name: str = "Sheet1", data: Optional[List[List[Any]]] = None,
+                      csv_path: Optional[str] = None, ndjson_path: Optional[str] = None,
+                      header: Optional[List[str]] = None, column_types: Optional[List[str]] = None):
+    """Create a workbook, optionally filled from a 2D array, CSV or NDJSON file.
+
+    With a data source the sheet is written in write-only (streaming) mode.
+    """
+    workbook_cache.invalidate(filename)
+    if data is not None or csv_path or ndjson_path:
+        rows = iter_source_rows(data, csv_path or None, ndjson_path or None, header)
+        summary = write_rows_streaming(filename, sheet_name, rows, header, column_types)
+        return f"Created {filename} with sheet '{sheet_name}'. {summary}"
     wb = Workbook()
     ws = wb.active
     ws.title = sheet_name
-    wb.save(filename)
+    save_workbook_atomic(wb, filename)
     return f"Created {filename} with sheet '{sheet_name}'"
 
 def load_excel_file(filename: str):
     if not os.path.exists(filename):
         raise FileNotFoundError(f"{filename} does not exist.")
-    return load_workbook(filename)
+    return workbook_cache.get(filename)
+
+@contextmanager
+def edit_excel_file(filename: str):
+    """Yield the workbook for in-place modification; the change is written back by the cache.
+
+    In journal mode the change is saved at once: only OPERATIONS are journaled.
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} does not exist.")
+    with workbook_cache.edit(filename) as wb:
+        yield wb
+    if _journaling():
+        workbook_cache.flush(filename)
+
+def _journaling() -> bool:
+    return op_journal.JOURNAL_ENABLED and workbook_cache.enabled
+
+def _apply(filename: str, operation: Dict[str, Any]):
+    """Apply one OPERATIONS entry; in journal mode it is logged and the save left to compaction."""
+    if not _journaling():
+        with edit_excel_file(filename) as wb:
+            return apply_operation(wb, operation)
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} does not exist.")
+    if op_journal.unrecovered(filename):
+        recover_journal(filename)  # left by a crash and not replayed at startup
+    with workbook_cache.edit(filename, flush_delay=op_journal.JOURNAL_COMPACT_INTERVAL) as wb:
+        result = apply_operation(wb, operation)
+        # logged while the workbook is held, so a save cannot fold the edit in before its record exists
+        records = op_journal.append(filename, operation)
+    if records >= op_journal.JOURNAL_MAX_RECORDS:
+        workbook_cache.flush(filename)
+    return result
+
+def _loaded_workbook(filename: str):
+    """Return the cached workbook if it is already in memory, else None so reads can stream from disk."""
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} does not exist.")
+    return workbook_cache.peek(filename)
+
+def _patch_in_place(filename: str, edits: List[tuple], style: Optional[tuple] = None) -> bool:
+    """Write a few cells straight into the file's sheet XML when the workbook is not loaded.
+
+    Loading and re-saving re-serializes every sheet, the shared strings and
+    the stylesheet; patching rewrites only the edited sheet parts. Returns
+    False, having written nothing, when the edit must go through openpyxl.
+    """
+    if not 0 < len(edits) <= PATCH_MAX_CELLS or not os.path.exists(filename):
+        return False
+    if _journaling():
+        return False  # once loaded, a journaled edit costs one log record
+    if workbook_cache.peek(filename) is not None:
+        return False  # loaded or holding unsaved edits: edit it in memory
+    try:
+        patch_cells(filename, filename, edits, style)
+    except PatchUnsupported:
+        return False
+    workbook_cache.invalidate(filename)
+    return True
+
+def _write_cells(filename: str, sheet: str, cells: List[tuple], operation: Dict[str, Any], result: str,
+                 style: Optional[tuple] = None) -> str:
+    """Write ``(row, col, value)`` cells, patched into the file if possible, else as ``operation``.
+
+    The find_cells index of the directory, if there is one, is updated too.
+    """
+    edits = [(sheet, f"{get_column_letter(col)}{row}", value) for row, col, value in cells]
+    try:
+        st = os.stat(filename)
+        before = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        before = None
+    if not _patch_in_place(filename, edits, style):
+        result = _apply(filename, operation)
+    cells_written(filename, sheet, cells, on_disk=not workbook_cache.is_dirty(filename), before=before)
+    return result
+
+def flush_excel_file(filename: Optional[str] = None):
+    count = workbook_cache.flush(filename)
+    return f"Flushed {count} workbook(s) to disk"
 
 # ---------- SHEET MANAGEMENT ----------
 
-def add_sheet(filename: str, sheet_name: str):
-    wb = load_excel_file(filename)
+def _add_sheet(wb, sheet_name: str):
     wb.create_sheet(title=sheet_name)
-    wb.save(filename)
+    discard_engine(wb)
     return f"Added sheet '{sheet_name}'"
 
-def rename_sheet(filename: str, old_name: str, new_name: str):
-    wb = load_excel_file(filename)
+def _rename_sheet(wb, old_name: str, new_name: str):
     wb[old_name].title = new_name
-    wb.save(filename)
-    return f"Renamed sheet from '{old_name}' to '{new_name}'"
+    rewritten = rename_sheet_references(wb, old_name, new_name)
+    discard_engine(wb)
+    result = f"Renamed sheet from '{old_name}' to '{new_name}'"
+    return f"{result} and updated {rewritten} formula(s)" if rewritten else result
 
-def delete_sheet(filename: str, sheet_name: str):
-    wb = load_excel_file(filename)
+def _delete_sheet(wb, sheet_name: str):
     del wb[sheet_name]
-    wb.save(filename)
+    discard_engine(wb)
     return f"Deleted sheet '{sheet_name}'"
 
+def add_sheet(filename: str, sheet_name: str, data: Optional[List[List[Any]]] = None,
+              csv_path: Optional[str] = None, ndjson_path: Optional[str] = None,
+              header: Optional[List[str]] = None, column_types: Optional[List[str]] = None):
+    """Add a sheet, optionally filled from a 2D array, CSV or NDJSON file.
+
+    The workbook is edited in memory, so the import is limited to
+    EXCEL_APPEND_MAX_CELLS cells; create_excel_file streams larger ones.
+    """
+    if data is None and not csv_path and not ndjson_path:
+        return _apply(filename, {"op": "add_sheet", "sheet_name": sheet_name})
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} does not exist.")
+    check_append_size(data, csv_path or None, ndjson_path or None, header)
+    with edit_excel_file(filename) as wb:
+        result = _add_sheet(wb, sheet_name)
+        rows = iter_source_rows(data, csv_path or None, ndjson_path or None, header)
+        return f"{result}. {append_rows(wb[sheet_name], rows, header, column_types)}"
+
+def rename_sheet(filename: str, old_name: str, new_name: str):
+    return _apply(filename, {"op": "rename_sheet", "old_name": old_name, "new_name": new_name})
+
+def delete_sheet(filename: str, sheet_name: str):
+    return _apply(filename, {"op": "delete_sheet", "sheet_name": sheet_name})
+
 # ---------- CELL OPERATIONS ----------
 
-def write_cell(filename: str, sheet: str, cell: str, value: Any, 
-               bold=False, italic=False, font_color="000000", bg_color=None, align="left"):
-    wb = load_excel_file(filename)
+def _write_cell(wb, sheet: str, cell: str, value: Any,
+                bold=False, italic=False, font_color="000000", bg_color=None, align="left"):
     ws = wb[sheet]
     cell_obj = ws[cell]
     cell_obj.value = value
-    cell_obj.font = Font(bold=bold, italic=italic, color=font_color)
-    cell_obj.alignment = Alignment(horizontal=align)
-    if bg_color:
-        cell_obj.fill = PatternFill(start_color=bg_color, end_color=bg_color, fill_type="solid")
-    wb.save(filename)
+    key = style_key({"bold": bold, "italic": italic, "font_color": font_color, "bg_color": bg_color, "align": align})
+    set_style_ids(cell_obj, **style_ids(wb, key, font_id(cell_obj)))
+    notify_cells_changed(wb, sheet, [(cell_obj.row, cell_obj.column)])
     return f"Wrote value '{value}' to {cell} in '{sheet}'"
 
-def read_cell(filename: str, sheet: str, cell: str):
-    wb = load_excel_file(filename)
-    value = wb[sheet][cell].value
-    return value
+def _merge_cells(wb, sheet: str, cell_range: str):
+    wb[sheet].merge_cells(cell_range)
+    discard_engine(wb)
+    return f"Merged cells {cell_range}"
+
+def _unmerge_cells(wb, sheet: str, cell_range: str):
+    wb[sheet].unmerge_cells(cell_range)
+    discard_engine(wb)
+    return f"Unmerged cells {cell_range}"
+
+def write_cell(filename: str, sheet: str, cell: str, value: Any,
+               bold=False, italic=False, font_color="000000", bg_color=None, align="left"):
+    key = style_key({"bold": bold, "italic": italic, "font_color": font_color, "bg_color": bg_color, "align": align})
+    operation = {"op": "write_cell", "sheet": sheet, "cell": cell, "value": value, "bold": bold,
+                 "italic": italic, "font_color": font_color, "bg_color": bg_color, "align": align}
+    return _write_cells(filename, sheet, [(*coordinate_to_tuple(cell), value)], operation,
+                        f"Wrote value '{value}' to {cell} in '{sheet}'", key)
+
+def read_cell(filename: str, sheet: str, cell: str, computed: bool = False):
+    """Read a cell; with ``computed`` formulas are evaluated instead of returned as text."""
+    if computed:
+        return get_engine(load_excel_file(filename)).value(sheet, cell)
+    wb = _loaded_workbook(filename)
+    if wb is None:
+        found, value = columnar_cache.read_cell(filename, sheet, cell)
+        return value if found else stream_cell(filename, sheet, cell)
+    # ws[cell] would create the cell in the shared cached workbook, which writers hold under its lock
+    found = wb[sheet]._cells.get(coordinate_to_tuple(cell))
+    return found.value if found is not None else None
 
 def merge_cells(filename: str, sheet: str, cell_range: str):
-    wb = load_excel_file(filename)
-    ws = wb[sheet]
-    ws.merge_cells(cell_range)
-    wb.save(filename)
-    return f"Merged cells {cell_range}"
+    return _apply(filename, {"op": "merge_cells", "sheet": sheet, "cell_range": cell_range})
 
 def unmerge_cells(filename: str, sheet: str, cell_range: str):
-    wb = load_excel_file(filename)
-    ws = wb[sheet]
-    ws.unmerge_cells(cell_range)
-    wb.save(filename)
-    return f"Unmerged cells {cell_range}"
+    return _apply(filename, {"op": "unmerge_cells", "sheet": sheet, "cell_range": cell_range})
 
 # ---------- ROW/COLUMN BULK OPERATIONS ----------
 
-def write_row(filename: str, sheet: str, start_cell: str, data: List[Any]):
-    wb = load_excel_file(filename)
+def _write_row(wb, sheet: str, start_cell: str, data: List[Any]):
     ws = wb[sheet]
     row = ws[start_cell].row
     col = ws[start_cell].column
     for i, val in enumerate(data):
         ws.cell(row=row, column=col + i, value=val)
-    wb.save(filename)
+    notify_cells_changed(wb, sheet, [(row, col + i) for i in range(len(data))])
     return f"Wrote row starting at {start_cell}"
 
-def write_column(filename: str, sheet: str, start_cell: str, data: List[Any]):
-    wb = load_excel_file(filename)
+def _write_column(wb, sheet: str, start_cell: str, data: List[Any]):
     ws = wb[sheet]
     row = ws[start_cell].row
     col = ws[start_cell].column
     for i, val in enumerate(data):
         ws.cell(row=row + i, column=col, value=val)
-    wb.save(filename)
+    notify_cells_changed(wb, sheet, [(row + i, col) for i in range(len(data))])
     return f"Wrote column starting at {start_cell}"
 
-# ---------- FORMATTING UTILITIES ----------
+def _style_targets(entry: Dict[str, Any], min_row: int, min_col: int, max_row: int, max_col: int):
+    """Cells (row, col) an entry of a write_range style map applies to."""
+    if "range" in entry:
+        ref = entry["range"] if ":" in entry["range"] else f"{entry['range']}:{entry['range']}"
+        r_min_col, r_min_row, r_max_col, r_max_row = range_boundaries(ref)
+        for row in range(r_min_row, r_max_row + 1):
+            for col in range(r_min_col, r_max_col + 1):
+                yield row, col
+    elif "columns" in entry:
+        for letter in entry["columns"]:
+            col = range_boundaries(f"{letter}1:{letter}1")[0]
+            for row in range(min_row, max_row + 1):
+                yield row, col
+    elif "rows" in entry:
+        for row in entry["rows"]:
+            for col in range(min_col, max_col + 1):
+                yield row, col
+    else:
+        raise ValueError("Each style entry needs a 'range', 'columns' or 'rows' key")
 
-def set_border(filename: str, sheet: str, cell_range: str):
-    wb = load_excel_file(filename)
+def _write_range(wb, sheet: str, start_cell: str, values: List[List[Any]],
+                 styles: Optional[List[Dict[str, Any]]] = None):
+    """Write a 2D block of values at ``start_cell`` and style it from a style map.
+
+    Each style map entry targets a ``range`` (A1:C1), ``columns`` (["B", "D"])
+    or ``rows`` ([1, 2]) of the written block and sets any of bold, italic,
+    font_color, bg_color, align, border and number_format; attributes no
+    entry sets keep the cell's current formatting. Later entries override
+    earlier ones per attribute. Every distinct resulting style is created
+    once and shared by all its cells.
+    """
     ws = wb[sheet]
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    for row in ws[cell_range]:
-        for cell in row:
-            cell.border = border
-    wb.save(filename)
+    min_row, min_col = coordinate_to_tuple(start_cell)
+    max_row = min_row + max(len(values), 1) - 1
+    max_col = min_col + max((len(row) for row in values), default=1) - 1
+    changed = []
+    for r, row in enumerate(values):
+        for c, value in enumerate(row):
+            ws.cell(row=min_row + r, column=min_col + c, value=value)
+            changed.append((min_row + r, min_col + c))
+    specs: Dict[tuple, Dict[str, Any]] = {}
+    for entry in styles or []:
+        attributes = {k: v for k, v in entry.items() if k not in ("range", "columns", "rows")}
+        style_key(attributes)  # validate before touching cells
+        for target in _style_targets(entry, min_row, min_col, max_row, max_col):
+            specs.setdefault(target, {}).update(attributes)
+    resolved: Dict[tuple, Dict[str, int]] = {}
+    for (row, col), spec in specs.items():
+        cell = ws.cell(row=row, column=col)
+        key = (style_key(spec), font_id(cell))
+        ids = resolved.get(key)
+        if ids is None:
+            ids = resolved[key] = style_ids(wb, *key)
+        set_style_ids(cell, **ids)
+    notify_cells_changed(wb, sheet, changed)
+    return f"Wrote {len(changed)} cells at {start_cell} in '{sheet}' ({len(specs)} styled)"
+
+def write_range(filename: str, sheet: str, start_cell: str, values: List[List[Any]],
+                styles: Optional[List[Dict[str, Any]]] = None):
+    return _apply(filename, {"op": "write_range", "sheet": sheet, "start_cell": start_cell,
+                             "values": values, "styles": styles})
+
+def write_row(filename: str, sheet: str, start_cell: str, data: List[Any]):
+    row, col = coordinate_to_tuple(start_cell)
+    return _write_cells(filename, sheet, [(row, col + i, val) for i, val in enumerate(data)],
+                        {"op": "write_row", "sheet": sheet, "start_cell": start_cell, "data": data},
+                        f"Wrote row starting at {start_cell}")
+
+def write_column(filename: str, sheet: str, start_cell: str, data: List[Any]):
+    row, col = coordinate_to_tuple(start_cell)
+    return _write_cells(filename, sheet, [(row + i, col, val) for i, val in enumerate(data)],
+                        {"op": "write_column", "sheet": sheet, "start_cell": start_cell, "data": data},
+                        f"Wrote column starting at {start_cell}")
+
+# ---------- FORMATTING UTILITIES ----------
+
+def _set_border(wb, sheet: str, cell_range: str):
+    apply_border(wb[sheet], cell_range)
     return f"Applied border to {cell_range}"
 
-def auto_fit_columns(filename: str, sheet: str):
-    wb = load_excel_file(filename)
-    ws = wb[sheet]
-    for col in ws.columns:
-        max_length = 0
-        col_letter = col[0].column_letter
-        for cell in col:
-            try:
-                max_length = max(max_length, len(str(cell.value)))
-            except:
-                pass
-        ws.column_dimensions[col_letter].width = max_length + 2
-    wb.save(filename)
+def _set_style(wb, sheet: str, cell_range: str, bold=None, italic=None,
+               font_color=None, bg_color=None, align=None):
+    """Apply only the given style attributes to every cell of the range."""
+    apply_style(wb[sheet], cell_range, bold, italic, font_color, bg_color, align)
+    return f"Styled {cell_range} in '{sheet}'"
+
+def set_border(filename: str, sheet: str, cell_range: str):
+    return _apply(filename, {"op": "set_border", "sheet": sheet, "cell_range": cell_range})
+
+def auto_fit_columns(filename: str, sheet: str, sample_rows: Optional[int] = None,
+                     max_width: Optional[float] = None):
+    """Size columns to their content; ``sample_rows`` limits how many rows are measured on large sheets."""
+    with edit_excel_file(filename) as wb:
+        fit_column_widths(wb[sheet], sample_rows, max_width)
     return f"Auto-fitted columns in '{sheet}'"
 
 # ---------- SHEET INSPECTION ----------
 
 def list_sheets(filename: str) -> List[str]:
-    wb = load_excel_file(filename)
+    wb = _loaded_workbook(filename)
+    if wb is None:
+        return read_sheet_names(filename)
     return wb.sheetnames
 
 def get_used_range(filename: str, sheet: str) -> Dict[str, str]:
-    wb = load_excel_file(filename)
+    wb = _loaded_workbook(filename)
+    if wb is None:
+        dimension = (columnar_cache.used_range(filename, sheet) or read_sheet_dimension(filename, sheet)
+                     or scan_sheet_dimension(filename, sheet))
+        min_col, min_row, max_col, max_row = dimension or (1, 1, 1, 1)
+        return {"min_row": min_row, "max_row": max_row, "min_col": min_col, "max_col": max_col}
     ws = wb[sheet]
     return {
         "min_row": ws.min_row,
@@ -141,24 +351,184 @@ def get_used_range(filename: str, sheet: str) -> Dict[str, str]:
         "max_col": ws.max_column
     }
 
-def read_range(filename: str, sheet: str, cell_range: str) -> List[List[Any]]:
-    wb = load_excel_file(filename)
+def read_range(filename: str, sheet: str, cell_range: str, computed: bool = False) -> List[List[Any]]:
+    """Read a range; with ``computed`` formulas are evaluated instead of returned as text."""
+    wb = load_excel_file(filename) if computed else _loaded_workbook(filename)
+    if wb is None:
+        rows = columnar_cache.read_range(filename, sheet, cell_range)
+        return rows if rows is not None else stream_range(filename, sheet, cell_range)
     ws = wb[sheet]
-    data = [[cell.value for cell in row] for row in ws[cell_range]]
-    return data
+    min_col, min_row, max_col, max_row = range_bounds(
+        cell_range, (ws.min_column, ws.min_row, ws.max_column, ws.max_row))
+    if computed:
+        return get_engine(wb).range_values(sheet, min_col, min_row, max_col, max_row)
+    cells = ws._cells  # not iter_rows, which creates missing cells in the shared workbook
+    return [[cell.value if (cell := cells.get((row, col))) is not None else None
+             for col in range(min_col, max_col + 1)] for row in range(min_row, max_row + 1)]
 
 # ---------- FORMULA SUPPORT ----------
 
-def write_formula(filename: str, sheet: str, cell: str, formula: str):
-    wb = load_excel_file(filename)
+def _write_formula(wb, sheet: str, cell: str, formula: str):
     ws = wb[sheet]
     ws[cell] = f"={formula}"
-    wb.save(filename)
+    notify_cells_changed(wb, sheet, [(ws[cell].row, ws[cell].column)])
     return f"Wrote formula '{formula}' in {cell}"
 
+def write_formula(filename: str, sheet: str, cell: str, formula: str):
+    return _write_cells(filename, sheet, [(*coordinate_to_tuple(cell), f"={formula}")],
+                        {"op": "write_formula", "sheet": sheet, "cell": cell, "formula": formula},
+                        f"Wrote formula '{formula}' in {cell}")
+
+# ---------- BATCH OPERATIONS ----------
+
+# Operation name -> function applying it to a loaded workbook. The keys of an
+# operation dict (besides "op") are passed as keyword arguments.
+OPERATIONS = {
+    "write_cell": _write_cell,
+    "write_formula": _write_formula,
+    "write_row": _write_row,
+    "write_column": _write_column,
+    "write_range": _write_range,
+    "merge_cells": _merge_cells,
+    "unmerge_cells": _unmerge_cells,
+    "set_border": _set_border,
+    "set_style": _set_style,
+    "add_sheet": _add_sheet,
+    "rename_sheet": _rename_sheet,
+    "delete_sheet": _delete_sheet,
+}
+
+class _BatchAborted(Exception):
+    pass
+
+def apply_operation(wb, operation: Dict[str, Any]):
+    args = dict(operation)
+    name = args.pop("op", None)
+    if name not in OPERATIONS:
+        raise ValueError(f"Unknown operation: {name}")
+    return OPERATIONS[name](wb, **args)
+
+def batch_apply(filename: str, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply an ordered list of operations to one workbook and save it once.
+
+    The batch is all-or-nothing: if any operation fails, the remaining ones are
+    skipped and nothing is written to disk.
+    """
+    # Persist earlier edits first so that a failed batch can be rolled back by
+    # simply discarding the cached copy.
+    workbook_cache.flush(filename)
+    results = []
+    try:
+        with edit_excel_file(filename) as wb:
+            for index, operation in enumerate(operations):
+                try:
+                    result = apply_operation(wb, operation)
+                except Exception as e:
+                    results.append({"index": index, "op": operation.get("op"), "status": "error", "error": f"{type(e).__name__}: {e}"})
+                    raise _BatchAborted()
+                results.append({"index": index, "op": operation.get("op"), "status": "ok", "result": result})
+    except _BatchAborted:
+        for index in range(len(results), len(operations)):
+            results.append({"index": index, "op": operations[index].get("op"), "status": "skipped"})
+        return {"saved": False, "results": results}
+    workbook_cache.flush(filename)
+    return {"saved": True, "results": results}
+
+# ---------- JOURNAL ----------
+
+# A saved (or discarded) workbook no longer needs the log of its unsaved operations.
+workbook_cache.add_clean_listener(op_journal.forget)
+
+def recover_journal(path: str) -> Optional[str]:
+    """Replay the operation log a crash left for ``path`` and save the workbook.
+
+    A log whose workbook was saved or replaced after it was started is
+    deleted unread. If replaying raises, the log is kept (and new journaled
+    edits of the file are refused until it is recovered).
+    """
+    logged = op_journal.read_log(path)
+    line = None
+    if logged:
+        failed = 0
+        with workbook_cache.edit(path) as wb:
+            for operation in logged:
+                try:
+                    apply_operation(wb, operation)
+                except Exception:
+                    failed += 1
+        workbook_cache.flush(path)
+        line = f"{os.path.basename(path)}: replayed {len(logged) - failed} of {len(logged)} operation(s)"
+    op_journal.forget(path)
+    return line
+
+def recover_journals(directory: str) -> List[str]:
+    """Recover every log a crash left in ``directory``; returns one line per workbook."""
+    recovered = []
+    for path in op_journal.pending_journals(directory):
+        try:
+            line = recover_journal(path)
+        except Exception as e:
+            line = f"{os.path.basename(path)}: not recovered, log kept ({type(e).__name__}: {e})"
+        if line:
+            recovered.append(line)
+    return recovered
+
+def undo_operations(filename: str, count: int = 1):
+    """Undo the last ``count`` journaled operations on ``filename``.
+
+    The unsaved workbook is dropped and the operations logged before them are
+    applied again to the saved file, so only operations not yet folded in by
+    compaction (or a flush) can be undone.
+    """
+    if not _journaling():
+        raise ValueError("Undo needs journal mode (EXCEL_JOURNAL=true)")
+    logged = op_journal.operations(filename)
+    if not 0 < count <= len(logged):
+        raise ValueError(f"{len(logged)} operation(s) since the last save can be undone")
+    workbook_cache.invalidate(filename)  # also deletes the log
+    file_changed(filename)
+    for operation in logged[:-count]:
+        _apply(filename, operation)
+    return f"Undid {count} operation(s); {len(logged) - count} more can be undone"
+
 # ---------- SAVE/EXPORT ----------
 
 def save_as_new_file(old_filename: str, new_filename: str):
-    wb = load_excel_file(old_filename)
-    wb.save(new_filename)
+    """Copy a workbook byte for byte (reflink or in-kernel copy where available).
+
+    Pending cached edits are written back first, so the copy includes them;
+    parts openpyxl does not model (macros, pivots, charts) are kept.
+    """
+    if not os.path.exists(old_filename):
+        raise FileNotFoundError(f"{old_filename} does not exist.")
+    workbook_cache.flush(old_filename)
+    workbook_cache.invalidate(new_filename)
+    copy_file_atomic(old_filename, new_filename)
     return f"Saved copy as {new_filename}"
+
+def clone_from_template(template: str, new_filename: str, edits: Optional[List[Dict[str, Any]]] = None):
+    """Create ``new_filename`` from ``template`` with ``{"sheet", "cell", "value"}`` edits applied.
+
+    Only the worksheet parts holding edited cells are rewritten; all other
+    parts of the template are copied unchanged, compressed as they are.
+    Edits the part patcher cannot express (e.g. dates) fall back to copying
+    and writing the values through openpyxl. Cell styles are kept either way.
+    """
+    if not os.path.exists(template):
+        raise FileNotFoundError(f"{template} does not exist.")
+    workbook_cache.flush(template)
+    workbook_cache.invalidate(new_filename)
+    edits = [(edit["sheet"], edit["cell"], edit.get("value")) for edit in edits or []]
+    if not edits:
+        copy_file_atomic(template, new_filename)
+        return f"Cloned {template} to {new_filename}"
+    try:
+        count = patch_cells(template, new_filename, edits)
+    except PatchUnsupported:
+        copy_file_atomic(template, new_filename)
+        with edit_excel_file(new_filename) as wb:
+            for sheet, cell, value in edits:
+                wb[sheet][cell].value = value
+        workbook_cache.flush(new_filename)
+        count = len(edits)
+    return f"Cloned {template} to {new_filename} with {count} cell edit(s)"
@@ -0,0 +1,438 @@
+import os
+import posixpath
+import re
+import threading
+import zipfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+from openpyxl import load_workbook
+from openpyxl.formula.translate import Translator
+from openpyxl.reader.strings import read_string_table
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple, range_boundaries
+from openpyxl.utils.datetime import MAC_EPOCH, WINDOWS_EPOCH, from_excel, from_ISO8601
+from openpyxl.worksheet._reader import _cast_number
+from openpyxl.utils.exceptions import InvalidFileException
+from metrics import metrics
+
+NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+OFFICE_DOCUMENT_REL = NS_REL + "/officeDocument"
+STYLES_REL = NS_REL + "/styles"
+SHARED_STRINGS_REL = NS_REL + "/sharedStrings"
+
+# ---------- ZIP / XML METADATA ----------
+
+@contextmanager
+def open_xlsx(filename: str):
+    """Open the xlsx container, raising openpyxl's InvalidFileException for non-zip files."""
+    try:
+        archive = zipfile.ZipFile(filename)
+    except zipfile.BadZipFile as e:
+        raise InvalidFileException(f"{filename} is not a valid Excel file: {e}")
+    try:
+        yield archive
+    finally:
+        archive.close()
+
+def _resolve_target(base_part: str, target: str) -> str:
+    if target.startswith("/"):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+def _rels_path(part: str) -> str:
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", name + ".rels")
+
+def _read_relationships(archive: zipfile.ZipFile, part: str) -> Dict[str, str]:
+    """Map relationship ids of ``part`` to the zip member names they point at."""
+    rels_path = _rels_path(part)
+    if rels_path not in archive.namelist():
+        return {}
+    root = ElementTree.fromstring(archive.read(rels_path))
+    return {
+        rel.get("Id"): _resolve_target(part, rel.get("Target"))
+        for rel in root.iter(f"{{{NS_PKG_REL}}}Relationship")
+        if rel.get("TargetMode") != "External"
+    }
+
+def workbook_part(archive: zipfile.ZipFile) -> str:
+    root = ElementTree.fromstring(archive.read("_rels/.rels"))
+    for rel in root.iter(f"{{{NS_PKG_REL}}}Relationship"):
+        if rel.get("Type") == OFFICE_DOCUMENT_REL:
+            return rel.get("Target").lstrip("/")
+    return "xl/workbook.xml"
+
+def read_sheet_parts(archive: zipfile.ZipFile) -> List[Tuple[str, str]]:
+    """Return ``(sheet name, zip member)`` pairs in workbook order."""
+    part = workbook_part(archive)
+    rels = _read_relationships(archive, part)
+    root = ElementTree.fromstring(archive.read(part))
+    sheets = []
+    for sheet in root.iter(f"{{{NS_MAIN}}}sheet"):
+        sheets.append((sheet.get("name"), rels.get(sheet.get(f"{{{NS_REL}}}id"))))
+    return sheets
+
+def sheet_part(archive: zipfile.ZipFile, sheet: str) -> str:
+    for name, part in read_sheet_parts(archive):
+        if name == sheet:
+            return part
+    raise KeyError(f"Worksheet {sheet} does not exist.")
+
+def _workbook_related_part(archive: zipfile.ZipFile, rel_type: str) -> Optional[str]:
+    part = workbook_part(archive)
+    rels_path = _rels_path(part)
+    if rels_path not in archive.namelist():
+        return None
+    root = ElementTree.fromstring(archive.read(rels_path))
+    for rel in root.iter(f"{{{NS_PKG_REL}}}Relationship"):
+        if rel.get("Type") == rel_type:
+            return _resolve_target(part, rel.get("Target"))
+    return None
+
+def styles_part(archive: zipfile.ZipFile) -> Optional[str]:
+    """Zip member holding the workbook's stylesheet, or None if it has none."""
+    return _workbook_related_part(archive, STYLES_REL)
+
+def shared_strings_part(archive: zipfile.ZipFile) -> Optional[str]:
+    """Zip member holding the workbook's shared-string table, or None if it has none."""
+    return _workbook_related_part(archive, SHARED_STRINGS_REL)
+
+# ---------- METADATA MEMO ----------
+
+# Number of workbooks whose sheet names and dimensions are remembered.
+METADATA_CACHE_ENTRIES = int(os.getenv("EXCEL_METADATA_CACHE_ENTRIES", "512"))
+
+_metadata: "OrderedDict[str, Tuple[Tuple[int, int], Dict[Any, Any]]]" = OrderedDict()
+_metadata_lock = threading.Lock()
+
+
+def _stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+def _memoized(filename: str, key: Any, compute):
+    """Return ``compute(path)``, remembered per file until its mtime or size changes."""
+    path = os.path.realpath(filename)
+    stamp = _stamp(path)
+    with _metadata_lock:
+        slot = _metadata.get(path)
+        if slot is not None and slot[0] == stamp:
+            _metadata.move_to_end(path)
+            if key in slot[1]:
+                return slot[1][key]
+    value = compute(path)
+    if _stamp(path) != stamp:
+        return value  # changed while parsing; do not remember
+    with _metadata_lock:
+        slot = _metadata.get(path)
+        if slot is None or slot[0] != stamp:
+            slot = _metadata[path] = (stamp, {})
+        slot[1][key] = value
+        _metadata.move_to_end(path)
+        while len(_metadata) > METADATA_CACHE_ENTRIES:
+            _metadata.popitem(last=False)
+    return value
+
+def read_sheet_names(filename: str) -> List[str]:
+    """Sheet names straight from the workbook XML, without loading any sheet."""
+    return list(_memoized(filename, "sheets", _parse_sheet_names))
+
+def read_sheet_dimension(filename: str, sheet: str) -> Optional[Tuple[int, int, int, int]]:
+    """Return ``(min_col, min_row, max_col, max_row)`` from the sheet's <dimension> tag.
+
+    Only the head of the sheet XML is parsed. Returns None when the tag is
+    missing, in which case the caller has to scan the cells.
+    """
+    return _memoized(filename, ("dimension", sheet), lambda path: _parse_dimension(path, sheet))
+
+def scan_sheet_dimension(filename: str, sheet: str) -> Optional[Tuple[int, int, int, int]]:
+    """Compute ``(min_col, min_row, max_col, max_row)`` from the cell references in the sheet XML.
+
+    Used when the <dimension> tag is missing. Cell values are never decoded and
+    parsed elements are discarded immediately, so memory stays flat. Returns
+    None for a sheet without cells.
+    """
+    return _memoized(filename, ("scan", sheet), lambda path: _scan_dimension(path, sheet))
+
+def _parse_sheet_names(filename: str) -> Tuple[str, ...]:
+    with open_xlsx(filename) as archive:
+        return tuple(name for name, _ in read_sheet_parts(archive))
+
+def _parse_dimension(filename: str, sheet: str) -> Optional[Tuple[int, int, int, int]]:
+    with open_xlsx(filename) as archive:
+        part = sheet_part(archive, sheet)
+        with archive.open(part) as src:
+            for _, element in ElementTree.iterparse(src, events=("start",)):
+                if element.tag == f"{{{NS_MAIN}}}dimension":
+                    ref = element.get("ref")
+                    if not ref:
+                        return None
+                    if ":" not in ref:
+                        ref = f"{ref}:{ref}"
+                    return range_boundaries(ref)
+                if element.tag == f"{{{NS_MAIN}}}sheetData":
+                    return None
+    return None
+
+def _scan_dimension(filename: str, sheet: str) -> Optional[Tuple[int, int, int, int]]:
+    cell_tag = f"{{{NS_MAIN}}}c"
+    row_tag = f"{{{NS_MAIN}}}row"
+    min_col = min_row = max_col = max_row = None
+    with open_xlsx(filename) as archive:
+        part = sheet_part(archive, sheet)
+        with archive.open(part) as src:
+            for _, element in ElementTree.iterparse(src, events=("end",)):
+                if element.tag == cell_tag:
+                    ref = element.get("r")
+                    if ref:
+                        col, row = coordinate_to_tuple(ref)[::-1]
+                        min_col = col if min_col is None else min(min_col, col)
+                        max_col = col if max_col is None else max(max_col, col)
+                        min_row = row if min_row is None else min(min_row, row)
+                        max_row = row if max_row is None else max(max_row, row)
+                elif element.tag == row_tag:
+                    element.clear()
+    if min_col is None:
+        return None
+    return min_col, min_row, max_col, max_row
+
+# ---------- STREAMING CELL ACCESS ----------
+
+@contextmanager
+def open_readonly_sheet(filename: str, sheet: str):
+    """Yield a read-only (streaming) worksheet; the workbook is closed afterwards."""
+    wb = load_workbook(filename, read_only=True)
+    try:
+        if sheet not in wb.sheetnames:
+            raise KeyError(f"Worksheet {sheet} does not exist.")
+        yield wb[sheet]
+    finally:
+        wb.close()
+
+def iter_range_rows(ws, min_row: int, max_row: Optional[int], min_col: int,
+                    max_col: int) -> Iterator[Tuple[Any, ...]]:
+    """Yield value tuples of the rectangle, padding rows missing from the sheet XML.
+
+    Parsing stops as soon as ``max_row`` has been produced. ``max_row`` None
+    streams to the end of the sheet.
+    """
+    width = max_col - min_col + 1
+    expected = min_row
+    for row in ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col,
+                            max_col=max_col, values_only=True):
+        yield tuple(row) if len(row) == width else tuple(row) + (None,) * (width - len(row))
+        expected += 1
+    if max_row is not None:
+        for _ in range(expected, max_row + 1):
+            yield (None,) * width
+
+def is_open_range(cell_range: str) -> bool:
+    """True for whole-column (A:B) or whole-row (1:3) references."""
+    ref = cell_range if ":" in cell_range else f"{cell_range}:{cell_range}"
+    min_col, min_row, _, _ = range_boundaries(ref)
+    return min_col is None or min_row is None
+
+def range_bounds(cell_range: str, dimension: Optional[Tuple[int, int, int, int]] = None):
+    """Resolve ``cell_range`` (A1, A1:B2, A:B or 1:3) to ``(min_col, min_row, max_col, max_row)``.
+
+    Open-ended column or row ranges are closed with the sheet ``dimension``;
+    ``max_row`` stays None when it is unknown.
+    """
+    ref = cell_range if ":" in cell_range else f"{cell_range}:{cell_range}"
+    min_col, min_row, max_col, max_row = range_boundaries(ref)
+    dim_min_col, dim_min_row, dim_max_col, dim_max_row = dimension or (1, 1, None, None)
+    if min_row is None:
+        min_row, max_row = 1, dim_max_row
+    if min_col is None:
+        min_col, max_col = 1, dim_max_col or 1
+    return min_col, min_row, max_col, max_row
+
+def stream_range(filename: str, sheet: str, cell_range: str) -> List[List[Any]]:
+    """Read a rectangle with the read-only parser, stopping after its last row."""
+    with metrics.phase("load", filename), open_readonly_sheet(filename, sheet) as ws:
+        dimension = None
+        if ws.max_row is not None:
+            dimension = (ws.min_column, ws.min_row, ws.max_column, ws.max_row)
+        elif is_open_range(cell_range):
+            # A:B / 1:3 on a sheet without a <dimension> tag
+            dimension = scan_sheet_dimension(filename, sheet)
+        min_col, min_row, max_col, max_row = range_bounds(cell_range, dimension)
+        return [list(row) for row in iter_range_rows(ws, min_row, max_row, min_col, max_col)]
+
+def stream_cell(filename: str, sheet: str, cell: str) -> Any:
+    rows = stream_range(filename, sheet, cell)
+    return rows[0][0] if rows and rows[0] else None
+
+# ---------- FAST VALUE SCAN ----------
+
+_CELL_TAG = f"{{{NS_MAIN}}}c"
+_ROW_TAG = f"{{{NS_MAIN}}}row"
+_SHEET_DATA_TAG = f"{{{NS_MAIN}}}sheetData"
+_VALUE_TAG = f"{{{NS_MAIN}}}v"
+_FORMULA_TAG = f"{{{NS_MAIN}}}f"
+_INLINE_TAG = f"{{{NS_MAIN}}}is"
+_TEXT_TAG = f"{{{NS_MAIN}}}t"
+_COLUMN_PREFIX = re.compile(r"[A-Z]+")
+
+
+class _ValueDecoder:
+    """Shared strings, date styles and the epoch needed to turn raw <c> elements into values."""
+
+    def __init__(self, archive: zipfile.ZipFile):
+        names = set(archive.namelist())
+        self.shared_strings = []
+        strings = shared_strings_part(archive)
+        if strings in names:
+            with archive.open(strings) as src:
+                self.shared_strings = read_string_table(src)
+        self.date_styles, self.timedelta_styles = set(), set()
+        part = styles_part(archive)
+        if part in names:
+            styles = Stylesheet.from_tree(ElementTree.fromstring(archive.read(part)))
+            self.date_styles = {str(i) for i in styles.date_formats}
+            self.timedelta_styles = {str(i) for i in styles.timedelta_formats}
+        self.shared_formulas = {}
+        self.epoch = WINDOWS_EPOCH
+        workbook = ElementTree.fromstring(archive.read(workbook_part(archive)))
+        pr = workbook.find(f"{{{NS_MAIN}}}workbookPr")
+        if pr is not None and pr.get("date1904") in ("1", "true"):
+            self.epoch = MAC_EPOCH
+
+    def _formula(self, formula, ref: Optional[str]) -> Optional[str]:
+        if formula.get("t") != "shared" or ref is None:
+            return formula.text
+        index = formula.get("si")
+        if formula.text:
+            self.shared_formulas[index] = Translator("=" + formula.text, ref)
+            return formula.text
+        anchor = self.shared_formulas.get(index)
+        return anchor.translate_formula(ref)[1:] if anchor is not None else None
+
+    def note_formula(self, element):
+        formula = element.find(_FORMULA_TAG)
+        if formula is not None and formula.text:
+            self._formula(formula, element.get("r"))
+
+    def decode(self, element) -> Any:
+        kind = element.get("t", "n")
+        formula = element.find(_FORMULA_TAG)
+        if formula is not None:
+            text = self._formula(formula, element.get("r"))
+            if text:
+                return "=" + text
+        if kind == "inlineStr":
+            inline = element.find(_INLINE_TAG)
+            return None if inline is None else "".join(t.text or "" for t in inline.iter(_TEXT_TAG))
+        value = element.findtext(_VALUE_TAG)
+        if value is None or value == "":
+            return None
+        if kind == "n":
+            number = _cast_number(value)
+            style = element.get("s")
+            if style in self.date_styles:
+                try:
+                    return from_excel(number, self.epoch, timedelta=style in self.timedelta_styles)
+                except (OverflowError, ValueError):
+                    return "#VALUE!"
+            return number
+        if kind == "s":
+            return self.shared_strings[int(value)]
+        if kind == "b":
+            return bool(int(value))
+        if kind == "d":
+            return from_ISO8601(value)
+        return value
+
+
+def scan_columns(filename: str, sheet: str, min_row: int, max_row: Optional[int],
+                 columns: List[int]) -> Iterator[Tuple[int, List[Any]]]:
+    """Yield ``(row number, values)`` for every row of ``min_row..max_row`` that has cells.
+
+    ``values`` holds the cells of ``columns`` (1-based indexes) in that order.
+    The sheet XML is parsed directly and cells outside ``columns`` are skipped
+    before their value is decoded, which makes this several times faster than
+    the openpyxl read-only reader for narrow column sets. Values match
+    openpyxl's: formulas as "=..." text (shared formulas translated), dates
+    as datetime.
+    """
+    return metrics.phase_iter("load", filename, _scan_columns(filename, sheet, min_row, max_row, columns))
+
+def _scan_columns(filename: str, sheet: str, min_row: int, max_row: Optional[int],
+                  columns: List[int]) -> Iterator[Tuple[int, List[Any]]]:
+    slots = {column: i for i, column in enumerate(columns)}
+    width = len(columns)
+    with open_xlsx(filename) as archive:
+        decoder = _ValueDecoder(archive)
+        part = sheet_part(archive, sheet)
+        with archive.open(part) as src:
+            row_number = 0
+            values = None
+            sheet_data = None
+            for event, element in ElementTree.iterparse(src, events=("start", "end")):
+                tag = element.tag
+                if event == "start":
+                    if tag == _ROW_TAG:
+                        row_number = int(element.get("r") or row_number + 1)
+                        column = 0
+                        values = [None] * width if row_number >= min_row else None
+                        if max_row is not None and row_number > max_row:
+                            return
+                    elif tag == _SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if tag == _CELL_TAG:
+                    ref = element.get("r")
+                    column = column_index_from_string(_COLUMN_PREFIX.match(ref).group()) if ref else column + 1
+                    if values is not None and column in slots:
+                        values[slots[column]] = decoder.decode(element)
+                    elif len(element) > 1:
+                        # a skipped cell may anchor a shared formula used by a wanted one
+                        decoder.note_formula(element)
+                elif tag == _ROW_TAG:
+                    if values is not None:
+                        yield row_number, values
+                    sheet_data.clear()  # drop finished rows so memory stays flat on long sheets
+
+
+def scan_rows(filename: str, sheet: str) -> Iterator[Tuple[int, Dict[int, Any]]]:
+    """Yield ``(row number, {column: value})`` for every row with at least one non-empty cell.
+
+    Like ``scan_columns`` but over all columns and sparse: cells holding no
+    value (e.g. only a style) are left out. Finished rows are discarded, so
+    memory does not grow with the sheet.
+    """
+    return metrics.phase_iter("load", filename, _scan_rows(filename, sheet))
+
+def _scan_rows(filename: str, sheet: str) -> Iterator[Tuple[int, Dict[int, Any]]]:
+    with open_xlsx(filename) as archive:
+        decoder = _ValueDecoder(archive)
+        part = sheet_part(archive, sheet)
+        with archive.open(part) as src:
+            row_number = 0
+            column = 0
+            values: Dict[int, Any] = {}
+            sheet_data = None
+            for event, element in ElementTree.iterparse(src, events=("start", "end")):
+                tag = element.tag
+                if event == "start":
+                    if tag == _ROW_TAG:
+                        row_number = int(element.get("r") or row_number + 1)
+                        column = 0
+                        values = {}
+                    elif tag == _SHEET_DATA_TAG:
+                        sheet_data = element
+                    continue
+                if tag == _CELL_TAG:
+                    ref = element.get("r")
+                    column = column_index_from_string(_COLUMN_PREFIX.match(ref).group()) if ref else column + 1
+                    value = decoder.decode(element)
+                    if value is not None:
+                        values[column] = value
+                elif tag == _ROW_TAG:
+                    if values:
+                        yield row_number, values
+                    sheet_data.clear()
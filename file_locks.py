@@ -0,0 +1,136 @@
+import os
+import threading
+from contextlib import contextmanager, ExitStack
+from typing import Iterable, Tuple
+
+
+class RWLock:
+    """Readers-writer lock: many concurrent readers or one writer.
+
+    Waiting writers block new readers so a steady stream of reads cannot
+    starve writes. The lock is not reentrant.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self, blocking: bool = True) -> bool:
+        with self._cond:
+            if not blocking:
+                if self._writer or self._readers:
+                    return False
+                self._writer = True
+                return True
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+            return True
+
+    def release_write(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+
+
+class LockTable:
+    """Per-file RWLocks keyed by resolved path, dropped when no longer in use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}  # path -> [RWLock, users]
+
+    def _checkout(self, path: str) -> RWLock:
+        key = os.path.realpath(path)
+        with self._lock:
+            slot = self._locks.setdefault(key, [RWLock(), 0])
+            slot[1] += 1
+            return slot[0]
+
+    def _checkin(self, path: str):
+        key = os.path.realpath(path)
+        with self._lock:
+            slot = self._locks[key]
+            slot[1] -= 1
+            if not slot[1]:
+                del self._locks[key]
+
+    @contextmanager
+    def read_locked(self, path: str):
+        lock = self._checkout(path)
+        try:
+            lock.acquire_read()
+            try:
+                yield
+            finally:
+                lock.release_read()
+        finally:
+            self._checkin(path)
+
+    @contextmanager
+    def write_locked(self, path: str):
+        lock = self._checkout(path)
+        try:
+            lock.acquire_write()
+            try:
+                yield
+            finally:
+                lock.release_write()
+        finally:
+            self._checkin(path)
+
+    def try_write_lock(self, path: str) -> bool:
+        """Take the write lock without waiting; release with ``release_write``."""
+        lock = self._checkout(path)
+        if lock.acquire_write(blocking=False):
+            return True
+        self._checkin(path)
+        return False
+
+    def release_write(self, path: str):
+        key = os.path.realpath(path)
+        with self._lock:
+            lock = self._locks[key][0]
+        lock.release_write()
+        self._checkin(path)
+
+    @contextmanager
+    def locked(self, requests: Iterable[Tuple[str, str]]):
+        """Hold several locks given as ``(path, "read" | "write")`` pairs.
+
+        Locks are taken in path order so callers cannot deadlock each other;
+        a path requested in both modes is locked for writing.
+        """
+        modes = {}
+        for path, mode in requests:
+            key = os.path.realpath(path)
+            if modes.get(key) != "write":
+                modes[key] = mode
+        with ExitStack() as stack:
+            for key in sorted(modes):
+                if modes[key] == "write":
+                    stack.enter_context(self.write_locked(key))
+                else:
+                    stack.enter_context(self.read_locked(key))
+            yield
+
+
+lock_table = LockTable()
@@ -0,0 +1,262 @@
+import math
+import threading
+from copy import copy
+from weakref import WeakKeyDictionary
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Iterator, Optional
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE, BUILTIN_FORMATS_REVERSE
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.cell import range_boundaries
+
+# Excel's limit for a column width, in character units.
+MAX_COLUMN_WIDTH = 255
+
+THIN_BORDER = Border(left=Side(style="thin"), right=Side(style="thin"),
+                     top=Side(style="thin"), bottom=Side(style="thin"))
+
+# ---------- STYLE IDS ----------
+
+# StyleArray attribute and workbook collection for each kind of style object.
+_COLLECTIONS = {
+    "fontId": "_fonts",
+    "fillId": "_fills",
+    "borderId": "_borders",
+    "alignmentId": "_alignments",
+}
+
+def style_id(wb, key: str, style) -> int:
+    """Index of ``style`` in the workbook's stylesheet, adding it once if new."""
+    return getattr(wb, _COLLECTIONS[key]).add(style)
+
+def range_cells(ws, cell_range: str) -> Iterator:
+    """Every cell of ``cell_range`` (a single cell or A1:B2), created if missing."""
+    ref = cell_range if ":" in cell_range else f"{cell_range}:{cell_range}"
+    min_col, min_row, max_col, max_row = range_boundaries(ref)
+    for row in ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col):
+        yield from row
+
+def set_style_ids(cell, **ids: int):
+    """Point a cell at already registered style ids, skipping the per-cell stylesheet lookup."""
+    if cell._style is None:
+        cell._style = StyleArray()
+    style = cell._style
+    for key, value in ids.items():
+        setattr(style, key, value)
+
+def font_id(cell) -> int:
+    return cell._style.fontId if cell._style is not None else 0
+
+def merged_font(font: Font, spec: Dict[str, Any]) -> Font:
+    """``font`` with the bold, italic and font_color of a style spec; attributes not in it are kept."""
+    font = copy(font)
+    if "bold" in spec:
+        font.b = bool(spec["bold"])
+    if "italic" in spec:
+        font.i = bool(spec["italic"])
+    if "font_color" in spec:
+        font.color = spec["font_color"]
+    return font
+
+def apply_border(ws, cell_range: str, border: Border = THIN_BORDER) -> int:
+    border_id = style_id(ws.parent, "borderId", border)
+    count = 0
+    for cell in range_cells(ws, cell_range):
+        set_style_ids(cell, borderId=border_id)
+        count += 1
+    return count
+
+def apply_style(ws, cell_range: str, bold=None, italic=None, font_color=None,
+                bg_color=None, align=None) -> int:
+    """Apply only the given attributes to the range, registering each distinct resulting style once."""
+    wb = ws.parent
+    ids = {}
+    if align is not None:
+        ids["alignmentId"] = style_id(wb, "alignmentId", Alignment(horizontal=align))
+    if bg_color:
+        ids["fillId"] = style_id(wb, "fillId", PatternFill(start_color=bg_color, end_color=bg_color, fill_type="solid"))
+    font_spec = {name: value for name, value in (("bold", bold), ("italic", italic), ("font_color", font_color))
+                 if value is not None}
+    fonts: Dict[int, int] = {}  # existing font id -> restyled font id
+    count = 0
+    for cell in range_cells(ws, cell_range):
+        if font_spec:
+            old_id = font_id(cell)
+            new_id = fonts.get(old_id)
+            if new_id is None:
+                new_id = fonts[old_id] = style_id(wb, "fontId", merged_font(wb._fonts[old_id], font_spec))
+            set_style_ids(cell, fontId=new_id, **ids)
+        elif ids:
+            set_style_ids(cell, **ids)
+        count += 1
+    return count
+
+# ---------- COLUMN WIDTHS ----------
+
+# Relative advance widths of Calibri 11 glyphs, in units of the digit width
+# that Excel column widths are measured in.
+_NARROW = dict.fromkeys("iljI.,:;'|!`", 0.45)
+_SEMI = dict.fromkeys("frt()[]{}-/\\\" ", 0.6)
+_WIDE = dict.fromkeys("mwMW@%&", 1.45)
+_CHAR_WIDTHS = {**_NARROW, **_SEMI, **_WIDE}
+
+@lru_cache(maxsize=65536)
+def text_width(text: str) -> float:
+    """Display width of ``text`` in the default font; the widest line of multi-line text."""
+    widest = 0.0
+    for line in text.split("\n"):
+        width = 0.0
+        for ch in line:
+            known = _CHAR_WIDTHS.get(ch)
+            if known is not None:
+                width += known
+            elif ch.isupper():
+                width += 1.15
+            elif ord(ch) >= 0x2E80:  # CJK and other full-width scripts
+                width += 2.0
+            else:
+                width += 1.0
+        widest = max(widest, width)
+    return widest
+
+def _raw_width(value, cell) -> float:
+    """Width of a cell's displayed value in default-font digit units."""
+    if isinstance(value, str):
+        # a formula shows its result, not its text; assume a typical short value
+        return 10.0 if value.startswith("=") else text_width(value)
+    if isinstance(value, bool):
+        return 5.0
+    if isinstance(value, int):
+        return float(len(str(value)))
+    if isinstance(value, float):
+        return text_width(f"{value:.10g}")
+    if isinstance(value, (datetime, date, time, timedelta)):
+        return float(len(cell.number_format.replace("\\", "").replace('"', "")))
+    return text_width(str(value))
+
+def _font_scale(wb, font_id: int, cache: Dict[int, float]) -> float:
+    scale = cache.get(font_id)
+    if scale is None:
+        font = wb._fonts[font_id]
+        scale = (font.sz or 11) / 11
+        if font.b:
+            scale *= 1.08
+        cache[font_id] = scale
+    return scale
+
+def fit_column_widths(ws, sample_rows: Optional[int] = None, max_width: Optional[float] = None,
+                      padding: float = 2) -> int:
+    """Size every non-empty column to its widest cell in one pass over the stored cells.
+
+    With ``sample_rows`` only about that many evenly spaced rows (plus the
+    first ten, which usually hold headers) are measured. Cells merged across
+    several columns are ignored. Returns the number of columns sized.
+    """
+    wb = ws.parent
+    max_width = min(max_width or MAX_COLUMN_WIDTH, MAX_COLUMN_WIDTH)
+    stride = 1
+    if sample_rows and ws.max_row > sample_rows:
+        stride = math.ceil(ws.max_row / sample_rows)
+    spanning = {(r.min_row, r.min_col) for r in ws.merged_cells.ranges if r.max_col > r.min_col}
+    widest: Dict[tuple, float] = {}  # (column, font id) -> widest raw width
+    for (row, col), cell in ws._cells.items():
+        if stride > 1 and row > 10 and (row - 1) % stride:
+            continue
+        value = cell._value
+        if value is None or value == "" or (row, col) in spanning:
+            continue
+        style = cell._style
+        key = (col, style[0] if style is not None else 0)  # StyleArray slot 0 is fontId
+        kind = type(value)
+        if kind is str and value[0] != "=":
+            width = text_width(value)
+        elif kind is int:
+            width = len(str(value))
+        else:
+            width = _raw_width(value, cell)
+        if width > widest.get(key, 0.0):
+            widest[key] = width
+    scales: Dict[int, float] = {}
+    widths: Dict[int, float] = {}
+    for (col, font_id), width in widest.items():
+        width *= _font_scale(wb, font_id, scales)
+        if width > widths.get(col, 0.0):
+            widths[col] = width
+    for col, width in widths.items():
+        ws.column_dimensions[get_column_letter(col)].width = round(min(width + padding, max_width), 2)
+    return len(widths)
+
+# ---------- INTERNED STYLES ----------
+
+# Style attributes accepted in a style spec, with write_cell's defaults. A spec
+# only changes the attributes it names; a falsy bg_color, border or number_format
+# leaves the cell's fill, border or number format as it is.
+STYLE_DEFAULTS = {
+    "bold": False,
+    "italic": False,
+    "font_color": "000000",
+    "bg_color": None,
+    "align": "left",
+    "border": False,
+    "number_format": None,
+}
+
+_FONT_ATTRIBUTES = ("bold", "italic", "font_color")
+
+_workbook_style_ids: "WeakKeyDictionary[Any, Dict[tuple, Dict[str, int]]]" = WeakKeyDictionary()
+_style_ids_lock = threading.Lock()
+
+@lru_cache(maxsize=1024)
+def _fill(color: str) -> PatternFill:
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+@lru_cache(maxsize=64)
+def _alignment(horizontal: str) -> Alignment:
+    return Alignment(horizontal=horizontal)
+
+def style_key(spec: Dict[str, Any]) -> tuple:
+    """Normalized, hashable form of a style spec: its ``(attribute, value)`` pairs in a fixed order.
+
+    Only the attributes given are kept; unknown ones are rejected.
+    """
+    unknown = set(spec) - set(STYLE_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown style attributes {sorted(unknown)}; use {sorted(STYLE_DEFAULTS)}")
+    return tuple((name, spec[name]) for name in STYLE_DEFAULTS if name in spec)
+
+def style_ids(wb, key: tuple, current_font: int = 0) -> Dict[str, int]:
+    """StyleArray ids applying a normalized style to a cell whose font is ``current_font``.
+
+    Only the ids of the attributes in ``key`` are returned, so the cell keeps
+    the rest of its formatting; bold, italic and font_color are merged into
+    its current font. Style objects are shared process-wide and the ids are
+    remembered per workbook, so repeated writes with the same style cost a
+    dict lookup.
+    """
+    spec = dict(key)
+    changes_font = any(name in spec for name in _FONT_ATTRIBUTES)
+    cache_key = (key, current_font if changes_font else None)
+    with _style_ids_lock:
+        known = _workbook_style_ids.setdefault(wb, {})
+        ids = known.get(cache_key)
+        if ids is not None:
+            return ids
+        ids = {}
+        if changes_font:
+            ids["fontId"] = style_id(wb, "fontId", merged_font(wb._fonts[current_font], spec))
+        if "align" in spec:
+            ids["alignmentId"] = style_id(wb, "alignmentId", _alignment(spec["align"]))
+        if spec.get("bg_color"):
+            ids["fillId"] = style_id(wb, "fillId", _fill(spec["bg_color"]))
+        if spec.get("border"):
+            ids["borderId"] = style_id(wb, "borderId", THIN_BORDER)
+        number_format = spec.get("number_format")
+        if number_format:
+            if number_format in BUILTIN_FORMATS_REVERSE:
+                ids["numFmtId"] = BUILTIN_FORMATS_REVERSE[number_format]
+            else:
+                ids["numFmtId"] = wb._number_formats.add(number_format) + BUILTIN_FORMATS_MAX_SIZE
+        known[cache_key] = ids
+        return ids
@@ -0,0 +1,958 @@
+import os
+import re
+import math
+import threading
+import weakref
+import numpy as np
+from collections import defaultdict
+from datetime import date, datetime, time as dt_time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from openpyxl.formula import Tokenizer
+from openpyxl.formula.tokenizer import Token
+from openpyxl.utils.cell import range_boundaries, coordinate_to_tuple
+from openpyxl.utils.datetime import to_excel
+from openpyxl.worksheet.formula import ArrayFormula
+
+# ---------- CONFIGURATION ----------
+
+# Ranges of at least this many cells are aggregated on a NumPy grid of the sheet.
+GRID_MIN_CELLS = int(os.getenv("EXCEL_FORMULA_GRID_MIN_CELLS", "1000"))
+# Largest sheet (rows x columns of the used area) a grid is built for; bigger sheets aggregate cell by cell.
+GRID_MAX_CELLS = int(os.getenv("EXCEL_FORMULA_GRID_MAX_CELLS", "10000000"))
+
+# ---------- VALUES ----------
+
+class FormulaError(str):
+    """An Excel error value such as ``#DIV/0!``; propagates through expressions."""
+
+DIV0 = FormulaError("#DIV/0!")
+VALUE = FormulaError("#VALUE!")
+REF = FormulaError("#REF!")
+NAME = FormulaError("#NAME?")
+NA = FormulaError("#N/A")
+NUM = FormulaError("#NUM!")
+# Not an Excel error code: marks cells that take part in a circular reference.
+CYCLE = FormulaError("#CYCLE!")
+
+_ERRORS = {e: e for e in (DIV0, VALUE, REF, NAME, NA, NUM, FormulaError("#NULL!"))}
+
+CellKey = Tuple[str, int, int]  # (sheet title, row, column)
+MAX_ROW, MAX_COLUMN = 1048576, 16384
+
+
+class Ref:
+    """A cell or rectangular range reference, bound to a sheet."""
+    __slots__ = ("sheet", "min_col", "min_row", "max_col", "max_row")
+
+    def __init__(self, sheet: str, min_col: int, min_row: int, max_col: int, max_row: int):
+        self.sheet, self.min_col, self.min_row, self.max_col, self.max_row = sheet, min_col, min_row, max_col, max_row
+
+    def key(self):
+        return (self.sheet, self.min_col, self.min_row, self.max_col, self.max_row)
+
+    @property
+    def is_cell(self) -> bool:
+        return self.min_col == self.max_col and self.min_row == self.max_row
+
+    def contains(self, sheet: str, row: int, col: int) -> bool:
+        return (sheet == self.sheet and self.min_row <= row <= self.max_row
+                and self.min_col <= col <= self.max_col)
+
+
+# Cell kinds in the arrays aggregates work on.
+K_EMPTY, K_INT, K_FLOAT, K_ERROR, K_OTHER = 0, 1, 2, 3, 4
+_DATE_TYPES = (datetime, date, dt_time)
+
+def _kind(value: Any) -> int:
+    if value is None:
+        return K_EMPTY
+    kind = type(value)
+    if kind is int:
+        return K_INT  # bool is not: ranges ignore logicals, as in Excel
+    if kind is float or kind in _DATE_TYPES:
+        return K_FLOAT  # dates and times aggregate as their serial number, as in Excel
+    return K_ERROR if isinstance(value, FormulaError) else K_OTHER
+
+def _payload(value: Any) -> float:
+    """The payload stored for a cell in the numbers array: 0 unless its kind is numeric."""
+    kind = type(value)
+    if kind is int or kind is float:
+        return value
+    if kind in _DATE_TYPES:
+        return to_excel(value)
+    return 0.0
+
+
+class RangeValue:
+    """Values of a range, row-major, as handed to functions.
+
+    ``rows`` may be built lazily; aggregates only need ``arrays()``, which a
+    range read from a sheet grid answers with slices of the grid.
+    """
+    __slots__ = ("_rows", "_build", "_grid")
+
+    def __init__(self, rows: Optional[List[List[Any]]] = None, build=None, grid=None):
+        self._rows, self._build, self._grid = rows, build, grid
+
+    @property
+    def rows(self) -> List[List[Any]]:
+        if self._rows is None:
+            self._rows = self._build()
+        return self._rows
+
+    def flat(self) -> List[Any]:
+        return [v for row in self.rows for v in row]
+
+    def arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        """``(kinds, numbers)`` of the cells, flattened row-major; numbers hold 0 where the kind is not numeric."""
+        if self._grid is None:
+            values = self.flat()
+            kinds = np.fromiter((_kind(v) for v in values), np.int8, len(values))
+            numbers = np.fromiter((_payload(v) for v in values), np.float64, len(values))
+            self._grid = (kinds, numbers)
+        kinds, numbers = self._grid
+        return kinds.ravel(), numbers.ravel()
+
+    def error(self) -> Optional["FormulaError"]:
+        """The first error value in the range, if any."""
+        kinds, _ = self.arrays()
+        hits = np.flatnonzero(kinds == K_ERROR)
+        return self.flat()[hits[0]] if len(hits) else None
+
+
+def _is_formula(value: Any) -> bool:
+    return (isinstance(value, str) and value.startswith("=") and len(value) > 1) or isinstance(value, ArrayFormula)
+
+def _formula_text(value: Any) -> str:
+    return value.text if isinstance(value, ArrayFormula) else value
+
+def _to_number(value: Any) -> Any:
+    if isinstance(value, FormulaError):
+        return value
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, (datetime, date, dt_time)):
+        return to_excel(value)
+    if isinstance(value, str):
+        try:
+            return float(value) if value.strip() else VALUE
+        except ValueError:
+            return VALUE
+    return VALUE
+
+def _to_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _to_bool(value: Any) -> Any:
+    if isinstance(value, FormulaError):
+        return value
+    if isinstance(value, str):
+        if value.upper() in ("TRUE", "FALSE"):
+            return value.upper() == "TRUE"
+        return VALUE
+    number = _to_number(value)
+    return number if isinstance(number, FormulaError) else number != 0
+
+def _scalar(value: Any) -> Any:
+    """Collapse a single-cell range to its value; larger ranges are #VALUE! in scalar context."""
+    if isinstance(value, RangeValue):
+        if len(value.rows) == 1 and len(value.rows[0]) == 1:
+            return value.rows[0][0]
+        return VALUE
+    return value
+
+def _compare_key(value: Any):
+    """Excel ordering: numbers < text < logicals; text compares case-insensitively."""
+    if isinstance(value, bool):
+        return (2, value)
+    if isinstance(value, str):
+        return (1, value.lower())
+    if value is None:
+        return (0, 0)
+    return (0, _to_number(value))
+
+# ---------- PARSER ----------
+
+class _Parser:
+    """Recursive-descent parser over openpyxl's formula tokens.
+
+    Nodes are tuples: ("lit", value), ("ref", Ref), ("neg", node),
+    ("pct", node), ("bin", op, left, right), ("call", NAME, [nodes]).
+    """
+
+    _PRECEDENCE = [("=", "<>", "<", ">", "<=", ">="), ("&",), ("+", "-"), ("*", "/"), ("^",)]
+
+    def __init__(self, formula: str, sheet: str, wb):
+        self.tokens = [t for t in Tokenizer(formula).items if t.type != Token.WSPACE]
+        self.pos = 0
+        self.sheet = sheet
+        self.wb = wb
+
+    def parse(self):
+        if not self.tokens:
+            return ("lit", None)
+        node = self._binary(0)
+        if self.pos != len(self.tokens):
+            raise SyntaxError(f"Unexpected token {self.tokens[self.pos].value!r}")
+        return node
+
+    def _peek(self) -> Optional[Token]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _binary(self, level: int):
+        if level == len(self._PRECEDENCE):
+            return self._unary()
+        node = self._binary(level + 1)
+        while True:
+            token = self._peek()
+            if token is None or token.type != Token.OP_IN or token.value not in self._PRECEDENCE[level]:
+                return node
+            self.pos += 1
+            node = ("bin", token.value, node, self._binary(level + 1))
+
+    def _unary(self):
+        token = self._peek()
+        if token is not None and token.type == Token.OP_PRE:
+            self.pos += 1
+            operand = self._unary()
+            return ("neg", operand) if token.value == "-" else operand
+        node = self._primary()
+        while self._peek() is not None and self._peek().type == Token.OP_POST:
+            self.pos += 1
+            node = ("pct", node)
+        return node
+
+    def _primary(self):
+        token = self._peek()
+        if token is None:
+            raise SyntaxError("Unexpected end of formula")
+        self.pos += 1
+        if token.type == Token.OPERAND:
+            return self._operand(token)
+        if token.type == Token.PAREN and token.subtype == Token.OPEN:
+            node = self._binary(0)
+            self._expect(Token.PAREN)
+            return node
+        if token.type == Token.FUNC and token.subtype == Token.OPEN:
+            name = token.value[:-1].upper()
+            for prefix in ("_XLFN.", "_XLWS."):
+                if name.startswith(prefix):
+                    name = name[len(prefix):]
+            args = []
+            if self._peek() is not None and self._peek().type == Token.FUNC and self._peek().subtype == Token.CLOSE:
+                self.pos += 1
+                return ("call", name, args)
+            while True:
+                nxt = self._peek()
+                if nxt is not None and nxt.type == Token.SEP:
+                    args.append(("lit", None))  # empty argument, e.g. IF(A1,,2)
+                else:
+                    args.append(self._binary(0))
+                nxt = self._peek()
+                if nxt is not None and nxt.type == Token.SEP and nxt.subtype == Token.ARG:
+                    self.pos += 1
+                    continue
+                self._expect(Token.FUNC)
+                return ("call", name, args)
+        raise SyntaxError(f"Unsupported token {token.value!r}")
+
+    def _expect(self, token_type: str):
+        token = self._peek()
+        if token is None or token.type != token_type or token.subtype != Token.CLOSE:
+            raise SyntaxError("Missing closing parenthesis")
+        self.pos += 1
+
+    def _operand(self, token: Token):
+        if token.subtype == Token.NUMBER:
+            return ("lit", int(token.value) if token.value.isdigit() else float(token.value))
+        if token.subtype == Token.TEXT:
+            return ("lit", token.value[1:-1].replace('""', '"'))
+        if token.subtype == Token.LOGICAL:
+            return ("lit", token.value.upper() == "TRUE")
+        if token.subtype == Token.ERROR:
+            return ("lit", _ERRORS.get(token.value.upper(), FormulaError(token.value.upper())))
+        ref = parse_reference(token.value, self.sheet, self.wb)
+        if ref is None:
+            return ("lit", REF if "!" in token.value else NAME)
+        return ("ref", ref)
+
+
+def parse_reference(text: str, sheet: str, wb=None) -> Optional[Ref]:
+    """Parse ``A1``, ``$A$1:B2``, ``Sheet2!A:A``, ``'My Sheet'!1:3`` or a defined name."""
+    if "!" in text:
+        sheet_part, _, ref = text.rpartition("!")
+        if sheet_part.startswith("'") and sheet_part.endswith("'"):
+            sheet_part = sheet_part[1:-1].replace("''", "'")
+        sheet = sheet_part
+    else:
+        ref = text
+    ref = ref.replace("$", "")
+    try:
+        min_col, min_row, max_col, max_row = range_boundaries(ref if ":" in ref else f"{ref}:{ref}")
+    except ValueError:
+        if wb is not None and "!" not in text and text in wb.defined_names:
+            destinations = list(wb.defined_names[text].destinations)
+            if len(destinations) == 1:
+                return parse_reference(f"'{destinations[0][0]}'!{destinations[0][1]}", sheet)
+        return None
+    if wb is not None and sheet not in wb.sheetnames:
+        return None
+    if min_row is None:  # whole columns
+        min_row, max_row = 1, MAX_ROW
+    if min_col is None:  # whole rows
+        min_col, max_col = 1, MAX_COLUMN
+    return Ref(sheet, min_col, min_row, max_col, max_row)
+
+def iter_refs(node) -> Iterable[Ref]:
+    kind = node[0]
+    if kind == "ref":
+        yield node[1]
+    elif kind in ("neg", "pct"):
+        yield from iter_refs(node[1])
+    elif kind == "bin":
+        yield from iter_refs(node[2])
+        yield from iter_refs(node[3])
+    elif kind == "call":
+        for arg in node[2]:
+            yield from iter_refs(arg)
+
+# ---------- FUNCTIONS ----------
+
+def _numbers(args: List[Any]) -> Any:
+    """``(numbers, all_int)`` of all arguments as one array: ranges contribute numeric cells only, scalars are coerced."""
+    parts, all_int = [], True
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            kinds, numbers = arg.arrays()
+            if (kinds == K_ERROR).any():
+                return arg.error()
+            parts.append(numbers[(kinds == K_INT) | (kinds == K_FLOAT)])
+            all_int = all_int and not (kinds == K_FLOAT).any()
+        else:
+            number = _to_number(arg)
+            if isinstance(number, FormulaError):
+                return number
+            parts.append(np.array([number], dtype=np.float64))
+            all_int = all_int and type(number) is int
+    return (np.concatenate(parts) if parts else np.empty(0)), all_int
+
+def _number(value: float, all_int: bool) -> Any:
+    return int(value) if all_int and abs(value) < 2 ** 53 else float(value)
+
+def _fn_sum(args):
+    numbers = _numbers(args)
+    if isinstance(numbers, FormulaError):
+        return numbers
+    values, all_int = numbers
+    return _number(values.sum(), all_int)
+
+def _fn_average(args):
+    numbers = _numbers(args)
+    if isinstance(numbers, FormulaError):
+        return numbers
+    values, _ = numbers
+    return float(values.mean()) if len(values) else DIV0
+
+def _fn_min(args):
+    numbers = _numbers(args)
+    if isinstance(numbers, FormulaError):
+        return numbers
+    values, all_int = numbers
+    return _number(values.min(), all_int) if len(values) else 0
+
+def _fn_max(args):
+    numbers = _numbers(args)
+    if isinstance(numbers, FormulaError):
+        return numbers
+    values, all_int = numbers
+    return _number(values.max(), all_int) if len(values) else 0
+
+def _fn_count(args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            kinds, _ = arg.arrays()
+            count += int(np.count_nonzero((kinds == K_INT) | (kinds == K_FLOAT)))
+        elif not isinstance(_to_number(arg), FormulaError):
+            count += 1
+    return count
+
+def _fn_counta(args):
+    count = 0
+    for arg in args:
+        if isinstance(arg, RangeValue):
+            kinds, _ = arg.arrays()
+            count += int(np.count_nonzero(kinds != K_EMPTY))
+        elif arg is not None:
+            count += 1
+    return count
+
+def _fn_and(args):
+    result = True
+    for arg in args:
+        for v in (arg.flat() if isinstance(arg, RangeValue) else [arg]):
+            flag = _to_bool(v)
+            if isinstance(flag, FormulaError):
+                return flag
+            result = result and flag
+    return result
+
+def _fn_or(args):
+    result = False
+    for arg in args:
+        for v in (arg.flat() if isinstance(arg, RangeValue) else [arg]):
+            flag = _to_bool(v)
+            if isinstance(flag, FormulaError):
+                return flag
+            result = result or flag
+    return result
+
+def _fn_not(args):
+    flag = _to_bool(_scalar(args[0]))
+    return flag if isinstance(flag, FormulaError) else not flag
+
+def _fn_abs(args):
+    number = _to_number(_scalar(args[0]))
+    return number if isinstance(number, FormulaError) else abs(number)
+
+def _fn_round(args):
+    number = _to_number(_scalar(args[0]))
+    digits = _to_number(_scalar(args[1])) if len(args) > 1 else 0
+    for v in (number, digits):
+        if isinstance(v, FormulaError):
+            return v
+    # Excel rounds half away from zero
+    factor = 10 ** int(digits)
+    result = math.floor(abs(number) * factor + 0.5) / factor
+    return math.copysign(result, number)
+
+def _fn_concatenate(args):
+    parts = []
+    for arg in args:
+        value = _scalar(arg)
+        if isinstance(value, FormulaError):
+            return value
+        parts.append(_to_text(value))
+    return "".join(parts)
+
+def _lookup_equal(a: Any, b: Any) -> bool:
+    if isinstance(a, str) and isinstance(b, str):
+        return a.lower() == b.lower()
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    return a == b
+
+def _match_position(value: Any, values: List[Any], match_type: int) -> Any:
+    """1-based position of ``value`` in ``values`` following MATCH semantics, or #N/A."""
+    if match_type == 0:
+        for i, v in enumerate(values):
+            if _lookup_equal(v, value):
+                return i + 1
+        return NA
+    target = _compare_key(value)
+    best = None
+    for i, v in enumerate(values):
+        if v is None or _compare_key(v)[0] != target[0]:
+            continue
+        key = _compare_key(v)
+        if match_type > 0:
+            if key > target:
+                break
+            best = i + 1
+        else:
+            if key < target:
+                break
+            best = i + 1
+    return NA if best is None else best
+
+def _fn_vlookup(args):
+    if len(args) < 3 or not isinstance(args[1], RangeValue):
+        return VALUE
+    value = _scalar(args[0])
+    col_index = _to_number(_scalar(args[2]))
+    approximate = _to_bool(_scalar(args[3])) if len(args) > 3 and args[3] is not None else True
+    for v in (value, col_index, approximate):
+        if isinstance(v, FormulaError):
+            return v
+    rows = args[1].rows
+    col_index = int(col_index)
+    if col_index < 1:
+        return VALUE
+    if rows and col_index > len(rows[0]):
+        return REF
+    position = _match_position(value, [row[0] for row in rows], 1 if approximate else 0)
+    if isinstance(position, FormulaError):
+        return position
+    return rows[position - 1][col_index - 1]
+
+def _fn_match(args):
+    if len(args) < 2 or not isinstance(args[1], RangeValue):
+        return NA
+    value = _scalar(args[0])
+    match_type = _to_number(_scalar(args[2])) if len(args) > 2 else 1
+    for v in (value, match_type):
+        if isinstance(v, FormulaError):
+            return v
+    values = args[1].flat()
+    if len(args[1].rows) > 1 and len(args[1].rows[0]) > 1:
+        return NA  # lookup array must be one row or one column
+    return _match_position(value, values, int(match_type))
+
+def _fn_index(args):
+    if not isinstance(args[0], RangeValue):
+        return VALUE
+    rows = args[0].rows
+    row = _to_number(_scalar(args[1])) if len(args) > 1 else 0
+    col = _to_number(_scalar(args[2])) if len(args) > 2 else 0
+    for v in (row, col):
+        if isinstance(v, FormulaError):
+            return v
+    row, col = int(row), int(col)
+    if len(rows) == 1 and len(args) == 2:  # single row: the one index selects the column
+        row, col = 1, row
+    elif rows and len(rows[0]) == 1 and col == 0:
+        col = 1
+    if row < 1 or col < 1 or row > len(rows) or col > len(rows[0]):
+        return REF
+    return rows[row - 1][col - 1]
+
+_FUNCTIONS = {
+    "SUM": _fn_sum,
+    "AVERAGE": _fn_average,
+    "MIN": _fn_min,
+    "MAX": _fn_max,
+    "COUNT": _fn_count,
+    "COUNTA": _fn_counta,
+    "AND": _fn_and,
+    "OR": _fn_or,
+    "NOT": _fn_not,
+    "ABS": _fn_abs,
+    "ROUND": _fn_round,
+    "CONCATENATE": _fn_concatenate,
+    "VLOOKUP": _fn_vlookup,
+    "MATCH": _fn_match,
+    "INDEX": _fn_index,
+}
+
+# ---------- ENGINE ----------
+
+class _Grid:
+    """Kinds and numbers of a sheet's cells as 2-D arrays, for vectorized range aggregates.
+
+    ``rows`` x ``cols`` is the used area; the arrays grow by doubling.
+    """
+    __slots__ = ("kinds", "numbers", "rows", "cols")
+
+    def __init__(self, rows: int, cols: int):
+        self.kinds = np.zeros((rows, cols), np.int8)
+        self.numbers = np.zeros((rows, cols), np.float64)
+        self.rows, self.cols = rows, cols
+
+    def set(self, row: int, col: int, value: Any) -> bool:
+        """Record one cell; False when the sheet outgrew GRID_MAX_CELLS."""
+        height, width = self.kinds.shape
+        if row > height or col > width:
+            height, width = max(height, row, min(2 * height, MAX_ROW)), max(width, col)
+            if height * width > GRID_MAX_CELLS:
+                return False
+            kinds, numbers = np.zeros((height, width), np.int8), np.zeros((height, width), np.float64)
+            kinds[:self.kinds.shape[0], :self.kinds.shape[1]] = self.kinds
+            numbers[:self.numbers.shape[0], :self.numbers.shape[1]] = self.numbers
+            self.kinds, self.numbers = kinds, numbers
+        self.kinds[row - 1, col - 1] = _kind(value)
+        self.numbers[row - 1, col - 1] = _payload(value)
+        self.rows, self.cols = max(self.rows, row), max(self.cols, col)
+        return True
+
+
+class FormulaEngine:
+    """Evaluates the formulas of one workbook.
+
+    The dependency graph is built once from every formula in the workbook.
+    Computed values are memoized; ``cells_changed`` drops the memoized values
+    of the changed cells and everything depending on them, so the next read
+    recomputes only that dirty subgraph. Aggregates over large ranges slice a
+    per-sheet grid of cell kinds and numbers, built in one pass over the
+    sheet and kept current by ``cells_changed`` and by every computed value.
+    """
+
+    def __init__(self, wb):
+        self.wb = wb
+        self.lock = threading.RLock()
+        self._parsed: Dict[CellKey, Any] = {}
+        self._precedents: Dict[CellKey, List[Ref]] = {}
+        self._cell_dependents: Dict[CellKey, Set[CellKey]] = defaultdict(set)
+        self._range_dependents: Dict[tuple, Tuple[Ref, Set[CellKey]]] = {}
+        self._formulas_by_sheet: Dict[str, Set[CellKey]] = defaultdict(set)
+        self._range_formulas: Dict[tuple, List[CellKey]] = {}
+        self._values: Dict[CellKey, Any] = {}
+        self._grids: Dict[str, _Grid] = {}
+        for ws in wb.worksheets:
+            for (row, col), cell in ws._cells.items():
+                if _is_formula(cell._value):
+                    self._add_formula((ws.title, row, col), _formula_text(cell._value))
+
+    # ---------- graph maintenance ----------
+
+    def _add_formula(self, key: CellKey, formula: str):
+        try:
+            node = _Parser(formula, key[0], self.wb).parse()
+        except (SyntaxError, ValueError, IndexError):
+            node = ("lit", NAME)
+        refs = list(iter_refs(node))
+        self._parsed[key] = node
+        self._precedents[key] = refs
+        self._formulas_by_sheet[key[0]].add(key)
+        self._range_formulas.clear()
+        for ref in refs:
+            if ref.is_cell:
+                self._cell_dependents[(ref.sheet, ref.min_row, ref.min_col)].add(key)
+            else:
+                self._range_dependents.setdefault(ref.key(), (ref, set()))[1].add(key)
+
+    def _remove_formula(self, key: CellKey):
+        if key not in self._parsed:
+            return
+        for ref in self._precedents.pop(key):
+            if ref.is_cell:
+                self._cell_dependents[(ref.sheet, ref.min_row, ref.min_col)].discard(key)
+            else:
+                entry = self._range_dependents.get(ref.key())
+                if entry is not None:
+                    entry[1].discard(key)
+                    if not entry[1]:
+                        del self._range_dependents[ref.key()]
+        del self._parsed[key]
+        self._formulas_by_sheet[key[0]].discard(key)
+        self._range_formulas.clear()
+
+    def _dependents_of(self, key: CellKey) -> Set[CellKey]:
+        dependents = set(self._cell_dependents.get(key, ()))
+        sheet, row, col = key
+        for ref, cells in self._range_dependents.values():
+            if ref.contains(sheet, row, col):
+                dependents |= cells
+        return dependents
+
+    def cells_changed(self, sheet: str, coords: Iterable[Tuple[int, int]]):
+        """Update the graph for rewritten cells and invalidate their dependents."""
+        with self.lock:
+            ws = self.wb[sheet]
+            queue = []
+            for row, col in coords:
+                key = (sheet, row, col)
+                self._remove_formula(key)
+                cell = ws._cells.get((row, col))
+                if cell is not None and _is_formula(cell._value):
+                    self._add_formula(key, _formula_text(cell._value))
+                queue.append(key)
+            self._update_grid(sheet, [(row, col, ws._cells.get((row, col))) for row, col in coords])
+            seen = set(queue)
+            while queue:
+                key = queue.pop()
+                self._values.pop(key, None)
+                for dependent in self._dependents_of(key):
+                    if dependent not in seen:
+                        seen.add(dependent)
+                        queue.append(dependent)
+
+    # ---------- evaluation ----------
+
+    def _formula_cells_in(self, ref: Ref) -> List[CellKey]:
+        cached = self._range_formulas.get(ref.key())
+        if cached is None:
+            cached = [key for key in self._formulas_by_sheet.get(ref.sheet, ())
+                      if ref.contains(*key)]
+            self._range_formulas[ref.key()] = cached
+        return cached
+
+    def _formula_precedents(self, key: CellKey) -> List[CellKey]:
+        result = []
+        for ref in self._precedents.get(key, ()):
+            if ref.is_cell:
+                target = (ref.sheet, ref.min_row, ref.min_col)
+                if target in self._parsed:
+                    result.append(target)
+            else:
+                result.extend(self._formula_cells_in(ref))
+        return result
+
+    def _ensure(self, key: CellKey):
+        """Compute ``key`` after its formula precedents, iteratively (no recursion limit)."""
+        if key in self._values or key not in self._parsed:
+            return
+        stack = [(key, False)]
+        in_progress = set()
+        while stack:
+            current, expanded = stack.pop()
+            if current in self._values:
+                continue
+            if expanded:
+                in_progress.discard(current)
+                self._store(current, self._evaluate_node(self._parsed[current], current[0]))
+                continue
+            in_progress.add(current)
+            stack.append((current, True))
+            for precedent in self._formula_precedents(current):
+                if precedent in self._values:
+                    continue
+                if precedent in in_progress:
+                    self._store(precedent, CYCLE)
+                    continue
+                stack.append((precedent, False))
+
+    def _cell_value(self, sheet: str, row: int, col: int) -> Any:
+        key = (sheet, row, col)
+        if key in self._parsed:
+            if key not in self._values:
+                self._ensure(key)
+            return self._values[key]
+        cell = self.wb[sheet]._cells.get((row, col))
+        return None if cell is None else cell._value
+
+    def _store(self, key: CellKey, value: Any):
+        self._values[key] = value
+        grid = self._grids.get(key[0])
+        if grid is not None and not grid.set(key[1], key[2], value):
+            del self._grids[key[0]]
+
+    def _grid(self, ws, rows: int, cols: int) -> Optional["_Grid"]:
+        """The grid of ``ws`` (whose used area is ``rows`` x ``cols``), built in one pass on first use."""
+        grid = self._grids.get(ws.title)
+        if grid is None and rows * cols <= GRID_MAX_CELLS:
+            grid = _Grid(rows, cols)
+            sheet, values = ws.title, self._values
+            for (row, col), cell in ws._cells.items():
+                # formula cells hold their computed value once known; the rest arrive through _store
+                grid.set(row, col, values.get((sheet, row, col)) if (sheet, row, col) in self._parsed else cell._value)
+            self._grids[ws.title] = grid
+        return grid
+
+    def _update_grid(self, sheet: str, cells: List[Tuple[int, int, Any]]):
+        grid = self._grids.get(sheet)
+        if grid is None:
+            return
+        for row, col, cell in cells:
+            value = None if cell is None or (sheet, row, col) in self._parsed else cell._value
+            if not grid.set(row, col, value):
+                del self._grids[sheet]
+                return
+
+    def _range_value(self, ref: Ref, clamp: bool = True) -> RangeValue:
+        """Gather a range without creating cells: large ranges as a grid slice, rows built only if needed."""
+        for key in self._formula_cells_in(ref):
+            if key not in self._values:
+                self._ensure(key)
+        max_row, max_col = ref.max_row, ref.max_col
+        grid = None
+        if clamp:
+            # Whole-column/row and oversized references only cover the used part of the sheet;
+            # openpyxl's max_row/max_column scan every cell, a grid knows its used area.
+            ws = self.wb[ref.sheet]
+            grid = self._grids.get(ref.sheet)
+            rows, cols = (grid.rows, grid.cols) if grid is not None else (ws.max_row, ws.max_column)
+            max_row, max_col = min(max_row, rows), min(max_col, cols)
+            if max(max_row - ref.min_row + 1, 0) * max(max_col - ref.min_col + 1, 0) >= GRID_MIN_CELLS:
+                grid = self._grid(ws, rows, cols)
+            else:
+                grid = None
+        build = lambda: self._range_rows(ref, max_row, max_col)
+        if grid is None:
+            return RangeValue(build())
+        window = (slice(ref.min_row - 1, max_row), slice(ref.min_col - 1, max_col))
+        return RangeValue(build=build, grid=(grid.kinds[window], grid.numbers[window]))
+
+    def _range_rows(self, ref: Ref, max_row: int, max_col: int) -> List[List[Any]]:
+        """One pass over the sheet's cell store."""
+        cells = self.wb[ref.sheet]._cells
+        sheet, values = ref.sheet, self._values
+        rows = []
+        for row in range(ref.min_row, max_row + 1):
+            out = []
+            for col in range(ref.min_col, max_col + 1):
+                cell = cells.get((row, col))
+                if cell is None:
+                    out.append(None)
+                elif (sheet, row, col) in values:
+                    out.append(values[(sheet, row, col)])
+                else:
+                    out.append(cell._value)
+            rows.append(out)
+        return rows
+
+    def _evaluate_node(self, node, sheet: str) -> Any:
+        kind = node[0]
+        if kind == "lit":
+            return node[1]
+        if kind == "ref":
+            ref = node[1]
+            if ref.is_cell:
+                return self._cell_value(ref.sheet, ref.min_row, ref.min_col)
+            return self._range_value(ref)
+        if kind == "neg":
+            value = _to_number(_scalar(self._evaluate_node(node[1], sheet)))
+            return value if isinstance(value, FormulaError) else -value
+        if kind == "pct":
+            value = _to_number(_scalar(self._evaluate_node(node[1], sheet)))
+            return value if isinstance(value, FormulaError) else value / 100
+        if kind == "bin":
+            return self._binary(node[1], _scalar(self._evaluate_node(node[2], sheet)),
+                                _scalar(self._evaluate_node(node[3], sheet)))
+        if kind == "call":
+            return self._call(node[1], node[2], sheet)
+        return VALUE
+
+    def _binary(self, op: str, left: Any, right: Any) -> Any:
+        for v in (left, right):
+            if isinstance(v, FormulaError):
+                return v
+        if op == "&":
+            return _to_text(left) + _to_text(right)
+        if op in ("=", "<>", "<", ">", "<=", ">="):
+            if left is None:
+                left = "" if isinstance(right, str) else (False if isinstance(right, bool) else 0)
+            if right is None:
+                right = "" if isinstance(left, str) else (False if isinstance(left, bool) else 0)
+            a, b = _compare_key(left), _compare_key(right)
+            return {"=": a == b, "<>": a != b, "<": a < b, ">": a > b, "<=": a <= b, ">=": a >= b}[op]
+        a, b = _to_number(left), _to_number(right)
+        for v in (a, b):
+            if isinstance(v, FormulaError):
+                return v
+        try:
+            if op == "+":
+                return a + b
+            if op == "-":
+                return a - b
+            if op == "*":
+                return a * b
+            if op == "/":
+                return DIV0 if b == 0 else a / b
+            if op == "^":
+                return a ** b
+        except (OverflowError, ZeroDivisionError, ValueError):
+            return NUM
+        return VALUE
+
+    def _call(self, name: str, arg_nodes: List[Any], sheet: str) -> Any:
+        # Lazily evaluated functions
+        if name == "IF":
+            if not arg_nodes:
+                return VALUE
+            condition = _to_bool(_scalar(self._evaluate_node(arg_nodes[0], sheet)))
+            if isinstance(condition, FormulaError):
+                return condition
+            if condition:
+                return _scalar(self._evaluate_node(arg_nodes[1], sheet)) if len(arg_nodes) > 1 else True
+            return _scalar(self._evaluate_node(arg_nodes[2], sheet)) if len(arg_nodes) > 2 else False
+        if name == "IFERROR":
+            value = _scalar(self._evaluate_node(arg_nodes[0], sheet))
+            if isinstance(value, FormulaError):
+                return _scalar(self._evaluate_node(arg_nodes[1], sheet)) if len(arg_nodes) > 1 else None
+            return value
+        function = _FUNCTIONS.get(name)
+        if function is None:
+            return NAME
+        args = [self._evaluate_node(arg, sheet) for arg in arg_nodes]
+        try:
+            return function(args)
+        except (IndexError, TypeError, ValueError, OverflowError):
+            return VALUE
+
+    def value(self, sheet: str, coordinate: str) -> Any:
+        """Computed value of one cell (the stored value for non-formula cells)."""
+        if sheet not in self.wb.sheetnames:
+            raise KeyError(f"Worksheet {sheet} does not exist.")
+        row, col = coordinate_to_tuple(coordinate.replace("$", ""))
+        with self.lock:
+            return self._cell_value(sheet, row, col)
+
+    def range_values(self, sheet: str, min_col: int, min_row: int, max_col: int, max_row: int) -> List[List[Any]]:
+        if sheet not in self.wb.sheetnames:
+            raise KeyError(f"Worksheet {sheet} does not exist.")
+        with self.lock:
+            return self._range_value(Ref(sheet, min_col, min_row, max_col, max_row), clamp=False).rows
+
+
+_engines: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def get_engine(wb) -> FormulaEngine:
+    """The engine of ``wb``, building its dependency graph on first use."""
+    with _engines_lock:
+        engine = _engines.get(wb)
+        if engine is None:
+            engine = FormulaEngine(wb)
+            _engines[wb] = engine
+        return engine
+
+def notify_cells_changed(wb, sheet: str, coords: Iterable[Tuple[int, int]]):
+    """Tell the engine of ``wb`` (if one was built) which cells were rewritten."""
+    engine = _engines.get(wb)
+    if engine is not None:
+        engine.cells_changed(sheet, coords)
+
+def discard_engine(wb):
+    """Drop the engine after structural changes (sheets added, renamed, deleted, merges)."""
+    with _engines_lock:
+        _engines.pop(wb, None)
+
+def _quote_sheet(name: str) -> str:
+    if re.fullmatch(r"[A-Za-z_][A-Za-z0-9_.]*", name) and not re.fullmatch(r"[A-Za-z]{1,3}[0-9]+|[RrCc][0-9]*", name):
+        return name
+    return "'" + name.replace("'", "''") + "'"
+
+def _rename_in_formula(formula: str, old: str, new: str) -> str:
+    tokenizer = Tokenizer(formula)
+    changed = False
+    for token in tokenizer.items:
+        if token.type == Token.OPERAND and token.subtype == Token.RANGE and "!" in token.value:
+            sheet_part, _, address = token.value.rpartition("!")
+            if sheet_part.startswith("'") and sheet_part.endswith("'"):
+                sheet_part = sheet_part[1:-1].replace("''", "'")
+            if sheet_part.lower() == old.lower():  # sheet names are case-insensitive
+                token.value = f"{_quote_sheet(new)}!{address}"
+                changed = True
+    return tokenizer.render() if changed else formula
+
+def rename_sheet_references(wb, old: str, new: str) -> int:
+    """Point formulas and defined names that refer to sheet ``old`` at ``new``, as Excel does on rename.
+
+    Returns the number of formulas rewritten. References inside data
+    validations, conditional formats and charts are left as they are.
+    """
+    rewritten = 0
+    needles = (old.lower() + "!", old.replace("'", "''").lower() + "'!")
+    for ws in wb.worksheets:
+        for cell in ws._cells.values():
+            value = cell._value
+            if not _is_formula(value):
+                continue
+            text = _formula_text(value)
+            if not any(needle in text.lower() for needle in needles):
+                continue
+            renamed = _rename_in_formula(text, old, new)
+            if renamed != text:
+                if isinstance(value, ArrayFormula):
+                    value.text = renamed
+                else:
+                    cell._value = renamed
+                rewritten += 1
+    for names in [wb.defined_names] + [ws.defined_names for ws in wb.worksheets]:
+        for defined in names.values():
+            if defined.attr_text and "!" in defined.attr_text:
+                defined.attr_text = _rename_in_formula("=" + defined.attr_text, old, new)[1:]
+    return rewritten
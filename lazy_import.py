@@ -0,0 +1,22 @@
+import sys
+import importlib
+
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+
+    The servers use it for openpyxl, NumPy and the Excel layer so that
+    ``initialize`` and ``list_tools`` are answered before those load.
+    ``importlib.import_module`` waits on the per-module import lock, so
+    concurrent first accesses from worker threads import the module once.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+
+    @property
+    def loaded(self) -> bool:
+        return self._name in sys.modules
+
+    def __getattr__(self, attr: str):
+        return getattr(importlib.import_module(self._name), attr)
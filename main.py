@@ -1,19 +1,80 @@
 import os
+import json
+import asyncio
+import inspect
+import anyio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
 from dotenv import load_dotenv
-from excel_fucntion import *
+from directory_index import get_directory_index
+from op_journal import pending_journals
+from lazy_import import LazyModule
+from metrics import metrics
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp import Context
 from pydantic import Field
 
+# openpyxl, NumPy and the Excel layer load on the first tool call, after the handshake.
+xl = LazyModule("excel_fucntion")
+pager = LazyModule("range_pager")
+analytics = LazyModule("range_analytics")
+diff = LazyModule("workbook_diff")
+search = LazyModule("cell_index")
+fanout = LazyModule("multi_file")
+export = LazyModule("sheet_export")
+cache = LazyModule("workbook_cache")
+
 load_dotenv()
 EXCEL_FILES_DIR = os.getenv("EXCEL_FILES_DIR", "./excel_files")
+# Worker threads running tool calls, and how many calls may be queued or running at once.
+EXCEL_WORKERS = int(os.getenv("EXCEL_WORKERS", "4"))
+EXCEL_MAX_PENDING = int(os.getenv("EXCEL_MAX_PENDING", "64"))
+# Seconds a client waits for a tool call before getting a timeout error (0 waits forever).
+EXCEL_REQUEST_TIMEOUT = float(os.getenv("EXCEL_REQUEST_TIMEOUT", "0"))
+# stdio (one client per process), or streamable-http / sse (many clients sharing this process).
+EXCEL_TRANSPORT = os.getenv("EXCEL_TRANSPORT", "stdio")
+EXCEL_HTTP_HOST = os.getenv("EXCEL_HTTP_HOST", "127.0.0.1")
+EXCEL_HTTP_PORT = int(os.getenv("EXCEL_HTTP_PORT", "8000"))
+
+mcp = FastMCP("Excel MCP Server", dependencies=["openpyxl", "python-dotenv"],
+              host=EXCEL_HTTP_HOST, port=EXCEL_HTTP_PORT)
+
+_executor = ThreadPoolExecutor(max_workers=EXCEL_WORKERS, thread_name_prefix="excel-tool")
+_pending = 0
+
+def _call_finished(future):
+    global _pending
+    _pending -= 1
 
-mcp = FastMCP("Excel MCP Server", dependencies=["openpyxl", "python-dotenv"])
+def _offloaded(fn):
+    """Run a blocking tool on the worker pool so the event loop keeps serving other clients."""
+    if inspect.iscoroutinefunction(fn):
+        return fn
+
+    @wraps(fn)
+    async def wrapper(*args, **kwargs):
+        global _pending
+        if _pending >= EXCEL_MAX_PENDING:
+            raise RuntimeError(f"Server busy: {_pending} requests pending, try again later")
+        _pending += 1
+        future = asyncio.get_running_loop().run_in_executor(_executor, partial(fn, *args, **kwargs))
+        # The slot is released when the worker finishes, even if the client stopped waiting.
+        future.add_done_callback(_call_finished)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), EXCEL_REQUEST_TIMEOUT or None)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Timed out after {EXCEL_REQUEST_TIMEOUT:g}s: {fn.__name__} is still running "
+                               "and its changes may still be applied") from None
+    return wrapper
+
+def tool():
+    """``mcp.tool()`` running on the worker pool, timing each call per phase when EXCEL_METRICS is enabled."""
+    register = mcp.tool()
+    return lambda fn: register(_offloaded(metrics.instrument(fn)))
 
 # Resource: List all Excel files
 def list_excel_files() -> list[str]:
-    files = [f for f in os.listdir(EXCEL_FILES_DIR) if f.endswith(".xlsx") or f.endswith(".xlsm")]
-    return files
+    return get_directory_index(EXCEL_FILES_DIR).names()
 
 @mcp.resource("excel-files://list")
 def resource_list_excel_files() -> list[str]:
@@ -21,27 +82,59 @@ def resource_list_excel_files() -> list[str]:
 
 @mcp.resource("excel-sheetnames://{filename}")
 def resource_list_sheets(filename: str) -> list[str]:
-    return list_sheets(os.path.join(EXCEL_FILES_DIR, filename))
+    return xl.list_sheets(os.path.join(EXCEL_FILES_DIR, filename))
+
+@mcp.resource("excel-metrics://summary")
+def resource_metrics() -> dict:
+    return metrics.snapshot()
 
-@mcp.tool()
+@mcp.resource("excel-metrics://prometheus", mime_type="text/plain")
+def resource_metrics_prometheus() -> str:
+    return metrics.prometheus()
+
+def _source_path(path: str) -> str | None:
+    return os.path.join(EXCEL_FILES_DIR, path) if path else None
+
+@tool()
+def tool_list_excel_files(
+    prefix: str = Field(description="Only list files whose name starts with this prefix", default=""),
+    cursor: str = Field(description="The next_cursor of the previous page; leave empty for the first page", default=""),
+    limit: int = Field(description="Maximum number of files to return", default=100),
+    include_sheets: bool = Field(description="Include the sheet names of each listed file", default=False)
+) -> dict:
+    """List Excel files with size and modification time, page by page. Returns files plus a next_cursor."""
+    return get_directory_index(EXCEL_FILES_DIR).list(prefix, cursor or None, limit, include_sheets)
+
+@tool()
 def tool_create_excel_file(
     filename: str = Field(description="The name of the Excel file to create"),
-    sheet_name: str = Field(description="The name of the initial sheet", default="Sheet1")
+    sheet_name: str = Field(description="The name of the initial sheet", default="Sheet1"),
+    data: list[list] | None = Field(description="Optional rows (2D array) to fill the sheet with", default=None),
+    csv_path: str = Field(description="Optional CSV file (relative to the Excel directory) to fill the sheet from", default=""),
+    ndjson_path: str = Field(description="Optional NDJSON file (relative to the Excel directory) to fill the sheet from", default=""),
+    header: list[str] | None = Field(description="Optional header row written in bold above the data", default=None),
+    column_types: list[str] | None = Field(description="Optional per-column types for text input: str, int, float, bool, date, datetime, auto", default=None)
 ) -> str:
-    """Create a new Excel file with an initial sheet."""
+    """Create a new Excel file with an initial sheet, optionally bulk-loading rows in streaming mode."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return create_excel_file(path, sheet_name)
+    return xl.create_excel_file(path, sheet_name, data, _source_path(csv_path), _source_path(ndjson_path), header, column_types)
 
-@mcp.tool()
+@tool()
 def tool_add_sheet(
     filename: str = Field(description="The Excel file to add a sheet to"),
-    sheet_name: str = Field(description="The name of the new sheet")
+    sheet_name: str = Field(description="The name of the new sheet"),
+    data: list[list] | None = Field(description="Optional rows (2D array) to fill the sheet with", default=None),
+    csv_path: str = Field(description="Optional CSV file (relative to the Excel directory) to fill the sheet from", default=""),
+    ndjson_path: str = Field(description="Optional NDJSON file (relative to the Excel directory) to fill the sheet from", default=""),
+    header: list[str] | None = Field(description="Optional header row written in bold above the data", default=None),
+    column_types: list[str] | None = Field(description="Optional per-column types for text input: str, int, float, bool, date, datetime, auto", default=None)
 ) -> str:
-    """Add a new sheet to an existing Excel file."""
+    """Add a new sheet to an existing Excel file, optionally filled with rows (at most EXCEL_APPEND_MAX_CELLS cells;
+    use tool_create_excel_file, which streams, for larger imports)."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return add_sheet(path, sheet_name)
+    return xl.add_sheet(path, sheet_name, data, _source_path(csv_path), _source_path(ndjson_path), header, column_types)
 
-@mcp.tool()
+@tool()
 def tool_rename_sheet(
     filename: str = Field(description="The Excel file containing the sheet"),
     old_name: str = Field(description="The current name of the sheet"),
@@ -49,39 +142,61 @@ def tool_rename_sheet(
 ) -> str:
     """Rename a sheet in an Excel file."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return rename_sheet(path, old_name, new_name)
+    return xl.rename_sheet(path, old_name, new_name)
 
-@mcp.tool()
+@tool()
 def tool_delete_sheet(
     filename: str = Field(description="The Excel file to delete a sheet from"),
     sheet_name: str = Field(description="The name of the sheet to delete")
 ) -> str:
     """Delete a sheet from an Excel file."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return delete_sheet(path, sheet_name)
+    return xl.delete_sheet(path, sheet_name)
 
-@mcp.tool()
+@tool()
 def tool_write_cell(
     filename: str = Field(description="The Excel file to write to"),
     sheet: str = Field(description="The sheet to write to"),
     cell: str = Field(description="The cell address (e.g. A1)"),
-    value: str = Field(description="The value to write")
+    value: str = Field(description="The value to write"),
+    bold: bool = Field(description="Bold font", default=False),
+    italic: bool = Field(description="Italic font", default=False),
+    font_color: str = Field(description="Font color as hex RGB (e.g. FF0000)", default="000000"),
+    bg_color: str = Field(description="Solid background color as hex RGB; empty for none", default=""),
+    align: str = Field(description="Horizontal alignment: left, center, right, ...", default="left")
 ) -> str:
     """Write a value to a specific cell in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return write_cell(path, sheet, cell, value)
+    return xl.write_cell(path, sheet, cell, value, bold, italic, font_color, bg_color or None, align)
+
+@tool()
+def tool_write_range(
+    filename: str = Field(description="The Excel file to write to"),
+    sheet: str = Field(description="The sheet to write to"),
+    start_cell: str = Field(description="Top-left cell of the block (e.g. A1)"),
+    values: list[list] = Field(description="Rows of values (2D array) to write"),
+    styles: list[dict] | None = Field(description=(
+        "Optional style map. Each entry targets {\"range\": \"A1:D1\"}, {\"columns\": [\"B\"]} or {\"rows\": [1]} "
+        "(columns/rows limited to the written block) and sets any of bold, italic, font_color, bg_color, "
+        "align, border, number_format; attributes no entry sets are left as they are. Later entries override "
+        "earlier ones"), default=None)
+) -> str:
+    """Write a block of values and its formatting in one call; each distinct style is created once."""
+    path = os.path.join(EXCEL_FILES_DIR, filename)
+    return xl.write_range(path, sheet, start_cell, values, styles)
 
-@mcp.tool()
+@tool()
 def tool_read_cell(
     filename: str = Field(description="The Excel file to read from"),
     sheet: str = Field(description="The sheet to read from"),
-    cell: str = Field(description="The cell address (e.g. A1)")
+    cell: str = Field(description="The cell address (e.g. A1)"),
+    computed: bool = Field(description="Evaluate formulas and return their result instead of the formula text", default=False)
 ) -> str:
     """Read the value from a specific cell in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return str(read_cell(path, sheet, cell))
+    return str(xl.read_cell(path, sheet, cell, computed))
 
-@mcp.tool()
+@tool()
 def tool_merge_cells(
     filename: str = Field(description="The Excel file to modify"),
     sheet: str = Field(description="The sheet to merge cells in"),
@@ -89,9 +204,9 @@ def tool_merge_cells(
 ) -> str:
     """Merge a range of cells in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return merge_cells(path, sheet, cell_range)
+    return xl.merge_cells(path, sheet, cell_range)
 
-@mcp.tool()
+@tool()
 def tool_unmerge_cells(
     filename: str = Field(description="The Excel file to modify"),
     sheet: str = Field(description="The sheet to unmerge cells in"),
@@ -99,9 +214,9 @@ def tool_unmerge_cells(
 ) -> str:
     """Unmerge a range of cells in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return unmerge_cells(path, sheet, cell_range)
+    return xl.unmerge_cells(path, sheet, cell_range)
 
-@mcp.tool()
+@tool()
 def tool_write_row(
     filename: str = Field(description="The Excel file to write to"),
     sheet: str = Field(description="The sheet to write to"),
@@ -110,9 +225,9 @@ def tool_write_row(
 ) -> str:
     """Write a row of values starting at a specific cell in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return write_row(path, sheet, start_cell, data)
+    return xl.write_row(path, sheet, start_cell, data)
 
-@mcp.tool()
+@tool()
 def tool_write_column(
     filename: str = Field(description="The Excel file to write to"),
     sheet: str = Field(description="The sheet to write to"),
@@ -121,9 +236,9 @@ def tool_write_column(
 ) -> str:
     """Write a column of values starting at a specific cell in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return write_column(path, sheet, start_cell, data)
+    return xl.write_column(path, sheet, start_cell, data)
 
-@mcp.tool()
+@tool()
 def tool_set_border(
     filename: str = Field(description="The Excel file to modify"),
     sheet: str = Field(description="The sheet to set borders in"),
@@ -131,37 +246,92 @@ def tool_set_border(
 ) -> str:
     """Set borders for a range of cells in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return set_border(path, sheet, cell_range)
+    return xl.set_border(path, sheet, cell_range)
 
-@mcp.tool()
+@tool()
 def tool_auto_fit_columns(
     filename: str = Field(description="The Excel file to modify"),
-    sheet: str = Field(description="The sheet to auto-fit columns in")
+    sheet: str = Field(description="The sheet to auto-fit columns in"),
+    sample_rows: int = Field(description="Measure only about this many evenly spaced rows (0 measures all)", default=0),
+    max_width: float = Field(description="Upper limit for a column width in characters (0 for Excel's 255)", default=0)
 ) -> str:
     """Auto-fit the width of all columns in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return auto_fit_columns(path, sheet)
+    return xl.auto_fit_columns(path, sheet, sample_rows or None, max_width or None)
 
-@mcp.tool()
+@tool()
 def tool_get_used_range(
     filename: str = Field(description="The Excel file to inspect"),
     sheet: str = Field(description="The sheet to get the used range from")
 ) -> dict:
     """Get the used range (min/max row/col) of an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return get_used_range(path, sheet)
+    return xl.get_used_range(path, sheet)
 
-@mcp.tool()
+@tool()
 def tool_read_range(
     filename: str = Field(description="The Excel file to read from"),
     sheet: str = Field(description="The sheet to read from"),
-    cell_range: str = Field(description="The range of cells to read (e.g. A1:B2)")
+    cell_range: str = Field(description="The range of cells to read (e.g. A1:B2)"),
+    computed: bool = Field(description="Evaluate formulas and return their results instead of the formula text", default=False)
 ) -> list:
     """Read a range of cells from an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return read_range(path, sheet, cell_range)
+    return xl.read_range(path, sheet, cell_range, computed)
+
+@tool()
+def tool_read_range_page(
+    filename: str = Field(description="The Excel file to read from"),
+    sheet: str = Field(description="The sheet to read from"),
+    cell_range: str = Field(description="The range of cells to read (e.g. A1:Z200000 or A:Z)"),
+    page_size: int = Field(description="Maximum number of rows to return", default=1000),
+    cursor: str = Field(description="The next_cursor of the previous page; leave empty for the first page", default="")
+) -> dict:
+    """Read a large range page by page. Returns rows plus a next_cursor (null on the last page)."""
+    path = os.path.join(EXCEL_FILES_DIR, filename)
+    return pager.read_range_page(path, sheet, cell_range, page_size, cursor or None)
+
+@tool()
+def tool_aggregate_range(
+    filename: str = Field(description="The Excel file to read from"),
+    sheet: str = Field(description="The sheet to read from"),
+    cell_range: str = Field(description="The table range, first row being the header (e.g. A1:F100000 or A:F)"),
+    aggregates: list[dict] | None = Field(description=(
+        "Aggregates to compute, each {\"func\": sum|mean|min|max|count, \"column\": header name or letter, "
+        "\"name\": optional output name}. A count without column counts rows. Defaults to a row count"), default=None),
+    group_by: list[str] | None = Field(description="Columns to group by", default=None),
+    filters: list[dict] | None = Field(description=(
+        "Row conditions combined with AND, each {\"column\", \"op\", \"value\"}; "
+        "op is one of ==, !=, >, >=, <, <=, in, not_in, contains, empty, not_empty"), default=None),
+    header: bool = Field(description="Whether the first row of the range holds column names", default=True),
+    order_by: str = Field(description="Aggregate name to order groups by (e.g. sum_Amount)", default=""),
+    descending: bool = Field(description="Order groups from largest to smallest", default=True),
+    limit: int = Field(description="Maximum number of groups to return", default=100)
+) -> dict:
+    """Compute sums, means, min/max and counts over a range on the server, optionally filtered and grouped."""
+    path = os.path.join(EXCEL_FILES_DIR, filename)
+    return analytics.aggregate_range(path, sheet, cell_range, aggregates, group_by, filters, header,
+                                     order_by or None, descending, limit)
+
+@tool()
+def tool_query_range(
+    filename: str = Field(description="The Excel file to read from"),
+    sheet: str = Field(description="The sheet to read from"),
+    cell_range: str = Field(description="The table range, first row being the header (e.g. A1:F100000 or A:F)"),
+    columns: list[str] = Field(description="Columns to return (header names or letters)"),
+    filters: list[dict] | None = Field(description=(
+        "Row conditions combined with AND, each {\"column\", \"op\", \"value\"}; "
+        "op is one of ==, !=, >, >=, <, <=, in, not_in, contains, empty, not_empty"), default=None),
+    header: bool = Field(description="Whether the first row of the range holds column names", default=True),
+    order_by: str = Field(description="Numeric column to pick the top rows by", default=""),
+    descending: bool = Field(description="Return the largest values of order_by first", default=False),
+    limit: int = Field(description="Maximum number of rows to return", default=100)
+) -> dict:
+    """Return only the rows of a range that match the filters, optionally the top-k by a column."""
+    path = os.path.join(EXCEL_FILES_DIR, filename)
+    return analytics.query_range(path, sheet, cell_range, columns, filters, header, order_by or None, descending, limit)
 
-@mcp.tool()
+@tool()
 def tool_write_formula(
     filename: str = Field(description="The Excel file to modify"),
     sheet: str = Field(description="The sheet to write the formula in"),
@@ -170,19 +340,129 @@ def tool_write_formula(
 ) -> str:
     """Write a formula to a specific cell in an Excel sheet."""
     path = os.path.join(EXCEL_FILES_DIR, filename)
-    return write_formula(path, sheet, cell, formula)
+    return xl.write_formula(path, sheet, cell, formula)
 
-@mcp.tool()
+@tool()
 def tool_save_as_new_file(
     old_filename: str = Field(description="The original Excel file name"),
     new_filename: str = Field(description="The new Excel file name")
 ) -> str:
-    """Save the Excel file as a new file with a different name."""
+    """Save the Excel file as a new file with a different name (a byte-level copy)."""
+    old_path = os.path.join(EXCEL_FILES_DIR, old_filename)
+    new_path = os.path.join(EXCEL_FILES_DIR, new_filename)
+    return xl.save_as_new_file(old_path, new_path)
+
+@tool()
+def tool_clone_from_template(
+    template: str = Field(description="The template Excel file to copy"),
+    new_filename: str = Field(description="The Excel file to create"),
+    edits: list[dict] | None = Field(description='Cell edits to apply to the copy: [{"sheet": "Sheet1", "cell": "A1", "value": ...}]; a value starting with "=" is a formula', default=None)
+) -> str:
+    """Create a new Excel file from a template, applying cell edits by rewriting only the edited sheets."""
+    return xl.clone_from_template(os.path.join(EXCEL_FILES_DIR, template), os.path.join(EXCEL_FILES_DIR, new_filename), edits)
+
+@tool()
+async def tool_multi_file_read(
+    pattern: str = Field(description="Glob over the Excel directory, e.g. monthly_2024_*.xlsx"),
+    sheet: str = Field(description="The sheet to read in every file"),
+    cell_range: str = Field(description="The range to read (or the table to aggregate, header row first)"),
+    aggregate: dict | None = Field(description=(
+        "Run aggregate_range instead of returning the values: {\"aggregates\", \"group_by\", \"filters\", "
+        "\"header\", \"order_by\", \"descending\", \"limit\"} as in tool_aggregate_range"), default=None),
+    workers: int = Field(description="Files parsed in parallel (default: EXCEL_FANOUT_WORKERS)", default=0),
+    timeout: float = Field(description="Seconds allowed per file (default: EXCEL_FANOUT_FILE_TIMEOUT)", default=0),
+    ctx: Context = None
+) -> dict:
+    """Read one range, or aggregate it, in every file matching a glob, parsing files in parallel worker processes.
+    Each file's result is also sent as a progress notification as soon as it is ready."""
+    done = 0
+
+    def on_result(item: dict):
+        # called on the worker thread; the notification is sent from the event loop
+        nonlocal done
+        done += 1
+        anyio.from_thread.run(ctx.report_progress, done, None, json.dumps(item, default=str))
+
+    return await anyio.to_thread.run_sync(
+        lambda: fanout.multi_file_read(EXCEL_FILES_DIR, pattern, sheet, cell_range, aggregate, workers or None,
+                                       timeout or None, on_result))
+
+@tool()
+def tool_find_cells(
+    query: str = Field(description="Value, word or prefix to look for (ignored for range lookups)", default=""),
+    mode: str = Field(description="exact (whole value; numbers numerically), token (word in a text), prefix, or range (numbers)", default="exact"),
+    min_value: float | None = Field(description="Lower bound for range lookups", default=None),
+    max_value: float | None = Field(description="Upper bound for range lookups", default=None),
+    filename: str = Field(description="Only search this file (default: every file)", default=""),
+    sheet: str = Field(description="Only search sheets with this name", default=""),
+    limit: int = Field(description="Maximum number of matches to return", default=100)
+) -> dict:
+    """Find the cells holding a value across all Excel files, using a persistent index. Returns file, sheet, cell and value of each match."""
+    return search.get_cell_index(EXCEL_FILES_DIR).find(query, mode, min_value, max_value, filename or None,
+                                                       sheet or None, limit)
+
+@tool()
+def tool_export_sheet(
+    filename: str = Field(description="The Excel file to export from"),
+    sheet: str = Field(description="The sheet to export"),
+    output: str = Field(description="File to write, relative to the Excel files directory (.csv, .ndjson or .parquet)"),
+    format: str = Field(description="csv, ndjson or parquet (default: from the output extension)", default=""),
+    cell_range: str = Field(description="Only export this range, e.g. A1:F5000 (default: the used range)", default=""),
+    header: bool = Field(description="Use the first row as column names", default=True)
+) -> dict:
+    """Stream a sheet into a CSV, NDJSON or Parquet file in fixed-size batches. Returns rows written and throughput."""
+    path = os.path.join(EXCEL_FILES_DIR, filename)
+    return export.export_sheet(path, sheet, os.path.join(EXCEL_FILES_DIR, output), format or None,
+                               cell_range or None, header)
+
+@tool()
+def tool_diff_workbooks(
+    old_filename: str = Field(description="The earlier version of the workbook"),
+    new_filename: str = Field(description="The later version of the workbook"),
+    sheets: list[str] | None = Field(description="Only compare these sheets (default: all sheets in both files)", default=None),
+    max_changes: int = Field(description="Maximum number of changed cells to list (all are counted)", default=1000)
+) -> dict:
+    """Compare two workbooks cell by cell: changed values and formulas plus added/removed sheets. Streams both files."""
     old_path = os.path.join(EXCEL_FILES_DIR, old_filename)
     new_path = os.path.join(EXCEL_FILES_DIR, new_filename)
-    return save_as_new_file(old_path, new_path)
+    return diff.diff_workbooks(old_path, new_path, sheets, max_changes)
+
+@tool()
+def tool_batch_apply(
+    filename: str = Field(description="The Excel file to modify"),
+    operations: list[dict] = Field(description=(
+        "Ordered list of operations, each an object with an 'op' key plus that operation's arguments. "
+        "Supported: write_cell(sheet, cell, value, bold, italic, font_color, bg_color, align), "
+        "write_formula(sheet, cell, formula), write_row(sheet, start_cell, data), "
+        "write_column(sheet, start_cell, data), write_range(sheet, start_cell, values, styles), "
+        "merge_cells(sheet, cell_range), "
+        "unmerge_cells(sheet, cell_range), set_border(sheet, cell_range), "
+        "set_style(sheet, cell_range, bold, italic, font_color, bg_color, align), "
+        "add_sheet(sheet_name), rename_sheet(old_name, new_name), delete_sheet(sheet_name)"
+    ))
+) -> dict:
+    """Apply many operations to one Excel file with a single load and save. All-or-nothing."""
+    path = os.path.join(EXCEL_FILES_DIR, filename)
+    return xl.batch_apply(path, operations)
+
+@tool()
+def tool_flush_workbooks(
+    filename: str = Field(description="The Excel file to flush; leave empty to flush all cached files", default="")
+) -> str:
+    """Write pending in-memory changes of cached workbooks to disk."""
+    path = os.path.join(EXCEL_FILES_DIR, filename) if filename else None
+    return xl.flush_excel_file(path)
+
+@tool()
+def tool_undo_operations(
+    filename: str = Field(description="The Excel file to undo changes in"),
+    count: int = Field(description="Number of most recent operations to undo", default=1)
+) -> str:
+    """Undo the last operations on a file that are still in its journal (EXCEL_JOURNAL mode, before compaction)."""
+    path = os.path.join(EXCEL_FILES_DIR, filename)
+    return xl.undo_operations(path, count)
 
-@mcp.tool()
+@tool()
 def greet_user(
     name: str = Field(description="The name of the person to greet"),
     title: str = Field(description="Optional title like Mr/Ms/Dr", default=""),
@@ -194,4 +474,10 @@ def greet_user(
 
 if __name__ == "__main__":
     os.makedirs(EXCEL_FILES_DIR, exist_ok=True)
-    mcp.run(transport="stdio")
+    if pending_journals(EXCEL_FILES_DIR):
+        xl.recover_journals(EXCEL_FILES_DIR)  # operations logged before a crash
+    try:
+        mcp.run(transport=EXCEL_TRANSPORT)
+    finally:
+        if cache.loaded:
+            cache.workbook_cache.close()
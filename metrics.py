@@ -0,0 +1,339 @@
+import os
+import time
+import inspect
+import random
+import threading
+import tracemalloc
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from typing import Any, Dict, Optional
+
+# ---------- CONFIGURATION ----------
+
+# Per-tool instrumentation is off unless EXCEL_METRICS is set.
+METRICS_ENABLED = os.getenv("EXCEL_METRICS", "false").lower() in ("1", "true", "yes")
+# Fraction of tool calls traced with tracemalloc for their peak allocation. tracemalloc
+# is process-wide, so a call is only sampled while no other call is in flight, and
+# the sample is discarded if another call starts before it ends; allocations made
+# meanwhile by background threads (debounced write-back) are still included.
+METRICS_ALLOC_SAMPLE = float(os.getenv("EXCEL_METRICS_ALLOC_SAMPLE", "0.01"))
+# Prometheus text exposition file, rewritten at most every EXCEL_METRICS_PROM_INTERVAL seconds.
+METRICS_PROM_FILE = os.getenv("EXCEL_METRICS_PROM_FILE", "")
+METRICS_PROM_INTERVAL = float(os.getenv("EXCEL_METRICS_PROM_INTERVAL", "10"))
+# Files with per-file totals; the least recently used ones are dropped beyond this.
+METRICS_MAX_FILES = int(os.getenv("EXCEL_METRICS_MAX_FILES", "1000"))
+
+# Histogram upper bounds in seconds (the last bucket is +Inf).
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PHASES = ("load", "op", "save", "total")
+
+# Phases and bytes attributed to files outside any tool call (e.g. debounced write-back).
+BACKGROUND = "(background)"
+
+
+class _Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def snapshot(self) -> Dict[str, Any]:
+        bounds = [str(b) for b in BUCKETS] + ["+Inf"]
+        cumulative, total = {}, 0
+        for bound, n in zip(bounds, self.counts):
+            total += n
+            cumulative[bound] = total
+        return {"count": self.count, "sum": round(self.sum, 6), "buckets": cumulative}
+
+
+class _Call:
+    """Phase timings and I/O of one tool call, collected on the calling thread."""
+    __slots__ = ("tool", "filename", "load", "save", "bytes_read", "bytes_written")
+
+    def __init__(self, tool: str, filename: str):
+        self.tool = tool
+        self.filename = filename
+        self.load = 0.0
+        self.save = 0.0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+
+class Metrics:
+    """Histograms per (tool, phase) and totals per (tool, file).
+
+    ``tool_call`` brackets a call; ``phase`` is used by the workbook cache
+    around ``load_workbook`` and the save, and by the streaming readers
+    (``phase_iter`` for the lazy ones); whatever is left of the call counts
+    as the operation. Work done outside a call (debounced write-back
+    on a timer thread) is attributed to the ``(background)`` tool.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, alloc_sample: float = METRICS_ALLOC_SAMPLE,
+                 prom_file: str = METRICS_PROM_FILE, prom_interval: float = METRICS_PROM_INTERVAL,
+                 max_files: int = METRICS_MAX_FILES):
+        self.enabled = enabled
+        self.alloc_sample = alloc_sample
+        self.prom_file = prom_file
+        self.prom_interval = prom_interval
+        self.max_files = max_files
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._histograms: Dict[tuple, _Histogram] = {}
+        self._files: "OrderedDict[tuple, Dict[str, float]]" = OrderedDict()
+        self._errors: Dict[str, int] = {}
+        # per tool [bytes read, bytes written]; unlike _files never trimmed, so the counters only grow
+        self._tool_bytes: Dict[str, list] = {}
+        self._active = 0
+        self._tracing = False
+        self._traced_shared = False
+        self._prom_written = 0.0
+        self._started = time.time()
+
+    # ---------- RECORDING ----------
+
+    def tool_call(self, tool: str, filename: Optional[str] = None):
+        """Context manager measuring one tool call (a shared no-op when disabled)."""
+        if not self.enabled:
+            return nullcontext()
+        return self._tool_call(tool, filename or "")
+
+    def phase(self, name: str, path: str):
+        """Context manager timing a ``load`` or ``save`` of ``path`` (a shared no-op when disabled)."""
+        if not self.enabled:
+            return nullcontext()
+        return self._phase(name, path)
+
+    def phase_iter(self, name: str, path: str, items):
+        """``items``, with the time spent producing them counted as a ``name`` phase of ``path``.
+
+        For generators that parse as they are consumed; the phase is recorded
+        once they are exhausted or closed. ``items`` itself when disabled.
+        """
+        if not self.enabled:
+            return items
+        return self._phase_iter(name, path, items)
+
+    def instrument(self, fn, tool: Optional[str] = None):
+        """Wrap a tool function taking a ``filename`` (or ``old_filename``) keyword; unchanged when disabled."""
+        if not self.enabled:
+            return fn
+        tool = tool or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with self._tool_call(tool, kwargs.get("filename") or kwargs.get("old_filename") or ""):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self._tool_call(tool, kwargs.get("filename") or kwargs.get("old_filename") or ""):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def _tool_call(self, tool: str, filename: str):
+        call = _Call(tool, filename)
+        outer = getattr(self._local, "call", None)
+        self._local.call = call
+        traced = False
+        if outer is None:
+            with self._lock:
+                self._active += 1
+                self._traced_shared |= self._tracing
+            traced = self._start_tracing()
+        started = time.perf_counter()
+        failed = False
+        try:
+            yield call
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            peak = self._stop_tracing() if traced else None
+            if outer is None:
+                with self._lock:
+                    self._active -= 1
+            self._local.call = outer
+            self._record(call, elapsed, peak, failed)
+
+    @contextmanager
+    def _phase(self, name: str, path: str):
+        call = getattr(self._local, "call", None)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add_phase(call, name, path, time.perf_counter() - started)
+
+    def _phase_iter(self, name: str, path: str, items):
+        call = getattr(self._local, "call", None)
+        items = iter(items)
+        elapsed = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            close = getattr(items, "close", None)
+            if close is not None:
+                close()
+            self._add_phase(call, name, path, elapsed)
+
+    def _add_phase(self, call: Optional[_Call], name: str, path: str, elapsed: float):
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if call is not None:
+            setattr(call, name, getattr(call, name) + elapsed)
+            if name == "load":
+                call.bytes_read += size
+            else:
+                call.bytes_written += size
+        else:
+            background = _Call(BACKGROUND, os.path.basename(path))
+            setattr(background, name, elapsed)
+            if name == "load":
+                background.bytes_read = size
+            else:
+                background.bytes_written = size
+            self._record(background, elapsed, None, False, op=False)
+
+    def _start_tracing(self) -> bool:
+        # tracemalloc is process-wide: trace a sampled call only while it is the
+        # only one in flight, and never interfere with tracing someone else started.
+        if self.alloc_sample <= 0 or random.random() >= self.alloc_sample:
+            return False
+        with self._lock:
+            if self._active != 1 or self._tracing or tracemalloc.is_tracing():
+                return False
+            self._tracing = True
+            self._traced_shared = False
+        tracemalloc.start()
+        return True
+
+    def _stop_tracing(self) -> Optional[int]:
+        """The traced peak, or None if another call overlapped the trace."""
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        with self._lock:
+            self._tracing = False
+            shared, self._traced_shared = self._traced_shared, False
+        return None if shared else peak
+
+    def _record(self, call: _Call, elapsed: float, peak: Optional[int], failed: bool, op: bool = True):
+        phases = {"load": call.load, "save": call.save, "total": elapsed}
+        if op:
+            phases["op"] = max(0.0, elapsed - call.load - call.save)
+        else:
+            del phases["total"]
+        with self._lock:
+            for phase, seconds in phases.items():
+                if seconds or phase in ("op", "total"):
+                    key = (call.tool, phase)
+                    histogram = self._histograms.get(key)
+                    if histogram is None:
+                        histogram = self._histograms[key] = _Histogram()
+                    histogram.observe(seconds)
+            if failed:
+                self._errors[call.tool] = self._errors.get(call.tool, 0) + 1
+            tool_bytes = self._tool_bytes.setdefault(call.tool, [0, 0])
+            tool_bytes[0] += call.bytes_read
+            tool_bytes[1] += call.bytes_written
+            key = (call.tool, call.filename)
+            totals = self._files.get(key)
+            if totals is None:
+                totals = self._files[key] = {"calls": 0, "load_s": 0.0, "op_s": 0.0, "save_s": 0.0,
+                                             "bytes_read": 0, "bytes_written": 0, "peak_alloc_bytes": 0}
+                while len(self._files) > self.max_files:
+                    self._files.popitem(last=False)
+            else:
+                self._files.move_to_end(key)
+            totals["calls"] += 1
+            totals["load_s"] += call.load
+            totals["op_s"] += phases.get("op", 0.0)
+            totals["save_s"] += call.save
+            totals["bytes_read"] += call.bytes_read
+            totals["bytes_written"] += call.bytes_written
+            if peak is not None and peak > totals["peak_alloc_bytes"]:
+                totals["peak_alloc_bytes"] = peak
+            write_prom = self.prom_file and time.monotonic() - self._prom_written >= self.prom_interval
+            if write_prom:
+                self._prom_written = time.monotonic()
+        if write_prom:
+            self.write_prometheus(self.prom_file)
+
+    # ---------- EXPORT ----------
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Everything recorded so far, as JSON-serializable data."""
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            tools: Dict[str, Dict[str, Any]] = {}
+            for (tool, phase), histogram in sorted(self._histograms.items()):
+                tools.setdefault(tool, {"errors": self._errors.get(tool, 0)})[phase] = histogram.snapshot()
+            files = [{"tool": tool, "file": filename, **{k: round(v, 6) if isinstance(v, float) else v
+                                                         for k, v in totals.items()}}
+                     for (tool, filename), totals in self._files.items()]
+        return {"enabled": True, "since": self._started, "bucket_bounds_s": list(BUCKETS),
+                "tools": tools, "files": files}
+
+    def prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = ["# HELP excel_tool_seconds Tool call time by phase (load, op, save, total).",
+                 "# TYPE excel_tool_seconds histogram"]
+        with self._lock:
+            for (tool, phase), histogram in sorted(self._histograms.items()):
+                labels = f'tool="{_escape(tool)}",phase="{phase}"'
+                total = 0
+                for bound, n in zip([str(b) for b in BUCKETS] + ["+Inf"], histogram.counts):
+                    total += n
+                    lines.append(f'excel_tool_seconds_bucket{{{labels},le="{bound}"}} {total}')
+                lines.append(f"excel_tool_seconds_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"excel_tool_seconds_count{{{labels}}} {histogram.count}")
+            lines += ["# HELP excel_tool_errors_total Tool calls that raised.",
+                      "# TYPE excel_tool_errors_total counter"]
+            lines += [f'excel_tool_errors_total{{tool="{_escape(tool)}"}} {n}' for tool, n in sorted(self._errors.items())]
+            for i, name in enumerate(("bytes_read", "bytes_written")):
+                lines += [f"# HELP excel_tool_{name}_total Workbook bytes {name.split('_')[1]} by tool.",
+                          f"# TYPE excel_tool_{name}_total counter"]
+                lines += [f'excel_tool_{name}_total{{tool="{_escape(tool)}"}} {n[i]}'
+                          for tool, n in sorted(self._tool_bytes.items())]
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Atomically replace ``path`` with the current exposition (for node_exporter's textfile collector)."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.prometheus())
+            os.replace(tmp, path)
+        except OSError:
+            pass  # metrics must never fail a tool call
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Metrics()
@@ -0,0 +1,201 @@
+import os
+import time
+import signal
+import fnmatch
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, List, Optional
+from directory_index import get_directory_index
+from file_locks import lock_table
+from workbook_cache import workbook_cache
+
+# ---------- CONFIGURATION ----------
+
+# Worker processes shared by all multi_file_read calls (default: one per CPU).
+FANOUT_WORKERS = int(os.getenv("EXCEL_FANOUT_WORKERS", "0")) or os.cpu_count() or 1
+# Seconds one file may take before it is reported as timed out (0: no limit).
+FANOUT_FILE_TIMEOUT = float(os.getenv("EXCEL_FANOUT_FILE_TIMEOUT", "60"))
+# Most files one call may match.
+FANOUT_MAX_FILES = int(os.getenv("EXCEL_FANOUT_MAX_FILES", "1000"))
+
+# Options of aggregate_range accepted in an aggregate spec.
+AGGREGATE_OPTIONS = ("aggregates", "group_by", "filters", "header", "order_by", "descending", "limit")
+
+# Modules every worker needs, imported once in the fork server rather than per worker.
+_PRELOAD = ["excel_reader", "range_analytics"]
+
+
+# ---------- WORKER ----------
+
+def _timed_out(signum, frame):
+    raise TimeoutError("file took longer than the per-file timeout")
+
+def _read_file(path: str, sheet: str, cell_range: str, aggregate: Optional[Dict[str, Any]],
+               timeout: float) -> Dict[str, Any]:
+    """Runs in a worker process: one streaming (read-only) read or aggregate of one file."""
+    # SIGALRM interrupts the parser between Python steps and leaves the worker usable.
+    armed = timeout > 0 and hasattr(signal, "setitimer")
+    if armed:
+        signal.signal(signal.SIGALRM, _timed_out)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        if aggregate is not None:
+            from range_analytics import aggregate_range
+            return {"result": aggregate_range(path, sheet, cell_range, **aggregate)}
+        from excel_reader import stream_range
+        return {"values": stream_range(path, sheet, cell_range)}
+    finally:
+        if armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+# ---------- POOL ----------
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pids: Dict[ProcessPoolExecutor, Any] = {}  # pool -> queue its workers report their pid on
+_pool_lock = threading.Lock()
+
+def _worker_started(pids):
+    pids.put(os.getpid())
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a threaded server is unsafe; a fork server (or spawn on Windows/macOS) is not.
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(_PRELOAD)
+            else:
+                context = multiprocessing.get_context("spawn")
+            pids = context.SimpleQueue()
+            _pool = ProcessPoolExecutor(max_workers=FANOUT_WORKERS, mp_context=context,
+                                        initializer=_worker_started, initargs=(pids,))
+            _pool_pids[_pool] = pids
+        return _pool
+
+def _replace_pool(pool: ProcessPoolExecutor):
+    """Kill the workers of ``pool`` and stop handing it out; the next call starts a fresh pool.
+
+    A running task cannot be cancelled, so this is the only way to free the
+    slot of a worker stuck in C code. Work still queued or running on ``pool``
+    fails with BrokenProcessPool.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        pids = _pool_pids.pop(pool, None)
+    while pids is not None and not pids.empty():
+        try:
+            os.kill(pids.get(), getattr(signal, "SIGKILL", signal.SIGTERM))
+        except OSError:
+            pass  # already gone
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def close():
+    """Stop the worker processes (they are started again on the next call)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+        _pool_pids.pop(pool, None)
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+# ---------- FAN-OUT ----------
+
+def multi_file_read(directory: str, pattern: str, sheet: str, cell_range: str,
+                    aggregate: Optional[Dict[str, Any]] = None, workers: Optional[int] = None,
+                    timeout: Optional[float] = None,
+                    on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Read ``cell_range`` (or run ``aggregate_range`` with ``aggregate``) in every file matching ``pattern``.
+
+    Files are parsed in parallel on a shared process pool with the streaming
+    reader, at most ``workers`` at a time for this call. Each file is read
+    locked from the write-back of its cached edits until its result is in,
+    as single-file reads are. ``on_result`` gets each file's ``{"file",
+    "values" | "result" | "error"}`` as it completes; the return value lists
+    them all in file name order.
+    """
+    started = time.perf_counter()
+    if aggregate is not None:
+        unknown = set(aggregate) - set(AGGREGATE_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown aggregate options {sorted(unknown)}; use {list(AGGREGATE_OPTIONS)}")
+    names = [name for name in get_directory_index(directory).names() if fnmatch.fnmatchcase(name, pattern)]
+    if len(names) > FANOUT_MAX_FILES:
+        raise ValueError(f"{len(names)} files match {pattern!r}; at most {FANOUT_MAX_FILES} are read in one call")
+    timeout = FANOUT_FILE_TIMEOUT if timeout is None else timeout
+    workers = max(1, min(int(workers or FANOUT_WORKERS), FANOUT_WORKERS))
+    pending = iter(names)
+    running: Dict[Any, list] = {}  # future -> [name, pool, submitted, attempts, read lock]
+    results: List[Dict[str, Any]] = []
+
+    def run(name: str, attempts: int, lock: ExitStack):
+        path = os.path.join(directory, name)
+        while True:
+            pool = _get_pool()
+            try:
+                future = pool.submit(_read_file, path, sheet, cell_range, aggregate, timeout)
+                break
+            except (BrokenProcessPool, RuntimeError):
+                _replace_pool(pool)  # broken by a crashed worker, or replaced by another call
+        running[future] = [name, pool, time.monotonic(), attempts, lock]
+
+    def submit():
+        for name in pending:
+            lock = ExitStack()
+            lock.enter_context(lock_table.read_locked(os.path.join(directory, name)))
+            # Workers read from disk, so unsaved cached edits must be written first.
+            workbook_cache.flush(os.path.join(directory, name))
+            run(name, 1, lock)
+            return
+
+    def finish(name: str, lock: ExitStack, item: Dict[str, Any]):
+        lock.close()
+        item = {"file": name, **item}
+        results.append(item)
+        if on_result is not None:
+            on_result(item)
+
+    try:
+        for _ in range(workers):
+            submit()
+        while running:
+            done, _ = wait(running, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, _, _, attempts, lock = running.pop(future)
+                try:
+                    finish(name, lock, future.result())
+                except BrokenProcessPool as e:
+                    if attempts < 2:
+                        run(name, attempts + 1, lock)  # lost with a pool killed for another file
+                        continue
+                    finish(name, lock, {"error": f"{type(e).__name__}: {e}"})
+                except Exception as e:
+                    finish(name, lock, {"error": f"{type(e).__name__}: {e}"})
+                submit()
+            if timeout > 0:
+                # Backstop where the worker cannot time itself out (no SIGALRM, or stuck in C code).
+                now = time.monotonic()
+                for future, (name, pool, submitted, _, lock) in list(running.items()):
+                    if future in running and now - submitted > 2 * timeout + 5:
+                        del running[future]
+                        _replace_pool(pool)
+                        finish(name, lock, {"error": f"TimeoutError: no result after {now - submitted:.0f}s"})
+                        submit()
+    finally:
+        for _, _, _, _, lock in running.values():
+            lock.close()
+    results.sort(key=lambda item: item["file"])
+    return {
+        "pattern": pattern,
+        "matched_files": len(names),
+        "failed_files": sum(1 for item in results if "error" in item),
+        "files": results,
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import atexit
+import threading
+from typing import Any, Dict, List, Optional
+
+# ---------- CONFIGURATION ----------
+
+# Journal mode: mutations are appended to a per-workbook operation log instead
+# of saving the workbook, which is only written by the periodic compaction.
+JOURNAL_ENABLED = os.getenv("EXCEL_JOURNAL", "false").lower() in ("1", "true", "yes")
+# Group commit window: records appended within it share one fsync, issued this many
+# milliseconds after the first of them (0: fsync each record before the call returns).
+JOURNAL_SYNC_MS = float(os.getenv("EXCEL_JOURNAL_SYNC_MS", "10"))
+# Seconds after the first journaled edit at which the log is folded into the workbook.
+JOURNAL_COMPACT_INTERVAL = float(os.getenv("EXCEL_JOURNAL_COMPACT_INTERVAL", "30"))
+# Records after which the log is folded at once, by the call appending the last one.
+JOURNAL_MAX_RECORDS = int(os.getenv("EXCEL_JOURNAL_MAX_RECORDS", "5000"))
+
+JOURNAL_SUFFIX = ".journal"
+
+
+class UnrecoveredJournal(Exception):
+    """A workbook still has a log left by a crash; it must be replayed before new edits are logged."""
+
+
+# ---------- PATHS ----------
+
+def journal_path(path: str) -> str:
+    """The log of a workbook: a hidden ``.<name>.journal`` file beside it."""
+    folder, name = os.path.split(os.path.realpath(path))
+    return os.path.join(folder, f".{name}{JOURNAL_SUFFIX}")
+
+def _stamp(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+# ---------- JOURNAL ----------
+
+class Journal:
+    """Append-only log of the operations applied to one workbook since it was last saved.
+
+    One JSON record per line. The first line holds the size and mtime of the
+    saved workbook the operations apply to, so a log outliving the save that
+    folded it in (a crash between the two) is recognized as stale.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.log_path = journal_path(path)
+        self.operations: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._fd = None
+        self._created = False
+        self._unsynced = False
+
+    def append(self, operation: Dict[str, Any]) -> int:
+        """Write one record (not yet fsynced); returns the number of records in the log."""
+        line = json.dumps(operation, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            if self._fd is None:
+                try:
+                    # never O_TRUNC: an existing log holds acknowledged edits of an earlier run
+                    self._fd = os.open(self.log_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+                except FileExistsError:
+                    raise UnrecoveredJournal(f"{self.path} has an unrecovered journal {self.log_path}") from None
+                self._created = True
+                line = json.dumps({"base": _stamp(self.path)}) + "\n" + line
+            os.write(self._fd, line.encode("utf-8"))
+            self.operations.append(operation)
+            self._unsynced = True
+            return len(self.operations)
+
+    def sync(self):
+        """fsync the records written so far (and the new log's directory entry)."""
+        with self._lock:
+            if self._fd is None or not self._unsynced:
+                return
+            # fsync a duplicate outside the lock so appends are not held up by the disk
+            fd, created = os.dup(self._fd), self._created
+            self._unsynced = self._created = False
+        try:
+            os.fsync(fd)
+            if created:
+                folder = os.open(os.path.dirname(self.log_path), os.O_RDONLY)
+                try:
+                    os.fsync(folder)
+                finally:
+                    os.close(folder)
+        except OSError:
+            with self._lock:
+                self._unsynced = True
+                self._created = self._created or created
+            raise
+        finally:
+            os.close(fd)
+
+    def close(self):
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+            self.operations = []
+            self._unsynced = False
+
+
+# ---------- GROUP COMMIT ----------
+
+_journals: Dict[str, Journal] = {}
+_journals_lock = threading.Lock()
+_unsynced: set = set()
+_unsynced_lock = threading.Lock()
+_wakeup = threading.Event()
+_syncer: Optional[threading.Thread] = None
+
+def _schedule_sync(journal: Journal):
+    global _syncer
+    with _unsynced_lock:
+        _unsynced.add(journal)
+        if _syncer is None:
+            _syncer = threading.Thread(target=_sync_loop, name="excel-journal-sync", daemon=True)
+            _syncer.start()
+    _wakeup.set()
+
+def _sync_loop():
+    while True:
+        _wakeup.wait()
+        time.sleep(JOURNAL_SYNC_MS / 1000)  # let the group gather
+        _wakeup.clear()
+        sync_all()
+
+def sync_all():
+    """fsync every log holding records that are not on disk yet."""
+    with _unsynced_lock:
+        batch = list(_unsynced)
+        _unsynced.clear()
+    for journal in batch:
+        try:
+            journal.sync()
+        except OSError:
+            with _unsynced_lock:
+                _unsynced.add(journal)  # retried with the next group
+
+
+# ---------- PUBLIC API ----------
+
+def append(path: str, operation: Dict[str, Any]) -> int:
+    """Log ``operation`` for the workbook at ``path``; returns the records logged since its last save.
+
+    The record is durable once the current group commit completes (at once
+    with ``EXCEL_JOURNAL_SYNC_MS=0``).
+    """
+    key = os.path.realpath(path)
+    with _journals_lock:
+        journal = _journals.get(key)
+        if journal is None:
+            journal = _journals[key] = Journal(key)
+    try:
+        records = journal.append(operation)
+    except UnrecoveredJournal:
+        with _journals_lock:
+            _journals.pop(key, None)  # so unrecovered() still reports the log
+        raise
+    if JOURNAL_SYNC_MS > 0:
+        _schedule_sync(journal)
+    else:
+        journal.sync()
+    return records
+
+def operations(path: str) -> List[Dict[str, Any]]:
+    """The operations logged for ``path`` since it was last saved, oldest first."""
+    with _journals_lock:
+        journal = _journals.get(os.path.realpath(path))
+    return list(journal.operations) if journal is not None else []
+
+def unrecovered(path: str) -> bool:
+    """Whether ``path`` has a log on disk that this process did not write (left by a crash)."""
+    key = os.path.realpath(path)
+    with _journals_lock:
+        if key in _journals:
+            return False
+    return os.path.exists(journal_path(key))
+
+def forget(path: str):
+    """Delete the log of ``path``: its operations were saved into the workbook or discarded."""
+    key = os.path.realpath(path)
+    with _journals_lock:
+        journal = _journals.pop(key, None)
+    if journal is not None:
+        journal.close()
+    try:
+        os.unlink(journal_path(key))
+    except FileNotFoundError:
+        pass
+
+def pending_journals(directory: str) -> List[str]:
+    """Workbooks in ``directory`` that have a log left behind by an unclean shutdown."""
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    return [os.path.join(directory, name[1:-len(JOURNAL_SUFFIX)]) for name in names
+            if name.startswith(".") and name.endswith(JOURNAL_SUFFIX)]
+
+def read_log(path: str) -> Optional[List[Dict[str, Any]]]:
+    """Operations in the log of ``path``, or None when it does not apply to the workbook on disk.
+
+    A record cut short by a crash ends the log.
+    """
+    try:
+        with open(journal_path(path), "rb") as f:
+            lines = f.read().splitlines()
+        base = json.loads(lines[0])["base"] if lines else None
+        if base != _stamp(path):
+            return None  # saved or replaced after the log was started
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    logged = []
+    for line in lines[1:]:
+        try:
+            logged.append(json.loads(line))
+        except ValueError:
+            break
+    return logged
+
+atexit.register(sync_all)
@@ -0,0 +1,369 @@
+import os
+import re
+import time
+from datetime import date, datetime
+from numbers import Number
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from openpyxl.utils.cell import column_index_from_string, get_column_letter, range_boundaries
+from workbook_cache import workbook_cache
+from excel_reader import range_bounds, read_sheet_dimension, scan_columns, scan_sheet_dimension
+from analytics_ops import AGGREGATES, FILTER_OPS
+
+# ---------- CONFIGURATION ----------
+
+# Upper bound for the number of rows / groups a query returns.
+QUERY_MAX_ROWS = int(os.getenv("EXCEL_QUERY_MAX_ROWS", "1000"))
+
+_COLUMN_LETTERS = re.compile(r"^[A-Za-z]{1,3}$")
+
+
+# ---------- COLUMNAR LOADING ----------
+
+# Cell kinds, recorded per value as the range is scanned. Booleans are not numbers:
+# like Excel's SUM/AVERAGE, aggregates ignore TRUE/FALSE cells.
+K_EMPTY, K_NUMBER, K_BOOL, K_TEXT, K_OTHER = range(5)
+_KINDS = {type(None): K_EMPTY, int: K_NUMBER, float: K_NUMBER, bool: K_BOOL, str: K_TEXT}
+
+# Object-array ufuncs calling the str methods directly: no per-cell Python frames,
+# and no fixed-width string copy sized by the longest cell.
+_lower = np.frompyfunc(str.lower, 1, 1)
+_contains = np.frompyfunc(str.__contains__, 2, 1)
+
+
+class _Column:
+    """One column of the range, decoded once: the raw values, their kinds, and a
+    float64 view (NaN where not numeric) with its mask."""
+
+    def __init__(self, name: str, values: np.ndarray, kinds: np.ndarray):
+        self.name = name
+        self.values = values
+        self.kinds = kinds
+        self.is_number = kinds == K_NUMBER
+        self.numbers = np.full(len(values), np.nan)
+        self.numbers[self.is_number] = values[self.is_number].astype(np.float64)
+        self._empty = None
+        self._lower = None
+
+    @property
+    def empty(self) -> np.ndarray:
+        """None or "" cells."""
+        if self._empty is None:
+            empty = self.kinds == K_EMPTY
+            text = self.kinds == K_TEXT
+            empty[text] = self.values[text] == ""
+            self._empty = empty
+        return self._empty
+
+    def lower_text(self) -> np.ndarray:
+        """Lowercased text of the text cells ("" elsewhere)."""
+        if self._lower is None:
+            text = self.kinds == K_TEXT
+            lower = np.full(len(self.values), "", dtype=object)
+            lower[text] = _lower(self.values[text])
+            self._lower = lower
+        return self._lower
+
+
+class _Table:
+    def __init__(self, columns: Dict[str, _Column], row_numbers: np.ndarray):
+        self.columns = columns
+        self.row_numbers = row_numbers
+        self.row_count = len(row_numbers)
+
+    def __getitem__(self, name: str) -> _Column:
+        return self.columns[name]
+
+
+def _column_names(header_row: Optional[Sequence[Any]], min_col: int, max_col: int) -> List[str]:
+    letters = [get_column_letter(c) for c in range(min_col, max_col + 1)]
+    if header_row is None:
+        return letters
+    return [letter if value is None else str(value) for letter, value in zip(letters, header_row)]
+
+def _resolve_column(spec: str, names: List[str], min_col: int) -> int:
+    """Offset of ``spec`` in the range: a header name, or else a column letter."""
+    if spec in names:
+        return names.index(spec)
+    if _COLUMN_LETTERS.match(spec):
+        offset = column_index_from_string(spec.upper()) - min_col
+        if 0 <= offset < len(names):
+            return offset
+    raise KeyError(f"Unknown column '{spec}'; available: {names}")
+
+def _bounds(filename: str, sheet: str, cell_range: str):
+    dimension = read_sheet_dimension(filename, sheet)
+    ref = cell_range if ":" in cell_range else f"{cell_range}:{cell_range}"
+    if dimension is None and range_boundaries(ref)[0] is None:
+        # whole-row range (1:3) on a sheet without a <dimension> tag
+        dimension = scan_sheet_dimension(filename, sheet)
+    return range_bounds(cell_range, dimension)
+
+def _load_table(filename: str, sheet: str, cell_range: str, header: bool,
+                wanted: Sequence[str]) -> _Table:
+    """Scan the range once, keeping only the ``wanted`` columns; blank rows are skipped."""
+    # Reads come from disk, so unsaved cached edits must be written first.
+    workbook_cache.flush(filename)
+    min_col, min_row, max_col, max_row = _bounds(filename, sheet, cell_range)
+    header_row = None
+    if header:
+        header_row = next((values for _, values in scan_columns(
+            filename, sheet, min_row, min_row, list(range(min_col, max_col + 1)))), None)
+        min_row += 1
+    names = _column_names(header_row, min_col, max_col)
+    offsets = {spec: _resolve_column(spec, names, min_col) for spec in dict.fromkeys(wanted)}
+    picks = sorted(set(offsets.values()))
+    buffers = [[] for _ in picks]
+    kind_buffers = [[] for _ in picks]
+    row_numbers = []
+    kinds = _KINDS
+    for row_number, values in scan_columns(filename, sheet, min_row, max_row,
+                                           [min_col + offset for offset in picks]):
+        if all(v is None for v in values):
+            continue
+        row_numbers.append(row_number)
+        for buffer, kind_buffer, value in zip(buffers, kind_buffers, values):
+            buffer.append(value)
+            kind_buffer.append(kinds.get(type(value), K_OTHER))
+
+    by_offset = {}
+    for offset, buffer, kind_buffer in zip(picks, buffers, kind_buffers):
+        values = np.empty(len(buffer), dtype=object)
+        values[:] = buffer
+        by_offset[offset] = _Column(names[offset], values, np.array(kind_buffer, dtype=np.int8))
+    columns = {spec: by_offset[offset] for spec, offset in offsets.items()}
+    return _Table(columns, np.array(row_numbers, dtype=np.int64))
+
+
+# ---------- FILTERS ----------
+
+def _elementwise(values: np.ndarray, test) -> np.ndarray:
+    def safe(v):
+        try:
+            return bool(test(v))
+        except TypeError:
+            return False
+    return np.fromiter((safe(v) for v in values), dtype=bool, count=len(values))
+
+def _filter_mask(table: _Table, filters: Optional[List[Dict[str, Any]]]) -> np.ndarray:
+    """AND of all ``{"column", "op", "value"}`` conditions."""
+    mask = np.ones(table.row_count, dtype=bool)
+    for condition in filters or []:
+        column = table[condition["column"]]
+        op = condition.get("op", "==")
+        value = condition.get("value")
+        numeric = isinstance(value, Number) and not isinstance(value, bool)
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unknown filter op '{op}'; use one of {list(FILTER_OPS)}")
+        if op in ("empty", "not_empty"):
+            mask &= column.empty if op == "empty" else ~column.empty
+        elif op in ("in", "not_in"):
+            test = np.zeros(table.row_count, dtype=bool)
+            for choice in dict.fromkeys(value or []):
+                test |= _equals(column, choice)
+            mask &= test if op == "in" else ~test
+        elif op == "contains":
+            mask &= (column.kinds == K_TEXT) & _contains(column.lower_text(), str(value).lower()).astype(bool)
+        elif numeric:
+            numbers = column.numbers
+            with np.errstate(invalid="ignore"):
+                test = {
+                    "==": numbers == value, "!=": numbers != value,
+                    ">": numbers > value, ">=": numbers >= value,
+                    "<": numbers < value, "<=": numbers <= value,
+                }[op]
+            mask &= test
+        elif op in ("==", "!="):
+            test = _equals(column, _as_cell_value(value, column.values))
+            mask &= test if op == "==" else ~test
+        else:
+            value = _as_cell_value(value, column.values)
+            compare = {
+                ">": lambda v: v is not None and v > value, ">=": lambda v: v is not None and v >= value,
+                "<": lambda v: v is not None and v < value, "<=": lambda v: v is not None and v <= value,
+            }[op]
+            mask &= _elementwise(column.values, compare)
+    return mask
+
+def _equals(column: _Column, value: Any) -> np.ndarray:
+    """Cells equal to ``value``; numbers only match numbers and booleans only booleans."""
+    if isinstance(value, bool):
+        return (column.kinds == K_BOOL) & (column.values == value)
+    if isinstance(value, Number):
+        return column.numbers == value
+    if value is None:
+        return column.kinds == K_EMPTY
+    others = (column.kinds != K_NUMBER) & (column.kinds != K_BOOL) & (column.kinds != K_EMPTY)
+    test = np.zeros(len(column.values), dtype=bool)
+    test[others] = column.values[others] == value
+    return test
+
+def _as_cell_value(value: Any, values: np.ndarray) -> Any:
+    """Let ISO date strings from JSON compare against date cells."""
+    if isinstance(value, str) and len(values):
+        sample = next((v for v in values if v is not None), None)
+        if isinstance(sample, (datetime, date)):
+            try:
+                return datetime.fromisoformat(value)
+            except ValueError:
+                pass
+    return value
+
+
+# ---------- AGGREGATION ----------
+
+def _factorize(table: _Table, group_by: List[str], mask: np.ndarray):
+    """Map the selected rows to dense group codes; returns (codes, group key tuples)."""
+    key_columns = [table[name].values[mask] for name in group_by]
+    index: Dict[Any, int] = {}
+    keys = zip(*key_columns) if len(key_columns) > 1 else ((v,) for v in key_columns[0])
+    codes = np.fromiter((index.setdefault(k, len(index)) for k in keys),
+                        dtype=np.int64, count=int(mask.sum()))
+    return codes, list(index)
+
+def _aggregate(func: str, numbers: np.ndarray, codes: np.ndarray, groups: int) -> np.ndarray:
+    valid = ~np.isnan(numbers)
+    counts = np.bincount(codes[valid], minlength=groups)
+    if func == "count":
+        return counts.astype(np.float64)
+    sums = np.bincount(codes[valid], weights=numbers[valid], minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if func == "sum":
+            return sums
+        if func == "mean":
+            return np.where(counts > 0, sums / counts, np.nan)
+    # min / max: sort values by group and reduce each contiguous run
+    order = np.argsort(codes[valid], kind="stable")
+    sorted_codes = codes[valid][order]
+    sorted_values = numbers[valid][order]
+    result = np.full(groups, np.nan)
+    if len(sorted_values):
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        reduce = np.minimum if func == "min" else np.maximum
+        result[sorted_codes[starts]] = reduce.reduceat(sorted_values, starts)
+    return result
+
+def _parse_aggregates(aggregates: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    specs = []
+    for spec in aggregates or [{"func": "count"}]:
+        func = spec.get("func")
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{func}'; use one of {list(AGGREGATES)}")
+        column = spec.get("column")
+        if column is None and func != "count":
+            raise ValueError(f"Aggregate '{func}' needs a column")
+        specs.append({"func": func, "column": column,
+                      "name": spec.get("name") or (f"{func}_{column}" if column else func)})
+    return specs
+
+def _top_k(keys: np.ndarray, limit: int, descending: bool) -> np.ndarray:
+    """Indices of the ``limit`` best entries of ``keys`` in order; NaN sorts last."""
+    keys = -keys if descending else keys
+    keys = np.where(np.isnan(keys), np.inf, keys)
+    if limit < len(keys):
+        candidates = np.argpartition(keys, limit - 1)[:limit]
+    else:
+        candidates = np.arange(len(keys))
+    return candidates[np.argsort(keys[candidates], kind="stable")]
+
+def _python(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value.is_integer() and abs(value) < 2 ** 53:
+            return int(value)
+    return value
+
+def _limit(limit: Optional[int]) -> int:
+    return max(1, min(int(limit or QUERY_MAX_ROWS), QUERY_MAX_ROWS))
+
+def aggregate_range(filename: str, sheet: str, cell_range: str,
+                    aggregates: Optional[List[Dict[str, Any]]] = None,
+                    group_by: Optional[List[str]] = None,
+                    filters: Optional[List[Dict[str, Any]]] = None,
+                    header: bool = True, order_by: Optional[str] = None,
+                    descending: bool = True, limit: Optional[int] = None) -> Dict[str, Any]:
+    """Compute sum/mean/min/max/count over a range, optionally filtered and grouped.
+
+    Columns are named by header text (when ``header``) or by column letter.
+    Only numeric cells take part in sum/mean/min/max (booleans are not
+    numeric); ``count`` without a column counts rows. With ``group_by`` one result row per distinct key is
+    returned, ordered by ``order_by`` (an aggregate name) when given.
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} does not exist.")
+    started = time.perf_counter()
+    specs = _parse_aggregates(aggregates)
+    group_by = list(group_by or [])
+    wanted = group_by + [f["column"] for f in filters or []] + [s["column"] for s in specs if s["column"]]
+    table = _load_table(filename, sheet, cell_range, header, wanted)
+    mask = _filter_mask(table, filters)
+
+    if group_by:
+        codes, keys = _factorize(table, group_by, mask)
+    else:
+        codes, keys = np.zeros(int(mask.sum()), dtype=np.int64), [()]
+    results = {}
+    for spec in specs:
+        if spec["column"] is None:
+            results[spec["name"]] = np.bincount(codes, minlength=len(keys)).astype(np.float64)
+        else:
+            results[spec["name"]] = _aggregate(spec["func"], table[spec["column"]].numbers[mask], codes, len(keys))
+
+    summary = {"rows_scanned": table.row_count, "rows_matched": int(mask.sum())}
+    if not group_by:
+        summary["result"] = {name: _python(values[0]) for name, values in results.items()}
+    else:
+        limit = _limit(limit)
+        if order_by is not None:
+            if order_by not in results:
+                raise KeyError(f"order_by must be one of {list(results)}")
+            order = _top_k(results[order_by], limit, descending)
+        else:
+            order = np.arange(min(limit, len(keys)))
+        summary["group_count"] = len(keys)
+        summary["groups"] = [
+            {**{name: _python(value) for name, value in zip(group_by, keys[i])},
+             **{name: _python(values[i]) for name, values in results.items()}}
+            for i in order
+        ]
+        summary["truncated"] = len(keys) > len(order)
+    summary["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return summary
+
+def query_range(filename: str, sheet: str, cell_range: str, columns: Optional[List[str]] = None,
+                filters: Optional[List[Dict[str, Any]]] = None, header: bool = True,
+                order_by: Optional[str] = None, descending: bool = False,
+                limit: Optional[int] = None) -> Dict[str, Any]:
+    """Return the rows of a range that match ``filters``, projected to ``columns``.
+
+    With ``order_by`` (a numeric column) the top ``limit`` rows are selected
+    without sorting the whole range. Each returned row carries its sheet row
+    number.
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} does not exist.")
+    started = time.perf_counter()
+    if not columns:
+        raise ValueError("columns must name at least one column")
+    wanted = list(columns) + [f["column"] for f in filters or []] + ([order_by] if order_by else [])
+    table = _load_table(filename, sheet, cell_range, header, wanted)
+    mask = _filter_mask(table, filters)
+    matched = np.flatnonzero(mask)
+    limit = _limit(limit)
+    if order_by is not None:
+        selected = matched[_top_k(table[order_by].numbers[matched], limit, descending)]
+    else:
+        selected = matched[:limit]
+    rows = [[table[name].values[i] for name in columns] for i in selected]
+    return {
+        "columns": list(columns),
+        "row_numbers": table.row_numbers[selected].tolist(),
+        "rows": rows,
+        "rows_scanned": table.row_count,
+        "rows_matched": len(matched),
+        "truncated": len(matched) > len(selected),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import secrets
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from openpyxl import load_workbook
+from metrics import metrics
+from workbook_cache import workbook_cache
+from excel_reader import iter_range_rows, is_open_range, range_bounds, read_sheet_dimension, scan_sheet_dimension
+
+# ---------- CONFIGURATION ----------
+
+# Upper bound for the number of rows returned in one page.
+PAGE_MAX_ROWS = int(os.getenv("EXCEL_PAGE_MAX_ROWS", "5000"))
+# Number of suspended streaming readers kept open for cursors to resume.
+OPEN_CURSORS_MAX = int(os.getenv("EXCEL_OPEN_CURSORS", "16"))
+# Seconds after which an idle suspended reader is closed.
+CURSOR_TTL = float(os.getenv("EXCEL_CURSOR_TTL", "300"))
+# Files are named in cursors relative to this directory, never by absolute path.
+FILES_DIR = os.getenv("EXCEL_FILES_DIR", "./excel_files")
+# Key signing cursors. Unset, a random key is drawn per process, so cursors do
+# not survive a restart and are not accepted by other workers.
+CURSOR_SECRET = os.getenv("EXCEL_CURSOR_SECRET", "")
+
+_CURSOR_KEY = CURSOR_SECRET.encode("utf-8") or secrets.token_bytes(32)
+
+
+class _Stream:
+    """A read-only workbook plus the row iterator positioned at ``next_row``."""
+
+    def __init__(self, wb, rows, next_row: int):
+        self.wb = wb
+        self.rows = rows
+        self.next_row = next_row
+        self.last_used = time.monotonic()
+
+    def close(self):
+        self.wb.close()
+
+
+_streams: "OrderedDict[str, _Stream]" = OrderedDict()
+_streams_lock = threading.Lock()
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _signature(payload: str) -> str:
+    return _b64(hmac.new(_CURSOR_KEY, payload.encode("ascii"), hashlib.sha256).digest())
+
+def _relative(path: str) -> str:
+    """``path`` as named in a cursor: relative to EXCEL_FILES_DIR."""
+    return os.path.relpath(path, os.path.realpath(FILES_DIR))
+
+def _encode_cursor(state: Dict[str, Any]) -> str:
+    payload = _b64(json.dumps(state, separators=(",", ":")).encode("utf-8"))
+    return f"{payload}.{_signature(payload)}"
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    """The state of a cursor issued by this server; forged or altered cursors are rejected."""
+    payload, _, signature = cursor.partition(".")
+    if not hmac.compare_digest(signature, _signature(payload)):
+        raise ValueError("Invalid cursor")
+    try:
+        state = json.loads(_unb64(payload))
+        for key in ("file", "sheet", "range", "bounds", "row", "mtime", "size", "id"):
+            state[key]
+        return state
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def _take_stream(stream_id: str, row: int) -> Optional[_Stream]:
+    """Remove and return the suspended reader for ``stream_id`` if it is positioned at ``row``."""
+    with _streams_lock:
+        stream = _streams.pop(stream_id, None)
+    if stream is not None and stream.next_row != row:
+        stream.close()
+        return None
+    return stream
+
+def _park_stream(stream_id: str, stream: _Stream):
+    stream.last_used = time.monotonic()
+    expired = []
+    with _streams_lock:
+        _streams[stream_id] = stream
+        now = time.monotonic()
+        for key, other in list(_streams.items()):
+            if len(_streams) > OPEN_CURSORS_MAX or now - other.last_used > CURSOR_TTL:
+                expired.append(_streams.pop(key))
+    for other in expired:
+        other.close()
+
+def _open_stream(path: str, sheet: str, start_row: int, max_row: Optional[int],
+                 min_col: int, max_col: int) -> _Stream:
+    with metrics.phase("load", path):
+        wb = load_workbook(path, read_only=True)
+    if sheet not in wb.sheetnames:
+        wb.close()
+        raise KeyError(f"Worksheet {sheet} does not exist.")
+    rows = iter_range_rows(wb[sheet], start_row, max_row, min_col, max_col)
+    return _Stream(wb, rows, start_row)
+
+def read_range_page(filename: str, sheet: str, cell_range: str, page_size: int = 1000,
+                    cursor: Optional[str] = None) -> Dict[str, Any]:
+    """Read one page of rows from a range.
+
+    Without ``cursor`` the read starts at the top of ``cell_range``; pass the
+    returned ``next_cursor`` to get the following page. ``next_cursor`` is None
+    once the range is exhausted. Between pages the streaming reader is kept
+    open, so later pages do not re-parse earlier rows. Cursors are signed and
+    name the file relative to EXCEL_FILES_DIR; one is rejected unless it was
+    issued here for the same file, sheet and range, and the file was not
+    modified since.
+    """
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} does not exist.")
+    path = os.path.realpath(filename)
+    page_size = max(1, min(int(page_size), PAGE_MAX_ROWS))
+
+    if cursor is None:
+        # Pages are read from disk, so unsaved cached edits must be written first.
+        workbook_cache.flush(path)
+        st = os.stat(path)
+        dimension = None
+        if is_open_range(cell_range):
+            dimension = read_sheet_dimension(path, sheet) or scan_sheet_dimension(path, sheet)
+        min_col, min_row, max_col, max_row = range_bounds(cell_range, dimension)
+        state = {"file": _relative(path), "sheet": sheet, "range": cell_range,
+                 "bounds": [min_col, min_row, max_col, max_row],
+                 "mtime": st.st_mtime_ns, "size": st.st_size, "id": uuid.uuid4().hex, "row": min_row}
+    else:
+        state = _decode_cursor(cursor)
+        if state["file"] != _relative(path):
+            raise ValueError("Cursor was issued for a different file")
+        if (state["sheet"], state["range"]) != (sheet, cell_range):
+            raise ValueError("Cursor was issued for a different sheet or range")
+        st = os.stat(path)
+        if (st.st_mtime_ns, st.st_size) != (state["mtime"], state["size"]):
+            raise ValueError("The file changed since the cursor was issued; restart the read without a cursor")
+
+    min_col, min_row, max_col, max_row = state["bounds"]
+    start_row = state["row"]
+
+    stream = _take_stream(state["id"], start_row)
+    if stream is None:
+        stream = _open_stream(path, sheet, start_row, max_row, min_col, max_col)
+
+    rows = []
+    for row in stream.rows:
+        rows.append(list(row))
+        if len(rows) >= page_size:
+            break
+    stream.next_row = start_row + len(rows)
+
+    finished = len(rows) < page_size or (max_row is not None and stream.next_row > max_row)
+    next_cursor = None
+    if finished:
+        stream.close()
+    else:
+        _park_stream(state["id"], stream)
+        state["row"] = stream.next_row
+        next_cursor = _encode_cursor(state)
+    return {
+        "sheet": sheet,
+        "start_row": start_row,
+        "end_row": start_row + len(rows) - 1,
+        "rows": rows,
+        "next_cursor": next_cursor,
+    }
@@ -0,0 +1,198 @@
+import io
+import os
+import csv
+import json
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+from openpyxl.utils import get_column_letter
+from atomic_save import write_file_atomic
+from workbook_cache import workbook_cache
+from excel_reader import read_sheet_dimension, scan_sheet_dimension, range_bounds, scan_columns
+
+# ---------- CONFIGURATION ----------
+
+# Rows held in memory at once while exporting (one Parquet row group per batch).
+EXPORT_BATCH_ROWS = int(os.getenv("EXCEL_EXPORT_BATCH_ROWS", "10000"))
+
+EXPORT_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson", ".parquet": "parquet"}
+
+
+# ---------- ROWS ----------
+
+def _batches(filename: str, sheet: str, cell_range: Optional[str]):
+    """``(column numbers, batch iterator)`` over the range, rows as dense lists and gaps as empty rows."""
+    dimension = read_sheet_dimension(filename, sheet) or scan_sheet_dimension(filename, sheet)
+    if dimension is None:
+        return [], iter(())
+    min_col, min_row, max_col, max_row = range_bounds(cell_range, dimension) if cell_range else dimension
+    columns = list(range(min_col, (max_col or min_col) + 1))
+    width = len(columns)
+
+    def batches() -> Iterator[List[List[Any]]]:
+        batch, expected = [], min_row
+        for row, values in scan_columns(filename, sheet, min_row, max_row, columns):
+            while expected < row:
+                batch.append([None] * width)
+                expected += 1
+            batch.append(values)
+            expected = row + 1
+            if len(batch) >= EXPORT_BATCH_ROWS:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    return columns, batches()
+
+def _text(value: Any) -> Any:
+    """JSON/CSV form of a cell value: dates and times as ISO 8601, durations in seconds."""
+    if isinstance(value, (datetime, date, dt_time)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return _text(value)
+
+
+# ---------- WRITERS ----------
+
+def _write_csv(f, names: Optional[List[str]], batches) -> int:
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    if names is not None:
+        writer.writerow(names)
+    rows = 0
+    for batch in batches:
+        writer.writerows([[_csv_value(v) for v in row] for row in batch])
+        rows += len(batch)
+    text.flush()
+    text.detach()  # leave the file to write_file_atomic
+    return rows
+
+def _write_ndjson(f, names: List[str], batches) -> int:
+    rows = 0
+    for batch in batches:
+        f.write("".join(json.dumps({name: _text(v) for name, v in zip(names, row)}, ensure_ascii=False) + "\n"
+                        for row in batch).encode("utf-8"))
+        rows += len(batch)
+    return rows
+
+def _arrow_type(values: List[Any]):
+    import pyarrow as pa
+    present = [v for v in values if v is not None]
+    if not present:
+        return pa.string()
+    if all(isinstance(v, bool) for v in present):
+        return pa.bool_()
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+        return pa.int64()
+    if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return pa.float64()
+    if all(isinstance(v, datetime) for v in present):
+        return pa.timestamp("us")
+    if all(isinstance(v, date) and not isinstance(v, datetime) for v in present):
+        return pa.date32()
+    return pa.string()
+
+def _arrow_column(values: List[Any], arrow_type, stats: Dict[str, int]):
+    """Convert one column of a batch to ``arrow_type``; values that do not fit become null."""
+    import pyarrow as pa
+    if arrow_type == pa.string():
+        values = [None if v is None else str(_text(v)) for v in values]
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+        fitting = []
+        for v in values:
+            try:
+                pa.array([v], type=arrow_type)
+                fitting.append(v)
+            except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, OverflowError):
+                fitting.append(None)
+                stats["nulled_values"] += 1
+        return pa.array(fitting, type=arrow_type)
+
+def _write_parquet(f, names: List[str], batches, stats: Dict[str, int]) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow)") from None
+    writer, schema, rows = None, None, 0
+    for batch in batches:
+        columns = list(zip(*batch))
+        if schema is None:
+            # the first batch fixes the column types for the whole file
+            schema = pa.schema([(name, _arrow_type(list(values))) for name, values in zip(names, columns)])
+            writer = pq.ParquetWriter(f, schema)
+        arrays = [_arrow_column(list(values), field.type, stats) for values, field in zip(columns, schema)]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        rows += len(batch)
+    if writer is None:
+        writer = pq.ParquetWriter(f, pa.schema([(name, pa.string()) for name in names]))
+    writer.close()
+    return rows
+
+
+# ---------- PUBLIC API ----------
+
+def export_sheet(filename: str, sheet: str, output: str, fmt: Optional[str] = None,
+                 cell_range: Optional[str] = None, header: bool = True) -> Dict[str, Any]:
+    """Stream a sheet (or ``cell_range`` of it) into a CSV, NDJSON or Parquet file.
+
+    The xlsx is read with the streaming value scanner and written in batches
+    of ``EXCEL_EXPORT_BATCH_ROWS`` rows, so memory does not grow with the
+    sheet. With ``header`` the first row names the columns (NDJSON keys,
+    Parquet fields); otherwise column letters are used. Numbers, booleans
+    and dates keep their type in NDJSON and Parquet; formulas are exported
+    as their "=..." text.
+    """
+    started = time.perf_counter()
+    if not os.path.exists(filename):
+        raise FileNotFoundError(f"{filename} does not exist.")
+    fmt = fmt or EXPORT_FORMATS.get(os.path.splitext(output)[1].lower())
+    if fmt not in ("csv", "ndjson", "parquet"):
+        raise ValueError(f"Unknown export format for {output}; use format csv, ndjson or parquet")
+    if os.path.realpath(output) == os.path.realpath(filename):
+        raise ValueError("The export would overwrite the workbook")
+    # The export reads from disk, so unsaved cached edits must be written first.
+    workbook_cache.flush(filename)
+    columns, batches = _batches(filename, sheet, cell_range)
+    names = [get_column_letter(column) for column in columns]
+    if header:
+        first = next(batches, None)
+        if first:
+            names = [str(_text(v)) if v is not None else letter for v, letter in zip(first[0], names)]
+            first = first[1:]
+        batches = _chain(first, batches)
+    stats = {"rows": 0, "nulled_values": 0}
+
+    def write(f):
+        if fmt == "csv":
+            stats["rows"] = _write_csv(f, names if header else None, batches)
+        elif fmt == "ndjson":
+            stats["rows"] = _write_ndjson(f, names, batches)
+        else:
+            stats["rows"] = _write_parquet(f, names, batches, stats)
+
+    write_file_atomic(output, write)
+    elapsed = time.perf_counter() - started
+    size = os.path.getsize(output)
+    summary = {"output": output, "format": fmt, "rows": stats["rows"], "columns": names,
+               "bytes": size, "elapsed_s": round(elapsed, 3),
+               "rows_per_s": round(stats["rows"] / elapsed) if elapsed > 0 else stats["rows"],
+               "mb_per_s": round(size / elapsed / 1e6, 2) if elapsed > 0 else 0.0}
+    if stats["nulled_values"]:
+        summary["nulled_values"] = stats["nulled_values"]  # Parquet cells not matching their column type
+    return summary
+
+def _chain(first: Optional[List[List[Any]]], rest: Iterator[List[List[Any]]]) -> Iterator[List[List[Any]]]:
+    if first:
+        yield first
+    yield from rest
@@ -0,0 +1,46 @@
+import pytest
+from openpyxl import load_workbook
+import bulk_import
+import excel_fucntion as xl
+
+
+@pytest.fixture
+def book(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk_import, "APPEND_MAX_CELLS", 100)
+    path = str(tmp_path / "book.xlsx")
+    xl.create_excel_file(path, "Data", [[1, 2], [3, 4]], header=["a", "b"])
+    yield path
+    xl.workbook_cache.invalidate(path)
+
+
+def test_create_streams_any_size(tmp_path):
+    path = str(tmp_path / "big.xlsx")
+    xl.create_excel_file(path, "Data", [[i, i * 2] for i in range(1000)])
+    assert load_workbook(path)["Data"].max_row == 1000
+
+def test_add_sheet_within_limit(book, tmp_path):
+    csv_path = tmp_path / "rows.csv"
+    csv_path.write_text("1,x\n2,y\n")
+    xl.add_sheet(book, "Csv", csv_path=str(csv_path), column_types=["int", "str"])
+    xl.add_sheet(book, "Array", [[5, 6]] * 49, header=["a", "b"])
+    xl.workbook_cache.flush(book)
+    wb = load_workbook(book)
+    assert [[c.value for c in row] for row in wb["Csv"].iter_rows()] == [[1, "x"], [2, "y"]]
+    assert wb["Array"].max_row == 50
+
+@pytest.mark.parametrize("source", ["data", "csv"])
+def test_add_sheet_over_limit_is_refused_untouched(book, tmp_path, source):
+    rows = [[i, i] for i in range(51)]
+    if source == "csv":
+        csv_path = tmp_path / "rows.csv"
+        csv_path.write_text("".join(f"{a},{b}\n" for a, b in rows))
+        kwargs = {"csv_path": str(csv_path)}
+    else:
+        kwargs = {"data": rows}
+    xl.write_cell(book, "Data", "C1", "pending")  # an unsaved cached edit must survive
+    with pytest.raises(ValueError, match="create_excel_file"):
+        xl.add_sheet(book, "Big", **kwargs)
+    xl.workbook_cache.flush(book)
+    wb = load_workbook(book)
+    assert wb.sheetnames == ["Data"]
+    assert wb["Data"]["C1"].value == "pending"
@@ -0,0 +1,77 @@
+import os
+import pytest
+from openpyxl import Workbook
+import cell_index
+from cell_index import CellIndex
+
+
+def _save(path, values):
+    wb = Workbook()
+    wb.active.title = "Data"
+    for row, value in enumerate(values, 1):
+        wb.active.cell(row=row, column=1, value=value)
+    wb.save(path)
+
+@pytest.fixture
+def index(tmp_path):
+    _save(str(tmp_path / "a.xlsx"), ["apple pie", 42, "banana"])
+    index = CellIndex(str(tmp_path))
+    yield index
+    index.close()
+
+def _cells(result):
+    return [(m["file"], m["cell"]) for m in result["matches"]]
+
+
+def test_find(index):
+    assert _cells(index.find("apple", "token")) == [("a.xlsx", "A1")]
+    assert _cells(index.find("42")) == [("a.xlsx", "A2")]
+    assert _cells(index.find(mode="range", min_value=40, max_value=50)) == [("a.xlsx", "A2")]
+
+def test_scan_runs_without_the_lock(index, monkeypatch):
+    held = []
+    scan_rows = cell_index.scan_rows
+
+    def spying_scan(path, sheet):
+        held.append(index._lock.locked())
+        return scan_rows(path, sheet)
+
+    monkeypatch.setattr(cell_index, "scan_rows", spying_scan)
+    assert index.refresh() == 1
+    assert held == [False]
+
+def test_file_rewritten_during_scan_is_not_committed(index, tmp_path, monkeypatch):
+    index.refresh()
+    path = str(tmp_path / "a.xlsx")
+    _save(path, ["cherry"])
+    scan_rows = cell_index.scan_rows
+
+    def racing_scan(file, sheet):
+        rows = list(scan_rows(file, sheet))
+        _save(path, ["damson", "elder"])
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+        return rows
+
+    monkeypatch.setattr(cell_index, "scan_rows", racing_scan)
+    assert index.refresh() == 0
+    monkeypatch.setattr(cell_index, "scan_rows", scan_rows)
+    assert index.refresh() == 1
+    assert _cells(index.find("damson")) == [("a.xlsx", "A1")]
+    assert index.find("cherry")["matches"] == [] and index.find("apple", "token")["matches"] == []
+
+def test_patched_write_does_not_hide_earlier_writes(tmp_path, monkeypatch):
+    import excel_fucntion as xl
+    monkeypatch.setattr(xl.workbook_cache, "max_entries", 0)
+    path = str(tmp_path / "a.xlsx")
+    _save(path, ["apple"])
+    index = cell_index.get_cell_index(str(tmp_path))
+    try:
+        assert _cells(index.find("apple", "token")) == [("a.xlsx", "A1")]
+        xl.write_range(path, "Data", "B1", [["banana"]])
+        xl.write_cell(path, "Data", "C1", "cherry")
+        assert _cells(index.find("banana")) == [("a.xlsx", "B1")]
+        assert _cells(index.find("cherry")) == [("a.xlsx", "C1")]
+    finally:
+        cell_index._indexes.pop(os.path.realpath(str(tmp_path)), None)
+        index.close()
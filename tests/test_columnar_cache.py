@@ -0,0 +1,34 @@
+import json
+import os
+from openpyxl import Workbook
+from columnar_cache import ColumnarCache
+
+
+def _book(path, value):
+    wb = Workbook()
+    wb.active.title = "Data"
+    wb.active["A1"] = value
+    wb.save(path)
+    return path
+
+def test_open_sheets_are_capped(tmp_path):
+    cache = ColumnarCache(enabled=True, directory=str(tmp_path / "side"), min_bytes=0, max_open=1)
+    paths = [_book(str(tmp_path / f"{name}.xlsx"), name) for name in ("a", "b")]
+    for path in paths:
+        assert cache.build(path)
+    assert cache.read_range(paths[0], "Data", "A1") == [["a"]]
+    assert cache.read_range(paths[1], "Data", "A1") == [["b"]]
+    assert list(cache._views) == [(os.path.realpath(paths[1]), "Data")]
+    assert len(cache._metas) == 1
+
+def test_touched_file_keeps_its_sidecar(tmp_path):
+    cache = ColumnarCache(enabled=True, directory=str(tmp_path / "side"), min_bytes=0)
+    path = _book(str(tmp_path / "a.xlsx"), "a")
+    assert cache.build(path)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert cache.read_range(path, "Data", "A1") == [["a"]]
+    side = os.listdir(cache._folder(os.path.realpath(path)))
+    assert "meta.json" in side and not [name for name in side if name.endswith((".tmp", ".bak"))]
+    with open(os.path.join(cache._folder(os.path.realpath(path)), "meta.json")) as f:
+        assert json.load(f)["mtime"] == st.st_mtime_ns + 1_000_000
@@ -0,0 +1,19 @@
+import os
+import shutil
+import pytest
+from directory_index import DirectoryIndex
+
+
+def test_watch_fd_closed_when_directory_goes_away(tmp_path):
+    folder = tmp_path / "books"
+    folder.mkdir()
+    index = DirectoryIndex(str(folder))
+    if index._inotify is None:
+        pytest.skip("inotify not available")
+    fd = index._inotify.fd
+    shutil.rmtree(folder)
+    index._watcher.join(5)
+    assert not index._watcher.is_alive() and index._inotify is None
+    with pytest.raises(OSError):
+        os.fstat(fd)
+    index.close()
@@ -0,0 +1,19 @@
+from openpyxl import Workbook
+import excel_fucntion as xl
+
+
+def test_reads_of_a_cached_workbook_create_no_cells(tmp_path):
+    path = str(tmp_path / "book.xlsx")
+    wb = Workbook()
+    wb.active.title = "Data"
+    wb.active["A1"] = "x"
+    wb.save(path)
+    try:
+        cached = xl.workbook_cache.get(path)
+        assert xl._loaded_workbook(path) is cached
+        assert xl.read_cell(path, "Data", "A1") == "x"
+        assert xl.read_cell(path, "Data", "Z99") is None
+        assert xl.read_range(path, "Data", "A1:C2") == [["x", None, None], [None, None, None]]
+        assert set(cached["Data"]._cells) == {(1, 1)}
+    finally:
+        xl.workbook_cache.invalidate(path)
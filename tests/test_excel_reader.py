@@ -0,0 +1,53 @@
+import re
+import zipfile
+from datetime import datetime
+import pytest
+from openpyxl import Workbook
+from excel_reader import scan_columns, scan_rows, shared_strings_part, styles_part
+
+
+@pytest.fixture
+def book(tmp_path):
+    """A workbook whose shared strings and styles live away from their usual paths."""
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws.append(["name", "when"])
+    ws.append(["alpha", datetime(2024, 1, 5)])
+    path = str(tmp_path / "book.xlsx")
+    wb.save(path)
+    with zipfile.ZipFile(path) as archive:
+        parts = {info.filename: archive.read(info) for info in archive.infolist()}
+    strings = []
+    def shared(match):
+        strings.append(match.group(2))
+        return b'%s t="s"><v>%d</v></c>' % (match.group(1), len(strings) - 1)
+    parts["xl/worksheets/sheet1.xml"] = re.sub(
+        rb'(<c r="\w+"(?: s="\d+")?) t="inlineStr"><is><t>([^<]*)</t></is></c>', shared, parts["xl/worksheets/sheet1.xml"])
+    parts["xl/parts/strings.xml"] = (
+        b'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">%s</sst>'
+        % b"".join(b"<si><t>%s</t></si>" % text for text in strings))
+    parts["xl/parts/look.xml"] = parts.pop("xl/styles.xml")
+    rels = parts["xl/_rels/workbook.xml.rels"].replace(b'Target="styles.xml"', b'Target="parts/look.xml"')
+    parts["xl/_rels/workbook.xml.rels"] = rels.replace(b"</Relationships>", (
+        b'<Relationship Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"'
+        b' Target="/xl/parts/strings.xml" Id="rIdSst" /></Relationships>'))
+    types = parts["[Content_Types].xml"].replace(b"/xl/styles.xml", b"/xl/parts/look.xml")
+    parts["[Content_Types].xml"] = types.replace(b"</Types>", (
+        b'<Override PartName="/xl/parts/strings.xml" ContentType="application/'
+        b'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>'))
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+    return path
+
+
+def test_parts_resolved_through_workbook_relationships(book):
+    with zipfile.ZipFile(book) as archive:
+        assert shared_strings_part(archive) == "xl/parts/strings.xml"
+        assert styles_part(archive) == "xl/parts/look.xml"
+
+def test_scans_decode_relocated_strings_and_dates(book):
+    expected = [(1, ["name", "when"]), (2, ["alpha", datetime(2024, 1, 5)])]
+    assert list(scan_columns(book, "Data", 1, None, [1, 2])) == expected
+    assert list(scan_rows(book, "Data")) == [(row, dict(enumerate(values, 1))) for row, values in expected]
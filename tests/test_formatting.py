@@ -0,0 +1,44 @@
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Font
+from formatting import style_key
+import excel_fucntion as xl
+
+
+def test_style_key_keeps_only_given_attributes():
+    assert style_key({"bg_color": "FFFF00", "bold": True}) == (("bold", True), ("bg_color", "FFFF00"))
+    assert style_key({}) == ()
+
+def test_style_map_merges_into_current_style():
+    wb = Workbook()
+    ws = wb.active
+    ws["A1"].font = Font(name="Arial", size=14, bold=True, color="FF0000")
+    ws["A1"].alignment = Alignment(horizontal="right")
+    ws["A1"].number_format = "0.00"
+    xl._write_range(wb, ws.title, "A1", [[1.5, 2]], [{"range": "A1:B1", "bg_color": "FFFF00"},
+                                                   {"columns": ["A"], "italic": True}])
+    a1, b1 = ws["A1"], ws["B1"]
+    assert a1.fill.fgColor.rgb.endswith("FFFF00") and b1.fill.fgColor.rgb.endswith("FFFF00")
+    assert (a1.font.name, a1.font.sz, a1.font.b, a1.font.i, a1.font.color.rgb) == ("Arial", 14, True, True, "00FF0000")
+    assert a1.alignment.horizontal == "right"
+    assert a1.number_format == "0.00"
+    assert not b1.font.b and not b1.font.i
+
+def test_write_cell_sets_all_its_attributes():
+    wb = Workbook()
+    ws = wb.active
+    ws["A1"].font = Font(bold=True, italic=True)
+    ws["A1"].alignment = Alignment(horizontal="right")
+    xl._write_cell(wb, ws.title, "A1", "x", bg_color="00FF00")
+    cell = ws["A1"]
+    assert not cell.font.b and not cell.font.i
+    assert cell.alignment.horizontal == "left"
+    assert cell.fill.fgColor.rgb.endswith("00FF00")
+
+def test_style_map_keeps_strike_and_superscript():
+    wb = Workbook()
+    ws = wb.active
+    ws["A1"].font = Font(strike=True, vertAlign="superscript", family=2, scheme="minor")
+    xl._write_range(wb, ws.title, "A1", [["x"]], [{"range": "A1", "bold": True, "font_color": "0000FF"}])
+    font = ws["A1"].font
+    assert (font.strike, font.vertAlign, font.family, font.scheme) == (True, "superscript", 2, "minor")
+    assert font.b and font.color.rgb == "000000FF"
@@ -0,0 +1,97 @@
+import random
+from datetime import date, datetime
+import pytest
+from openpyxl import Workbook
+import formula_engine
+from formula_engine import get_engine, notify_cells_changed, DIV0
+import excel_fucntion as xl
+
+
+def _workbook(rows=5000):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    rng = random.Random(7)
+    values = []
+    for row in range(1, rows + 1):
+        value = rng.randint(-1000, 1000) if row % 3 else rng.random() * 100
+        values.append(value)
+        ws.cell(row=row, column=1, value=value)
+        ws.cell(row=row, column=2, value=f"text {row}" if row % 5 == 0 else row)
+        ws.cell(row=row, column=3, value=row % 2 == 0)  # logicals are ignored by range aggregates
+    return wb, values
+
+@pytest.mark.parametrize("grid_min", [1, 10 ** 9])  # grid path and cell-by-cell path
+def test_range_aggregates(monkeypatch, grid_min):
+    monkeypatch.setattr(formula_engine, "GRID_MIN_CELLS", grid_min)
+    wb, values = _workbook()
+    ws = wb["Data"]
+    ws["E1"], ws["E2"], ws["E3"] = "=SUM(A:A)", "=AVERAGE(A1:A5000)", "=MIN(A1:A5000)"
+    ws["E4"], ws["E5"], ws["E6"] = "=MAX(A1:A5000)", "=COUNT(A1:C5000)", "=COUNTA(B:B)"
+    ws["E7"], ws["E8"] = "=SUM(C:C)", "=AVERAGE(C1:C10)"
+    engine = get_engine(wb)
+    assert engine.value("Data", "E1") == pytest.approx(sum(values))
+    assert engine.value("Data", "E2") == pytest.approx(sum(values) / len(values))
+    assert engine.value("Data", "E3") == min(values)
+    assert engine.value("Data", "E4") == max(values)
+    assert engine.value("Data", "E5") == 5000 + 4000
+    assert engine.value("Data", "E6") == 5000
+    assert engine.value("Data", "E7") == 0
+    assert engine.value("Data", "E8") == DIV0
+
+@pytest.mark.parametrize("grid_min", [1, 10 ** 9])
+def test_dates_aggregate_as_serial_numbers(monkeypatch, grid_min):
+    monkeypatch.setattr(formula_engine, "GRID_MIN_CELLS", grid_min)
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws["A1"], ws["A2"], ws["A3"] = datetime(2024, 1, 1), date(2024, 1, 3), datetime(2024, 1, 2, 12)
+    ws["B1"], ws["B2"], ws["B3"] = "=SUM(A1:A3)", "=AVERAGE(A1:A3)", "=COUNT(A1:A3)"
+    ws["B4"] = "=MAX(A1:A3)-MIN(A1:A3)"
+    engine = get_engine(wb)
+    assert engine.value("Data", "B1") == pytest.approx(45292 + 45294 + 45293.5)
+    assert engine.value("Data", "B2") == pytest.approx((45292 + 45294 + 45293.5) / 3)
+    assert engine.value("Data", "B3") == 3
+    assert engine.value("Data", "B4") == 2
+
+def test_integer_sums_stay_integers():
+    wb = Workbook()
+    ws = wb.active
+    for row in range(1, 2001):
+        ws.cell(row=row, column=1, value=row)
+    ws["B1"] = "=SUM(A1:A2000)"
+    value = get_engine(wb).value("Sheet", "B1")
+    assert value == 2001000 and type(value) is int
+
+def test_grid_follows_writes_and_formula_chains():
+    wb, values = _workbook(3000)
+    ws = wb["Data"]
+    ws["D1"] = "=A1*2"
+    ws["E1"] = "=SUM(D:D)+SUM(A1:A3000)"
+    engine = get_engine(wb)
+    assert engine.value("Data", "E1") == pytest.approx(values[0] * 2 + sum(values))
+    ws["A1"] = 10
+    ws["A5000"] = 1000000  # beyond the sheet's previous used area
+    notify_cells_changed(wb, "Data", [(1, 1), (5000, 1)])
+    ws["E1"] = "=SUM(D:D)+SUM(A:A)"
+    notify_cells_changed(wb, "Data", [(1, 5)])
+    assert engine.value("Data", "E1") == pytest.approx(20 + 10 + sum(values[1:]) + 1000000)
+
+def test_first_error_in_range_propagates():
+    wb, _ = _workbook(2000)
+    ws = wb["Data"]
+    ws["A1500"] = "=1/0"
+    ws["F1"] = "=SUM(A1:A2000)"
+    assert get_engine(wb).value("Data", "F1") == DIV0
+
+def test_rename_sheet_rewrites_references(tmp_path):
+    f = str(tmp_path / "book.xlsx")
+    xl.create_excel_file(f, "Data")
+    xl.add_sheet(f, "Report")
+    xl.write_row(f, "Data", "A1", [1, 2, 3])
+    xl.write_formula(f, "Report", "A1", "SUM(Data!A1:C1)")
+    xl.write_formula(f, "Data", "D1", "Data!A1+B1")
+    assert "updated 2 formula(s)" in xl.rename_sheet(f, "Data", "My Data")
+    assert xl.read_cell(f, "Report", "A1") == "=SUM('My Data'!A1:C1)"
+    assert xl.read_cell(f, "Report", "A1", computed=True) == 6
+    assert xl.read_cell(f, "My Data", "D1", computed=True) == 3
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+import pytest
+import main
+
+
+def test_blocking_tools_do_not_stall_the_event_loop():
+    release = threading.Event()
+    slow = main._offloaded(lambda: release.wait(5))
+    fast = main._offloaded(lambda: "done")
+
+    async def run():
+        pending = asyncio.ensure_future(slow())
+        assert await asyncio.wait_for(fast(), 1) == "done"
+        release.set()
+        assert await pending is True
+
+    asyncio.run(run())
+
+def test_request_timeout(monkeypatch):
+    monkeypatch.setattr(main, "EXCEL_REQUEST_TIMEOUT", 0.05)
+    release = threading.Event()
+
+    def stuck_tool():
+        release.wait(5)
+
+    async def run():
+        with pytest.raises(TimeoutError, match="stuck_tool is still running"):
+            await main._offloaded(stuck_tool)()
+        assert main._pending == 1  # the worker still holds its slot
+        release.set()
+        while main._pending:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(run())
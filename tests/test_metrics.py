@@ -0,0 +1,70 @@
+import threading
+import pytest
+from openpyxl import Workbook
+import excel_reader
+from metrics import Metrics
+
+
+@pytest.fixture
+def book(tmp_path):
+    wb = Workbook()
+    wb.active.title = "Data"
+    for row in range(1, 51):
+        wb.active.cell(row=row, column=1, value=row)
+    path = str(tmp_path / "book.xlsx")
+    wb.save(path)
+    return path
+
+def _counter(metrics, name, tool):
+    for line in metrics.prometheus().splitlines():
+        if line.startswith(f'excel_tool_{name}_total{{tool="{tool}"}}'):
+            return int(line.split()[-1])
+    return None
+
+
+def test_byte_counters_survive_file_eviction(book):
+    metrics = Metrics(enabled=True, alloc_sample=0, max_files=1)
+    seen = []
+    for i in range(3):
+        with metrics.tool_call("read", f"file{i}"):
+            with metrics.phase("load", book):
+                pass
+        seen.append(_counter(metrics, "bytes_read", "read"))
+    assert len(metrics.snapshot()["files"]) == 1
+    assert seen[0] > 0 and seen == [seen[0], 2 * seen[0], 3 * seen[0]]
+
+def test_streaming_reads_count_as_load(monkeypatch, book):
+    metrics = Metrics(enabled=True, alloc_sample=0)
+    monkeypatch.setattr(excel_reader, "metrics", metrics)
+    with metrics.tool_call("scan", book):
+        assert len(list(excel_reader.scan_columns(book, "Data", 1, None, [1]))) == 50
+        assert excel_reader.stream_range(book, "Data", "A1:A2") == [[1], [2]]
+        scan = excel_reader.scan_rows(book, "Data")
+        next(scan)
+        scan.close()  # an abandoned scan still records its phase
+    tools = metrics.snapshot()["tools"]
+    assert tools["scan"]["load"]["count"] == 1
+    assert _counter(metrics, "bytes_read", "scan") > 0
+    [totals] = metrics.snapshot()["files"]
+    assert totals["load_s"] > 0 and totals["bytes_read"] == _counter(metrics, "bytes_read", "scan")
+
+def test_allocation_sample_skips_overlapping_calls():
+    metrics = Metrics(enabled=True, alloc_sample=1.0)
+    started, release = threading.Event(), threading.Event()
+
+    def other():
+        with metrics.tool_call("other", "x"):
+            started.set()
+            release.wait()
+
+    with metrics.tool_call("traced", "x"):
+        worker = threading.Thread(target=other)
+        worker.start()
+        started.wait()
+    release.set()
+    worker.join()
+    with metrics.tool_call("alone", "x"):
+        bytearray(1 << 20)
+    peaks = {f["tool"]: f["peak_alloc_bytes"] for f in metrics.snapshot()["files"]}
+    assert peaks["traced"] == 0 and peaks["other"] == 0
+    assert peaks["alone"] >= 1 << 20
@@ -0,0 +1,51 @@
+import os
+import time
+import pytest
+from openpyxl import Workbook
+import multi_file
+from file_locks import lock_table
+
+
+@pytest.fixture
+def folder(tmp_path):
+    for month in (1, 2, 3):
+        wb = Workbook()
+        wb.active.title = "Data"
+        wb.active["A1"], wb.active["A2"] = "amount", month * 10
+        wb.save(str(tmp_path / f"sales_{month}.xlsx"))
+    yield str(tmp_path)
+    multi_file.close()
+
+
+def test_read_every_matching_file(folder, monkeypatch):
+    flushed = []
+
+    def flush(path):
+        # cached edits are written back under the file's read lock
+        flushed.append((os.path.basename(path), os.path.realpath(path) in lock_table._locks))
+
+    monkeypatch.setattr(multi_file.workbook_cache, "flush", flush)
+    result = multi_file.multi_file_read(folder, "sales_*.xlsx", "Data", "A2:A2")
+    assert [(item["file"], item["values"]) for item in result["files"]] == [
+        ("sales_1.xlsx", [[10]]), ("sales_2.xlsx", [[20]]), ("sales_3.xlsx", [[30]])]
+    assert sorted(flushed) == [("sales_1.xlsx", True), ("sales_2.xlsx", True), ("sales_3.xlsx", True)]
+    assert not lock_table._locks
+
+def test_errors_are_reported_per_file(folder):
+    result = multi_file.multi_file_read(folder, "sales_*.xlsx", "Missing", "A1:A1")
+    assert result["failed_files"] == 3
+    assert not lock_table._locks
+
+def test_replacing_the_pool_frees_a_stuck_worker(folder):
+    pool = multi_file._get_pool()
+    stuck = pool.submit(time.sleep, 60)
+    while multi_file._pool_pids[pool].empty():  # the worker has started
+        time.sleep(0.05)
+    started = time.monotonic()
+    multi_file._replace_pool(pool)
+    with pytest.raises(multi_file.BrokenProcessPool):
+        stuck.result(timeout=30)
+    assert time.monotonic() - started < 30
+    assert multi_file._get_pool() is not pool
+    result = multi_file.multi_file_read(folder, "sales_1.xlsx", "Data", "A2:A2")
+    assert result["files"][0]["values"] == [[10]]
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import subprocess
+import textwrap
+import pytest
+from openpyxl import Workbook, load_workbook
+import op_journal
+import excel_fucntion as xl
+from workbook_cache import workbook_cache
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _workbook(path):
+    wb = Workbook()
+    wb.active.title = "S"
+    wb.active["A1"] = "base"
+    wb.save(path)
+    return str(path)
+
+def _crash_after(path, body, sync_ms="0"):
+    """Run ``body`` in a journaled child process that is SIGKILLed before compaction."""
+    script = textwrap.dedent(f"""
+        import os, signal, sys, time
+        sys.path.insert(0, {ROOT!r})
+        import excel_fucntion as xl
+        f = {path!r}
+    """) + textwrap.dedent(body) + "\nos.kill(os.getpid(), signal.SIGKILL)\n"
+    env = dict(os.environ, EXCEL_JOURNAL="true", EXCEL_JOURNAL_SYNC_MS=sync_ms,
+               EXCEL_JOURNAL_COMPACT_INTERVAL="3600")
+    proc = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True)
+    assert proc.returncode == -9, proc.stderr
+
+@pytest.fixture
+def journaled(monkeypatch):
+    monkeypatch.setattr(op_journal, "JOURNAL_ENABLED", True)
+    monkeypatch.setattr(op_journal, "JOURNAL_SYNC_MS", 0)
+    monkeypatch.setattr(op_journal, "JOURNAL_COMPACT_INTERVAL", 3600)
+    yield
+    workbook_cache.close()
+
+
+def test_edits_survive_kill_before_compaction(tmp_path):
+    f = _workbook(tmp_path / "book.xlsx")
+    saved = os.stat(f).st_mtime_ns
+    _crash_after(f, """
+        xl.write_cell(f, "S", "B1", 42)
+        xl.write_row(f, "S", "A2", [1, 2, 3])
+        xl.add_sheet(f, "New")
+        xl.write_cell(f, "New", "A1", "hello")
+        xl.rename_sheet(f, "New", "Renamed")
+    """)
+    assert os.stat(f).st_mtime_ns == saved  # nothing was folded in
+    assert op_journal.pending_journals(str(tmp_path)) == [f]
+
+    assert xl.recover_journals(str(tmp_path)) == ["book.xlsx: replayed 5 of 5 operation(s)"]
+    workbook_cache.close()
+    wb = load_workbook(f)
+    assert wb.sheetnames == ["S", "Renamed"]
+    assert [c.value for c in wb["S"][2]] == [1, 2, 3]
+    assert wb["S"]["B1"].value == 42 and wb["Renamed"]["A1"].value == "hello"
+    assert not os.path.exists(op_journal.journal_path(f))
+
+def test_group_commit_makes_acknowledged_edits_durable(tmp_path):
+    f = _workbook(tmp_path / "book.xlsx")
+    _crash_after(f, """
+        for i in range(100):
+            xl.write_cell(f, "S", f"C{i + 1}", i)
+        time.sleep(0.5)  # longer than the group commit window
+    """, sync_ms="20")
+    with open(op_journal.journal_path(f)) as log:
+        assert len(log.read().splitlines()) == 101  # header + one record per edit
+
+    xl.recover_journals(str(tmp_path))
+    workbook_cache.close()
+    ws = load_workbook(f)["S"]
+    assert [ws[f"C{i + 1}"].value for i in range(100)] == list(range(100))
+
+def test_new_edit_replays_unrecovered_log_instead_of_truncating(tmp_path, journaled):
+    f = _workbook(tmp_path / "book.xlsx")
+    _crash_after(f, 'xl.write_cell(f, "S", "B1", "before crash")')
+    xl.write_cell(f, "S", "B2", "after restart")  # no recover_journals() call
+    workbook_cache.flush(f)
+    ws = load_workbook(f)["S"]
+    assert (ws["B1"].value, ws["B2"].value) == ("before crash", "after restart")
+
+def test_existing_log_is_never_truncated(tmp_path):
+    f = _workbook(tmp_path / "book.xlsx")
+    _crash_after(f, 'xl.write_cell(f, "S", "B1", 1)')
+    before = open(op_journal.journal_path(f)).read()
+    with pytest.raises(op_journal.UnrecoveredJournal):
+        op_journal.append(f, {"op": "write_cell", "sheet": "S", "cell": "B2", "value": 2})
+    assert open(op_journal.journal_path(f)).read() == before
+    assert op_journal.unrecovered(f)
+
+def test_stale_log_and_torn_record(tmp_path):
+    f = _workbook(tmp_path / "book.xlsx")
+    log = op_journal.journal_path(f)
+    with open(log, "w") as out:
+        out.write(json.dumps({"base": [1, 2]}) + "\n" + json.dumps({"op": "delete_sheet", "sheet_name": "S"}) + "\n")
+    assert xl.recover_journals(str(tmp_path)) == []  # saved after the log began: not replayed
+    assert load_workbook(f).sheetnames == ["S"] and not os.path.exists(log)
+
+    size, mtime = os.stat(f).st_size, os.stat(f).st_mtime_ns
+    with open(log, "w") as out:
+        out.write(json.dumps({"base": [size, mtime]}) + "\n"
+                  + json.dumps({"op": "write_cell", "sheet": "S", "cell": "D1", "value": 7}) + "\n{\"op\": \"wri")
+    assert xl.recover_journals(str(tmp_path)) == ["book.xlsx: replayed 1 of 1 operation(s)"]
+    workbook_cache.close()
+    assert load_workbook(f)["S"]["D1"].value == 7
+
+def test_undo(tmp_path, journaled):
+    f = _workbook(tmp_path / "book.xlsx")
+    xl.write_cell(f, "S", "B1", "one")
+    xl.write_cell(f, "S", "B2", "two")
+    xl.merge_cells(f, "S", "D1:E1")
+    assert xl.undo_operations(f, 2) == "Undid 2 operation(s); 1 more can be undone"
+    assert xl.read_range(f, "S", "B1:B2") == [["one"], [None]]
+    assert not xl.load_excel_file(f)["S"].merged_cells.ranges
+    with pytest.raises(ValueError):
+        xl.undo_operations(f, 2)
+    workbook_cache.flush(f)  # compaction: nothing left to undo
+    assert not os.path.exists(op_journal.journal_path(f))
+    with pytest.raises(ValueError):
+        xl.undo_operations(f)
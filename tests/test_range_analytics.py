@@ -0,0 +1,59 @@
+from datetime import datetime
+import pytest
+from openpyxl import Workbook
+from range_analytics import aggregate_range, query_range
+
+ROWS = [
+    ("Region", "Amount", "Paid", "Note", "Date"),
+    ("North", 10, True, "Rush order", datetime(2024, 1, 5)),
+    ("South", 2.5, False, "", datetime(2024, 2, 1)),
+    ("North", "n/a", True, None, datetime(2024, 3, 9)),
+    ("East", 7, 1, "late RUSH", None),
+    ("South", -4, True, "ok", datetime(2024, 1, 20)),
+]
+
+
+@pytest.fixture
+def book(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    for row in ROWS:
+        ws.append(row)
+    path = str(tmp_path / "book.xlsx")
+    wb.save(path)
+    return path
+
+def _result(book, aggregates, **options):
+    return aggregate_range(book, "Data", "A1:E6", aggregates, **options)["result"]
+
+
+def test_booleans_are_not_numbers(book):
+    result = _result(book, [{"func": "sum", "column": "Paid"}, {"func": "count", "column": "Paid"},
+                            {"func": "sum", "column": "Amount"}, {"func": "mean", "column": "Amount"}])
+    assert result == {"sum_Paid": 1, "count_Paid": 1, "sum_Amount": 15.5, "mean_Amount": 3.875}
+
+@pytest.mark.parametrize("condition, rows", [
+    ({"column": "Amount", "op": ">", "value": 0}, [2, 3, 5]),
+    ({"column": "Amount", "op": "!=", "value": 10}, [3, 4, 5, 6]),
+    ({"column": "Paid", "op": "==", "value": True}, [2, 4, 6]),
+    ({"column": "Paid", "op": "==", "value": 1}, [5]),
+    ({"column": "Region", "op": "==", "value": "North"}, [2, 4]),
+    ({"column": "Region", "op": "in", "value": ["East", "South"]}, [3, 5, 6]),
+    ({"column": "Region", "op": "not_in", "value": ["East", "South"]}, [2, 4]),
+    ({"column": "Note", "op": "contains", "value": "rush"}, [2, 5]),
+    ({"column": "Note", "op": "empty"}, [3, 4]),
+    ({"column": "Note", "op": "not_empty"}, [2, 5, 6]),
+    ({"column": "Date", "op": ">=", "value": "2024-01-20"}, [3, 4, 6]),
+    ({"column": "Amount", "op": "in", "value": [7, "n/a"]}, [4, 5]),
+])
+def test_filters(book, condition, rows):
+    result = query_range(book, "Data", "A1:E6", ["Region"], [condition])
+    assert result["row_numbers"] == rows
+
+def test_group_by_and_order(book):
+    result = aggregate_range(book, "Data", "A1:E6", [{"func": "sum", "column": "Amount"}], group_by=["Region"],
+                             order_by="sum_Amount")
+    assert [(g["Region"], g["sum_Amount"]) for g in result["groups"]] == [("North", 10), ("East", 7), ("South", -1.5)]
+    top = query_range(book, "Data", "A1:E6", ["Region", "Amount"], order_by="Amount", descending=True, limit=2)
+    assert top["rows"] == [["North", 10], ["East", 7]]
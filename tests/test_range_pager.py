@@ -0,0 +1,55 @@
+import base64
+import json
+import pytest
+from openpyxl import Workbook
+import range_pager
+from range_pager import read_range_page
+
+
+@pytest.fixture
+def book(tmp_path, monkeypatch):
+    monkeypatch.setattr(range_pager, "FILES_DIR", str(tmp_path))
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    for row in range(1, 11):
+        ws.cell(row=row, column=1, value=row)
+    wb.create_sheet("Other")
+    path = str(tmp_path / "book.xlsx")
+    wb.save(path)
+    return path
+
+def _state(cursor):
+    payload = cursor.split(".")[0]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+
+def test_pages(book):
+    page = read_range_page(book, "Data", "A1:A10", 4)
+    rows, cursor = page["rows"], page["next_cursor"]
+    while cursor:
+        page = read_range_page(book, "Data", "A1:A10", 4, cursor)
+        rows, cursor = rows + page["rows"], page["next_cursor"]
+    assert rows == [[n] for n in range(1, 11)]
+
+def test_cursor_names_file_relative_to_files_dir(book):
+    cursor = read_range_page(book, "Data", "A1:A10", 4)["next_cursor"]
+    assert _state(cursor)["file"] == "book.xlsx"
+    assert book not in base64.urlsafe_b64decode(cursor.split(".")[0] + "==").decode()
+
+def test_altered_cursor_is_rejected(book):
+    cursor = read_range_page(book, "Data", "A1:A10", 4)["next_cursor"]
+    state = _state(cursor)
+    state["row"] = 1
+    payload = base64.urlsafe_b64encode(json.dumps(state).encode()).decode().rstrip("=")
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        read_range_page(book, "Data", "A1:A10", 4, f"{payload}.{cursor.split('.')[1]}")
+    with pytest.raises(ValueError, match="Invalid cursor"):
+        read_range_page(book, "Data", "A1:A10", 4, payload)
+
+def test_cursor_for_another_sheet_or_range_is_rejected(book):
+    cursor = read_range_page(book, "Data", "A1:A10", 4)["next_cursor"]
+    with pytest.raises(ValueError, match="different sheet"):
+        read_range_page(book, "Other", "A1:A10", 4, cursor)
+    with pytest.raises(ValueError, match="different sheet or range"):
+        read_range_page(book, "Data", "A1:A5", 4, cursor)
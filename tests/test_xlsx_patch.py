@@ -0,0 +1,148 @@
+import re
+import zipfile
+import pytest
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font
+from formatting import style_key
+from xlsx_patch import patch_cells, PatchUnsupported
+
+
+@pytest.fixture
+def book(tmp_path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Data"
+    ws["A1"], ws["B1"], ws["C1"] = "name", "amount", "note"
+    ws["A2"], ws["B2"], ws["C2"] = "alpha", 10, "shared"
+    ws["A3"], ws["B3"], ws["C3"] = "beta", 20, "shared"
+    ws["B4"] = "=SUM(B2:B3)"
+    ws["A1"].font = Font(bold=True, color="FF0000")
+    wb.create_sheet("Other")["A1"] = "untouched"
+    path = str(tmp_path / "book.xlsx")
+    wb.save(path)
+    return path
+
+def _use_shared_strings(path):
+    """Rewrite the inline strings openpyxl saves into a shared-string table, as Excel writes them."""
+    with zipfile.ZipFile(path) as archive:
+        parts = {info.filename: archive.read(info) for info in archive.infolist()}
+    strings = []
+    def shared(match):
+        strings.append(match.group(2))
+        return b'%s t="s"><v>%d</v></c>' % (match.group(1), len(strings) - 1)
+    for name in [n for n in parts if n.startswith("xl/worksheets/")]:
+        parts[name] = re.sub(rb'(<c r="\w+"(?: s="\d+")?) t="inlineStr"><is><t>([^<]*)</t></is></c>', shared, parts[name])
+    parts["xl/sharedStrings.xml"] = (
+        b'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="%d" uniqueCount="%d">%s</sst>'
+        % (len(strings), len(strings), b"".join(b"<si><t>%s</t></si>" % text for text in strings)))
+    parts["xl/_rels/workbook.xml.rels"] = parts["xl/_rels/workbook.xml.rels"].replace(b"</Relationships>", (
+        b'<Relationship Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"'
+        b' Target="sharedStrings.xml" Id="rIdSst" /></Relationships>'))
+    parts["[Content_Types].xml"] = parts["[Content_Types].xml"].replace(b"</Types>", (
+        b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+        b'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>'))
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+
+def _members(path):
+    with zipfile.ZipFile(path) as archive:
+        return {info.filename: (archive.read(info), info.compress_type) for info in archive.infolist()}
+
+def _sheet_xml(path, index=1):
+    with zipfile.ZipFile(path) as archive:
+        return archive.read(f"xl/worksheets/sheet{index}.xml")
+
+
+def test_unchanged_members_are_copied(book):
+    before = _members(book)
+    patch_cells(book, book, [("Data", "B2", 11)])
+    after = _members(book)
+    assert set(after) == set(before)
+    changed = {name for name in before if after[name] != before[name]}
+    assert changed == {"xl/worksheets/sheet1.xml"}
+
+def test_shared_strings_kept_and_new_strings_inline(book):
+    _use_shared_strings(book)
+    assert b't="s"' in _sheet_xml(book)
+    before = _members(book)["xl/sharedStrings.xml"]
+    patch_cells(book, book, [("Data", "C2", "edited"), ("Data", "D2", "new")])
+    assert _members(book)["xl/sharedStrings.xml"] == before
+    ws = load_workbook(book)["Data"]
+    assert [ws["C2"].value, ws["D2"].value, ws["C3"].value, ws["A2"].value] == ["edited", "new", "shared", "alpha"]
+    assert load_workbook(book)["Other"]["A1"].value == "untouched"
+
+def test_inline_strings_escape_and_preserve_space(book):
+    text = " <a & b> \"q\" "
+    patch_cells(book, book, [("Data", "A5", text), ("Data", "A6", "=")])
+    ws = load_workbook(book)["Data"]
+    assert ws["A5"].value == text
+    assert ws["A6"].value == "="  # a lone "=" is text, not a formula
+    assert b'xml:space="preserve"' in _sheet_xml(book)
+
+def test_values_keep_cell_style(book):
+    patch_cells(book, book, [("Data", "A1", "title"), ("Data", "B2", None), ("Data", "B3", 2.5), ("Data", "C3", True)])
+    ws = load_workbook(book)["Data"]
+    assert ws["A1"].value == "title"
+    assert ws["A1"].font.b and ws["A1"].font.color.rgb == "00FF0000"
+    assert ws["B2"].value is None
+    assert ws["B3"].value == 2.5
+    assert ws["C3"].value is True
+
+def test_restyle(book):
+    key = style_key({"bold": True, "bg_color": "FFFF00", "align": "center"})
+    patch_cells(book, book, [("Data", "B2", 5), ("Data", "E9", "styled")], key)
+    ws = load_workbook(book)["Data"]
+    for ref in ("B2", "E9"):
+        cell = ws[ref]
+        assert cell.font.b
+        assert cell.fill.fgColor.rgb.endswith("FFFF00")
+        assert cell.alignment.horizontal == "center"
+    assert ws["E9"].value == "styled"
+    assert not ws["B3"].font.b and ws["B3"].fill.fill_type is None
+    assert ws["A1"].font.color.rgb == "00FF0000"
+
+def test_restyle_keeps_attributes_not_given(book):
+    patch_cells(book, book, [("Data", "A1", "title")], style_key({"bg_color": "FFFF00"}))
+    patch_cells(book, book, [("Data", "A1", "title")], style_key({"italic": True}))
+    cell = load_workbook(book)["Data"]["A1"]
+    assert cell.font.b and cell.font.i and cell.font.color.rgb == "00FF0000"
+    assert cell.fill.fgColor.rgb.endswith("FFFF00")
+
+def test_restyle_keeps_strike_and_superscript(book):
+    wb = load_workbook(book)
+    wb["Data"]["A2"].font = Font(strike=True, vertAlign="superscript")
+    wb.save(book)
+    patch_cells(book, book, [("Data", "A2", "gamma")], style_key({"bold": True}))
+    font = load_workbook(book)["Data"]["A2"].font
+    assert font.b and font.strike and font.vertAlign == "superscript"
+
+def test_formulas(book):
+    patch_cells(book, book, [("Data", "B4", "=B2*B3"), ("Data", "B5", "=B4+1")])
+    ws = load_workbook(book)["Data"]
+    assert ws["B4"].value == "=B2*B3"
+    assert ws["B5"].value == "=B4+1"
+    with zipfile.ZipFile(book) as archive:
+        assert b'fullCalcOnLoad="1"' in archive.read("xl/workbook.xml")
+
+def test_dimension_grows(book, tmp_path):
+    out = str(tmp_path / "copy.xlsx")
+    assert patch_cells(book, out, [("Data", "F20", 1), ("Data", "A1", "x")]) == 2
+    assert re.search(rb'<dimension ref="A1:F20"/>', _sheet_xml(out))
+    ws = load_workbook(out)["Data"]
+    assert (ws.max_row, ws.max_column) == (20, 6)
+    assert load_workbook(book)["Data"]["A1"].value == "name"  # source untouched
+
+def test_unrecognized_row_content_is_refused(book, tmp_path):
+    with zipfile.ZipFile(book) as archive:
+        parts = {info.filename: archive.read(info) for info in archive.infolist()}
+    parts["xl/worksheets/sheet1.xml"] = parts["xl/worksheets/sheet1.xml"].replace(
+        b'<c r="B2"', b'<!-- note --><c r="B2"', 1)
+    odd = str(tmp_path / "odd.xlsx")
+    with zipfile.ZipFile(odd, "w") as archive:
+        for name, data in parts.items():
+            archive.writestr(name, data)
+    before = _members(odd)
+    with pytest.raises(PatchUnsupported):
+        patch_cells(odd, odd, [("Data", "C2", 1)])
+    assert _members(odd) == before
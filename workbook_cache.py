@@ -0,0 +1,270 @@
+import os
+import atexit
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from openpyxl import load_workbook
+from file_locks import lock_table
+from atomic_save import save_workbook_atomic
+from metrics import metrics
+
+# ---------- CONFIGURATION ----------
+
+# Maximum number of workbooks kept loaded. 0 disables caching entirely, in which
+# case every call loads from disk and every mutation saves immediately.
+CACHE_MAX_ENTRIES = int(os.getenv("EXCEL_CACHE_MAX_ENTRIES", "8"))
+# Budget for the combined on-disk size of the cached workbooks, in megabytes.
+CACHE_MAX_MB = float(os.getenv("EXCEL_CACHE_MAX_MB", "256"))
+# Seconds of write inactivity after which a dirty workbook is saved to disk.
+CACHE_FLUSH_DELAY = float(os.getenv("EXCEL_CACHE_FLUSH_DELAY", "2.0"))
+
+
+class _Entry:
+    __slots__ = ("path", "workbook", "mtime_ns", "size", "dirty", "evicted", "lock", "timer")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.workbook = None
+        self.mtime_ns = None
+        self.size = 0
+        self.dirty = False
+        self.evicted = False
+        self.lock = threading.RLock()
+        self.timer = None
+
+
+class WorkbookCache:
+    """LRU cache of loaded workbooks with debounced write-back.
+
+    Entries are keyed by the resolved path and remember the mtime/size of the
+    file they were loaded from; a clean entry whose file changed on disk is
+    reloaded transparently. Mutations made through ``edit()`` stay in memory
+    and are written back after ``flush_delay`` seconds without further edits,
+    on ``flush()``, when the entry is evicted and on ``close()``.
+
+    Callbacks registered with ``add_clean_listener`` get the path of a
+    workbook whose pending changes were just saved or discarded.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_mb: float = CACHE_MAX_MB,
+                 flush_delay: float = CACHE_FLUSH_DELAY):
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.flush_delay = flush_delay
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._clean_listeners = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    # ---------- PUBLIC API ----------
+
+    def get(self, path: str):
+        """Return the workbook for ``path``, loading it if needed."""
+        if not self.enabled:
+            with metrics.phase("load", path):
+                return load_workbook(path)
+        entry = self._acquire(path)
+        try:
+            return entry.workbook
+        finally:
+            entry.lock.release()
+            self._evict()
+
+    @contextmanager
+    def edit(self, path: str, flush_delay: float = None):
+        """Yield the workbook for ``path`` and mark it dirty on success.
+
+        If the block raises, an entry that had no pending changes is dropped
+        so the next access reloads the unmodified file from disk. With
+        ``flush_delay`` the write-back is not postponed by later edits: it
+        happens that many seconds after the first unsaved one.
+        """
+        if not self.enabled:
+            with metrics.phase("load", path):
+                wb = load_workbook(path)
+            yield wb
+            save_workbook_atomic(wb, path)
+            return
+        entry = self._acquire(path)
+        try:
+            was_dirty = entry.dirty
+            try:
+                yield entry.workbook
+            except BaseException:
+                if not was_dirty:
+                    self._drop(entry)
+                raise
+            entry.dirty = True
+            self._schedule_flush(entry, flush_delay)
+        finally:
+            entry.lock.release()
+            self._evict()
+
+    def is_dirty(self, path: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(os.path.realpath(path))
+        return entry is not None and entry.dirty
+
+    def peek(self, path: str):
+        """Return the cached workbook for ``path`` without loading it.
+
+        Returns None when nothing is cached or the cached copy is clean but
+        older than the file on disk.
+        """
+        with self._lock:
+            entry = self._entries.get(os.path.realpath(path))
+        if entry is None:
+            return None
+        wb = entry.workbook
+        if wb is None or entry.dirty:
+            return wb
+        try:
+            st = os.stat(entry.path)
+        except OSError:
+            return None
+        if (entry.mtime_ns, entry.size) != (st.st_mtime_ns, st.st_size):
+            return None
+        return wb
+
+    def flush(self, path: str = None) -> int:
+        """Write back dirty workbooks (all of them when ``path`` is None)."""
+        with self._lock:
+            if path is None:
+                entries = list(self._entries.values())
+            else:
+                entry = self._entries.get(os.path.realpath(path))
+                entries = [entry] if entry is not None else []
+        return sum(1 for entry in entries if self._flush_entry(entry))
+
+    def invalidate(self, path: str):
+        """Forget the cached copy of ``path`` without writing it back."""
+        with self._lock:
+            entry = self._entries.get(os.path.realpath(path))
+        if entry is not None:
+            with entry.lock:
+                self._drop(entry)
+
+    def add_clean_listener(self, callback):
+        """Call ``callback(path)`` whenever the unsaved changes of a workbook are saved or discarded."""
+        self._clean_listeners.append(callback)
+
+    def close(self):
+        """Flush every dirty workbook and empty the cache."""
+        self.flush()
+        with self._lock:
+            entries = list(self._entries.values())
+        for entry in entries:
+            with entry.lock:
+                self._drop(entry)
+
+    # ---------- INTERNALS ----------
+
+    def _acquire(self, path: str) -> _Entry:
+        """Return the loaded, up-to-date entry for ``path`` with its lock held."""
+        key = os.path.realpath(path)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = _Entry(key)
+                    self._entries[key] = entry
+                self._entries.move_to_end(key)
+            entry.lock.acquire()
+            if entry.evicted:
+                entry.lock.release()
+                continue
+            try:
+                st = os.stat(key)
+                stale = (entry.mtime_ns, entry.size) != (st.st_mtime_ns, st.st_size)
+                if entry.workbook is None or (stale and not entry.dirty):
+                    with metrics.phase("load", key):
+                        entry.workbook = load_workbook(key)
+                    entry.mtime_ns, entry.size = st.st_mtime_ns, st.st_size
+            except BaseException:
+                self._drop(entry)
+                entry.lock.release()
+                raise
+            return entry
+
+    def _schedule_flush(self, entry: _Entry, delay: float = None):
+        if entry.timer is not None:
+            if delay is not None:
+                return  # not debounced: keep the timer of the first unsaved edit
+            entry.timer.cancel()
+        entry.timer = threading.Timer(self.flush_delay if delay is None else delay,
+                                      self._flush_from_timer, args=(entry,))
+        entry.timer.daemon = True
+        entry.timer.start()
+
+    def _flush_from_timer(self, entry: _Entry):
+        # Exclude readers streaming the same file from disk while it is rewritten.
+        with lock_table.write_locked(entry.path):
+            self._flush_entry(entry)
+
+    def _flush_entry(self, entry: _Entry) -> bool:
+        with entry.lock:
+            if entry.timer is not None:
+                entry.timer.cancel()
+                entry.timer = None
+            if not entry.dirty or entry.workbook is None:
+                return False
+            save_workbook_atomic(entry.workbook, entry.path)
+            st = os.stat(entry.path)
+            entry.mtime_ns, entry.size = st.st_mtime_ns, st.st_size
+            entry.dirty = False
+            self._cleaned(entry)
+            return True
+
+    def _drop(self, entry: _Entry):
+        """Remove ``entry`` from the cache. Caller must hold ``entry.lock``."""
+        if entry.timer is not None:
+            entry.timer.cancel()
+            entry.timer = None
+        entry.evicted = True
+        entry.workbook = None
+        if entry.dirty:
+            entry.dirty = False
+            self._cleaned(entry)
+        with self._lock:
+            if self._entries.get(entry.path) is entry:
+                del self._entries[entry.path]
+
+    def _cleaned(self, entry: _Entry):
+        for callback in self._clean_listeners:
+            callback(entry.path)
+
+    def _evict(self):
+        """Flush and drop least recently used entries until within the caps."""
+        with self._lock:
+            candidates = list(self._entries.values())
+        count = len(candidates)
+        total = sum(entry.size for entry in candidates)
+        for entry in candidates:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            if count == 1:
+                break  # always keep the most recently used workbook
+            # Never wait here: the caller may hold the file lock of another entry.
+            if not lock_table.try_write_lock(entry.path):
+                continue  # file in use by a tool call
+            try:
+                if not entry.lock.acquire(blocking=False):
+                    continue  # in use by another thread
+                try:
+                    if entry.evicted:
+                        continue
+                    self._flush_entry(entry)
+                    count -= 1
+                    total -= entry.size
+                    self._drop(entry)
+                finally:
+                    entry.lock.release()
+            finally:
+                lock_table.release_write(entry.path)
+
+
+workbook_cache = WorkbookCache()
+atexit.register(workbook_cache.close)
@@ -0,0 +1,110 @@
+import os
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from openpyxl.utils import get_column_letter
+from workbook_cache import workbook_cache
+from excel_reader import read_sheet_names, scan_rows
+
+# ---------- CONFIGURATION ----------
+
+# Most changed cells listed in one diff; further changes are only counted.
+DIFF_MAX_CHANGES = int(os.getenv("EXCEL_DIFF_MAX_CHANGES", "1000"))
+
+_END = (float("inf"), None)
+
+
+# ---------- DIFF ----------
+
+def _same(old: Any, new: Any) -> bool:
+    # True == 1 in Python, but TRUE and 1 are different cell values.
+    return old == new and (type(old) is bool) == (type(new) is bool)
+
+def _same_row(old: Dict[int, Any], new: Dict[int, Any]) -> bool:
+    if old != new:
+        return False
+    return not any(type(v) is bool for v in old.values()) or all(_same(v, new[c]) for c, v in old.items())
+
+def _is_formula(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith("=")
+
+def _paired_rows(old_rows: Iterator, new_rows: Iterator) -> Iterator[Tuple[int, Dict[int, Any], Dict[int, Any]]]:
+    """Merge two row streams (both ordered by row number) into ``(row, old cells, new cells)``."""
+    old_number, old = next(old_rows, _END)
+    new_number, new = next(new_rows, _END)
+    while old is not None or new is not None:
+        if old_number == new_number:
+            yield old_number, old, new
+            old_number, old = next(old_rows, _END)
+            new_number, new = next(new_rows, _END)
+        elif old_number < new_number:
+            yield old_number, old, {}
+            old_number, old = next(old_rows, _END)
+        else:
+            yield new_number, {}, new
+            new_number, new = next(new_rows, _END)
+
+def _diff_sheet(old_filename: str, new_filename: str, sheet: str, changes: List[Dict[str, Any]],
+                max_changes: int) -> Dict[str, int]:
+    """Stream one sheet of both files side by side, appending changed cells to ``changes``."""
+    changed_rows = changed_cells = formula_changes = 0
+    for row, old, new in _paired_rows(scan_rows(old_filename, sheet), scan_rows(new_filename, sheet)):
+        if _same_row(old, new):
+            continue
+        changed_rows += 1
+        for column in sorted(old.keys() | new.keys()):
+            before, after = old.get(column), new.get(column)
+            if _same(before, after):
+                continue
+            changed_cells += 1
+            formula = _is_formula(before) or _is_formula(after)
+            formula_changes += formula
+            if len(changes) < max_changes:
+                change = {"sheet": sheet, "cell": f"{get_column_letter(column)}{row}", "old": before, "new": after}
+                if formula:
+                    change["formula"] = True
+                changes.append(change)
+    return {"changed_rows": changed_rows, "changed_cells": changed_cells, "formula_changes": formula_changes}
+
+def diff_workbooks(old_filename: str, new_filename: str, sheets: Optional[List[str]] = None,
+                   max_changes: Optional[int] = None) -> Dict[str, Any]:
+    """Cell-level differences between two workbooks, sheet by sheet.
+
+    Sheets are matched by name. Both files are streamed in row order and
+    merged by row number; whole rows are compared first and only rows that
+    differ are inspected cell by cell, so memory stays bounded by the row
+    width (plus each file's shared-string table) regardless of file size.
+    Only cell values and formulas are compared, not formatting.
+    """
+    started = time.perf_counter()
+    for filename in (old_filename, new_filename):
+        if not os.path.exists(filename):
+            raise FileNotFoundError(f"{filename} does not exist.")
+        # Reads come from disk, so unsaved cached edits must be written first.
+        workbook_cache.flush(filename)
+    max_changes = DIFF_MAX_CHANGES if max_changes is None else max(0, max_changes)
+    old_sheets, new_sheets = read_sheet_names(old_filename), read_sheet_names(new_filename)
+    common = [name for name in new_sheets if name in old_sheets]
+    if sheets:
+        missing = [name for name in sheets if name not in common]
+        if missing:
+            raise KeyError(f"Worksheets {missing} are not in both workbooks.")
+        common = [name for name in common if name in sheets]
+    changes: List[Dict[str, Any]] = []
+    summary: Dict[str, Dict[str, int]] = {}
+    for sheet in common:
+        counts = _diff_sheet(old_filename, new_filename, sheet, changes, max_changes)
+        if counts["changed_cells"]:
+            summary[sheet] = counts
+    total = sum(counts["changed_cells"] for counts in summary.values())
+    added = [name for name in new_sheets if name not in old_sheets]
+    removed = [name for name in old_sheets if name not in new_sheets]
+    return {
+        "identical": not (total or added or removed),
+        "sheets_added": added,
+        "sheets_removed": removed,
+        "sheets_changed": summary,
+        "changed_cells": total,
+        "changes": changes,
+        "truncated": total > len(changes),
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
@@ -0,0 +1,398 @@
+import os
+import re
+import zipfile
+import shutil
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+from xml.sax.saxutils import escape
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.xml.functions import fromstring, tostring
+from openpyxl.utils.cell import column_index_from_string, coordinate_to_tuple, get_column_letter, range_boundaries
+from atomic_save import write_file_atomic
+from formatting import merged_font
+from excel_reader import open_xlsx, sheet_part, styles_part, workbook_part
+
+# Cell edits applied to the xlsx parts directly: only the worksheet parts that
+# change are rewritten (as bytes, by locating rows and cells), every other zip
+# member is streamed through unchanged. Strings are written inline so the
+# shared-string table is never touched. Anything this writer does not handle
+# raises PatchUnsupported before a byte is written, and the caller falls back
+# to openpyxl.
+
+# ---------- CONFIGURATION ----------
+
+# Writes of at most this many cells to a workbook that is not loaded are
+# patched into the file instead of loading and re-saving it (0 disables).
+PATCH_MAX_CELLS = int(os.getenv("EXCEL_PATCH_MAX_CELLS", "256"))
+
+
+class PatchUnsupported(Exception):
+    """The edit needs the full openpyxl load/save path."""
+
+
+_SHEET_DATA = re.compile(rb"<sheetData\s*(/?)>")
+_ROW = re.compile(rb"<row\b([^>]*?)(/?)>")
+_CELL = re.compile(rb"<c\b([^>]*?)(?:/>|>(.*?)</c>)", re.S)
+_ATTR = re.compile(rb'\s([\w:]+)="([^"]*)"')
+_SPANS = re.compile(rb'\sspans="[^"]*"')
+_DIMENSION = re.compile(rb'<dimension\s+ref="([^"]*)"\s*/>')
+_CALC_PR = re.compile(rb"<calcPr\b([^>]*?)/>")
+_CELL_REF = re.compile(rb"([A-Z]+)(\d+)$")
+_UNSAFE_FORMULA = re.compile(rb'<f\b[^>]*\b(?:ref=|t="array")')
+_CELL_START = re.compile(rb"<c[\s/>]")
+
+_MAX_STRING = 32767  # Excel's limit for the text of one cell
+_CALC_CHAIN = "xl/calcChain.xml"
+_COPY_CHUNK = 1 << 20
+
+
+def _attrs(raw: bytes) -> Dict[bytes, bytes]:
+    return dict(_ATTR.findall(b" " + raw))
+
+def _children(pattern, content: bytes, what: str, tail: bytes = b"") -> list:
+    """The ``pattern`` matches making up ``content``, which may hold nothing else but
+    whitespace and a trailing ``tail`` element; anything unrecognized is refused."""
+    matches, pos = [], 0
+    for match in pattern.finditer(content):
+        if content[pos:match.start()].strip():
+            raise PatchUnsupported(f"unexpected XML between {what} elements")
+        matches.append(match)
+        pos = match.end()
+    rest = content[pos:].strip()
+    if rest and not (tail and rest.startswith(tail)):
+        raise PatchUnsupported(f"unexpected XML after the {what} elements")
+    return matches
+
+
+# ---------- CELL XML ----------
+
+def _cell_xml(ref: bytes, value: Any, style: Optional[bytes]) -> Tuple[bytes, bool]:
+    """The <c> element for ``value`` (keeping the cell's style) and whether it holds a formula."""
+    s = b' s="%s"' % style if style and style != b"0" else b""
+    if value is None:
+        return b'<c r="%s"%s/>' % (ref, s), False
+    if isinstance(value, bool):
+        return b'<c r="%s"%s t="b"><v>%d</v></c>' % (ref, s, value), False
+    if isinstance(value, int):
+        return b'<c r="%s"%s><v>%d</v></c>' % (ref, s, value), False
+    if isinstance(value, float):
+        if value != value or value in (float("inf"), float("-inf")):
+            raise PatchUnsupported("NaN and infinity cannot be stored")
+        return b'<c r="%s"%s><v>%s</v></c>' % (ref, s, repr(value).encode()), False
+    if not isinstance(value, str):
+        raise PatchUnsupported(f"{type(value).__name__} values need the openpyxl writer")
+    if ILLEGAL_CHARACTERS_RE.search(value) or len(value) > _MAX_STRING:
+        raise PatchUnsupported("string cannot be stored in a cell")
+    text = escape(value).encode("utf-8")
+    if len(value) > 1 and value.startswith("="):
+        return b'<c r="%s"%s><f>%s</f></c>' % (ref, s, text[1:]), True
+    space = b' xml:space="preserve"' if value != value.strip() else b""
+    return b'<c r="%s"%s t="inlineStr"><is><t%s>%s</t></is></c>' % (ref, s, space, text), False
+
+
+# ---------- SHEET PART ----------
+
+class _SheetPatch:
+    def __init__(self, cells: Dict[Tuple[int, int], Any], restyle: Optional[Callable[[Optional[bytes]], bytes]] = None):
+        self.rows: Dict[int, Dict[int, Any]] = {}
+        for (row, col), value in cells.items():
+            self.rows.setdefault(row, {})[col] = value
+        self.restyle = restyle
+        self.formulas = False
+
+    def _creates(self, value: Any) -> bool:
+        # A missing cell is only added for a value, or to carry a new style.
+        return value is not None or self.restyle is not None
+
+    def _new_cell(self, row: int, col: int, value: Any, style: Optional[bytes] = None) -> bytes:
+        if self.restyle is not None:
+            style = self.restyle(style)
+        xml, formula = _cell_xml(f"{get_column_letter(col)}{row}".encode(), value, style)
+        self.formulas |= formula
+        return xml
+
+    def _new_row(self, row: int) -> bytes:
+        cells = b"".join(self._new_cell(row, col, value) for col, value in sorted(self.rows[row].items())
+                         if self._creates(value))
+        return b'<row r="%d">%s</row>' % (row, cells) if cells else b""
+
+    def _patch_row(self, row: int, tag_attrs: bytes, content: bytes) -> bytes:
+        pending = sorted(self.rows[row].items())
+        out, pos, last_end, i, previous = [], 0, 0, 0, 0
+        for match in _children(_CELL, content, "cell", b"<extLst"):
+            attrs = _attrs(match.group(1))
+            ref = _CELL_REF.match(attrs.get(b"r", b""))
+            if ref is None or _CELL_START.search(match.group(2) or b""):
+                raise PatchUnsupported("cell without a reference")
+            col = column_index_from_string(ref.group(1).decode())
+            if col <= previous or ref.group(2) != b"%d" % row:
+                raise PatchUnsupported("cells out of order")
+            previous = col
+            while i < len(pending) and pending[i][0] < col:
+                if self._creates(pending[i][1]):
+                    out += [content[pos:match.start()], self._new_cell(row, *pending[i])]
+                    pos = match.start()
+                i += 1
+            if i < len(pending) and pending[i][0] == col:
+                inner = match.group(2) or b""
+                if b"cm" in attrs or b"vm" in attrs or _UNSAFE_FORMULA.search(inner):
+                    raise PatchUnsupported("cell anchors a shared or array formula")
+                self.formulas |= b"<f" in inner  # an overwritten formula leaves the calc chain stale
+                out += [content[pos:match.start()], self._new_cell(row, pending[i][0], pending[i][1], attrs.get(b"s"))]
+                pos = match.end()
+                i += 1
+            last_end = match.end()
+        # cells after the last existing one go before any trailing <extLst>
+        out.append(content[pos:last_end])
+        out += [self._new_cell(row, col, value) for col, value in pending[i:] if self._creates(value)]
+        out.append(content[max(pos, last_end):])
+        return b"<row%s>%s</row>" % (_SPANS.sub(b"", tag_attrs), b"".join(out))
+
+    def apply(self, xml: bytes) -> bytes:
+        match = _SHEET_DATA.search(xml)
+        if match is None:
+            raise PatchUnsupported("worksheet without an unprefixed sheetData element")
+        pending = sorted(self.rows)
+        if match.group(1):  # <sheetData/>
+            body = b"".join(self._new_row(row) for row in pending)
+            xml = xml[:match.start()] + b"<sheetData>" + body + b"</sheetData>" + xml[match.end():]
+            return self._update_dimension(xml)
+        start = match.end()
+        end = xml.find(b"</sheetData>", start)
+        if end < 0:
+            raise PatchUnsupported("unterminated sheetData")
+        out, pos, i, previous = [xml[:start]], start, 0, 0
+        for row_match in _ROW.finditer(xml, start, end):
+            number = _attrs(row_match.group(1)).get(b"r")
+            if number is None or not number.isdigit() or int(number) <= previous:
+                raise PatchUnsupported("rows without ascending numbers")
+            number = previous = int(number)
+            while i < len(pending) and pending[i] < number:
+                out += [xml[pos:row_match.start()], self._new_row(pending[i])]
+                pos = row_match.start()
+                i += 1
+            if i < len(pending) and pending[i] == number:
+                if row_match.group(2):
+                    row_end, content = row_match.end(), b""
+                else:
+                    close = xml.find(b"</row>", row_match.end(), end)
+                    if close < 0 or _ROW.search(xml, row_match.end(), close):
+                        raise PatchUnsupported("unterminated row")
+                    row_end, content = close + len(b"</row>"), xml[row_match.end():close]
+                out += [xml[pos:row_match.start()], self._patch_row(number, row_match.group(1), content)]
+                pos = row_end
+                i += 1
+            if i == len(pending):
+                break
+        out.append(xml[pos:end])
+        out += [self._new_row(row) for row in pending[i:]]
+        out.append(xml[end:])
+        return self._update_dimension(b"".join(out))
+
+    def _update_dimension(self, xml: bytes) -> bytes:
+        # <dimension> precedes <sheetData>; nothing after it is searched
+        match = _DIMENSION.search(xml, 0, _SHEET_DATA.search(xml).start())
+        if match is None:
+            return xml
+        ref = match.group(1).decode()
+        try:
+            min_col, min_row, max_col, max_row = range_boundaries(ref if ":" in ref else f"{ref}:{ref}")
+        except (TypeError, ValueError):
+            return xml
+        written = [(row, col) for row, cols in self.rows.items() for col, value in cols.items() if self._creates(value)]
+        if not written:
+            return xml
+        min_row = min([min_row] + [r for r, _ in written])
+        max_row = max([max_row] + [r for r, _ in written])
+        min_col = min([min_col] + [c for _, c in written])
+        max_col = max([max_col] + [c for _, c in written])
+        new_ref = f"{get_column_letter(min_col)}{min_row}:{get_column_letter(max_col)}{max_row}"
+        return xml[:match.start()] + b'<dimension ref="%s"/>' % new_ref.encode() + xml[match.end():]
+
+
+# ---------- STYLESHEET ----------
+
+_STYLESHEET = re.compile(rb"<styleSheet\b")
+_COUNT = re.compile(rb'\scount="\d*"')
+_ALIGNMENT = re.compile(rb"<alignment\b[^>]*?(?:/>|>.*?</alignment>)", re.S)
+
+
+def _element(name: bytes):
+    return re.compile(rb"<%s\b([^>]*?)(?:/>|>(.*?)</%s>)" % (name, name), re.S)
+
+# list element -> (pattern for the list, pattern for one entry)
+_LISTS = {name: (_element(name), _element(item))
+          for name, item in ((b"fonts", b"font"), (b"fills", b"fill"), (b"cellXfs", b"xf"))}
+
+
+class _StylesPatch:
+    """Cell formats (font, fill, alignment) added to styles.xml for restyled cells.
+
+    As with ``formatting.style_ids``, only the attributes in the style key
+    change: bold, italic and font_color are merged into the cell's font, and
+    everything else the key leaves out (including the number format, border
+    and protection) is kept. Entries are appended once and reused, and
+    existing indices never move, so other cells are unaffected.
+    """
+
+    def __init__(self, xml: bytes, key: tuple):
+        if _STYLESHEET.search(xml) is None:
+            raise PatchUnsupported("stylesheet with a prefixed namespace")
+        self.spec = dict(key)
+        if self.spec.get("border") or self.spec.get("number_format"):
+            raise PatchUnsupported("borders and number formats need the openpyxl writer")
+        self.xml = xml
+        self.changes_font = any(name in self.spec for name in ("bold", "italic", "font_color"))
+        self.fill = None
+        if self.spec.get("bg_color"):
+            color = self.spec["bg_color"]
+            self.fill = tostring(PatternFill(start_color=color, end_color=color, fill_type="solid").to_tree())
+        self.alignment = None
+        if "align" in self.spec:
+            self.alignment = tostring(Alignment(horizontal=self.spec["align"]).to_tree())
+        self.changed = False
+        self._restyled: Dict[bytes, bytes] = {}
+        self._fonts: Dict[bytes, int] = {}  # current fontId -> merged font's index
+        self._fill_id: Optional[int] = None
+
+    def _list(self, section: bytes):
+        match = _LISTS[section][0].search(self.xml)
+        if match is None or match.group(2) is None:
+            raise PatchUnsupported(f"stylesheet without {section.decode()}")
+        return match, _children(_LISTS[section][1], match.group(2), section.decode())
+
+    def _intern(self, section: bytes, entry: bytes) -> int:
+        """Index of ``entry`` in the ``section`` list, appending it if absent."""
+        match, items = self._list(section)
+        entries = [item.group(0) for item in items]
+        if entry in entries:
+            return entries.index(entry)
+        head = _COUNT.sub(b"", match.group(1)).rstrip()
+        replaced = b'<%s count="%d"%s>%s%s</%s>' % (section, len(entries) + 1, head, match.group(2), entry, section)
+        self.xml = self.xml[:match.start()] + replaced + self.xml[match.end():]
+        self.changed = True
+        return len(entries)
+
+    def restyle(self, style: Optional[bytes]) -> bytes:
+        """The cellXfs index for a cell currently at ``style`` with the new formatting."""
+        style = style or b"0"
+        new = self._restyled.get(style)
+        if new is not None:
+            return new
+        xfs = self._list(b"cellXfs")[1]
+        index = int(style)
+        if index >= len(xfs):
+            raise PatchUnsupported("cell style out of range")
+        attrs = _attrs(xfs[index].group(1))
+        if self.changes_font:
+            attrs[b"fontId"], attrs[b"applyFont"] = b"%d" % self._font(attrs.get(b"fontId", b"0")), b"1"
+        if self.fill is not None:
+            if self._fill_id is None:
+                self._fill_id = self._intern(b"fills", self.fill)
+            attrs[b"fillId"], attrs[b"applyFill"] = b"%d" % self._fill_id, b"1"
+        inner = xfs[index].group(2) or b""
+        if self.alignment is not None:
+            attrs[b"applyAlignment"] = b"1"
+            # alignment is the first child of <xf>, ahead of protection and extLst
+            inner = self.alignment + _ALIGNMENT.sub(b"", inner)
+        xf = b"<xf%s>%s</xf>" % (b"".join(b' %s="%s"' % item for item in attrs.items()), inner)
+        new = self._restyled[style] = str(self._intern(b"cellXfs", xf)).encode()
+        return new
+
+    def _font(self, font_id: bytes) -> int:
+        """Index of font ``font_id`` with the key's font attributes merged in."""
+        new = self._fonts.get(font_id)
+        if new is None:
+            fonts = self._list(b"fonts")[1]
+            if not font_id.isdigit() or int(font_id) >= len(fonts):
+                raise PatchUnsupported("font out of range")
+            try:
+                font = Font.from_tree(fromstring(fonts[int(font_id)].group(0)))
+            except (SyntaxError, TypeError, ValueError):
+                raise PatchUnsupported("font the patcher cannot parse")
+            new = self._fonts[font_id] = self._intern(b"fonts", tostring(merged_font(font, self.spec).to_tree()))
+        return new
+
+
+# ---------- WORKBOOK PARTS ----------
+
+def _without_calc_chain(archive: zipfile.ZipFile, replacements: Dict[str, Optional[bytes]]):
+    """Drop calcChain.xml (Excel rebuilds it) and its references, as it may list overwritten formulas."""
+    if _CALC_CHAIN not in archive.NameToInfo:
+        return
+    replacements[_CALC_CHAIN] = None
+    types = archive.read("[Content_Types].xml")
+    replacements["[Content_Types].xml"] = re.sub(rb'<Override\b[^>]*PartName="/xl/calcChain\.xml"[^>]*/>', b"", types)
+    rels_part = "xl/_rels/workbook.xml.rels"
+    if rels_part in archive.NameToInfo:
+        rels = archive.read(rels_part)
+        replacements[rels_part] = re.sub(rb'<Relationship\b[^>]*Target="[^"]*calcChain\.xml"[^>]*/>', b"", rels)
+
+def _with_full_calc_on_load(archive: zipfile.ZipFile, replacements: Dict[str, Optional[bytes]]):
+    """Make Excel recalculate on open, since written formulas carry no cached value."""
+    part = workbook_part(archive)
+    xml = archive.read(part)
+    match = _CALC_PR.search(xml)
+    if match is None:
+        raise PatchUnsupported("workbook without calcPr")
+    attrs = re.sub(rb'\sfullCalcOnLoad="[^"]*"', b"", match.group(1)).rstrip()
+    replacements[part] = xml[:match.start()] + b'<calcPr%s fullCalcOnLoad="1"/>' % attrs + xml[match.end():]
+
+def _write_zip(archive: zipfile.ZipFile, target, replacements: Dict[str, Optional[bytes]]):
+    """Write ``archive`` to ``target`` with ``replacements`` (None deletes a member).
+
+    Unchanged members are streamed through with their original name, date,
+    attributes and compression method.
+    """
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as out:
+        for info in archive.infolist():
+            new_info = zipfile.ZipInfo(info.filename, info.date_time)
+            new_info.external_attr = info.external_attr
+            if info.filename in replacements:
+                data = replacements[info.filename]
+                if data is not None:
+                    new_info.compress_type = zipfile.ZIP_DEFLATED
+                    out.writestr(new_info, data)
+                continue
+            new_info.compress_type = info.compress_type
+            new_info.file_size = info.file_size  # lets zipfile pick zip64 for large members
+            with archive.open(info) as src, out.open(new_info, "w") as dst:
+                shutil.copyfileobj(src, dst, _COPY_CHUNK)
+
+
+# ---------- PUBLIC API ----------
+
+def patch_cells(src: str, dst: str, edits: Sequence[Tuple[str, str, Any]], style: Optional[tuple] = None) -> int:
+    """Write ``src`` to ``dst`` (which may be the same file) with ``(sheet, cell, value)`` edits applied.
+
+    Values are numbers, booleans, strings, "=..." formulas or None (clears
+    the value, keeps the style). Cell styles are kept, unless ``style`` (a
+    ``formatting.style_key``) gives the edited cells a new font, fill and
+    alignment. Returns the number of cells written; raises PatchUnsupported,
+    leaving ``dst`` untouched, for anything else (dates, shared/array
+    formula anchors, unusual XML).
+    """
+    by_sheet: Dict[str, Dict[Tuple[int, int], Any]] = {}
+    for sheet, cell, value in edits:
+        by_sheet.setdefault(sheet, {})[coordinate_to_tuple(cell)] = value
+    with open_xlsx(src) as archive:
+        replacements: Dict[str, Optional[bytes]] = {}
+        styles = None
+        if style is not None:
+            part = styles_part(archive)
+            if part is None:
+                raise PatchUnsupported("workbook without a stylesheet")
+            styles = _StylesPatch(archive.read(part), style)
+        formulas = False
+        for sheet, cells in by_sheet.items():
+            part = sheet_part(archive, sheet)
+            patch = _SheetPatch(cells, styles.restyle if styles is not None else None)
+            replacements[part] = patch.apply(archive.read(part))
+            formulas |= patch.formulas
+        if styles is not None and styles.changed:
+            replacements[styles_part(archive)] = styles.xml
+        if formulas:
+            _with_full_calc_on_load(archive, replacements)
+            _without_calc_chain(archive, replacements)
+        write_file_atomic(dst, lambda f: _write_zip(archive, f, replacements))
+    return sum(len(cells) for cells in by_sheet.values())